@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import defaultdict
+
+from logger import logger
+from GmailAutomation.auth import gmail_services
+from GmailAutomation.metrics import metrics
+from GmailAutomation.quota import gmail_quota
+
+# ------------------------------------------------------------
+# Coalesced label updates
+# ------------------------------------------------------------
+BATCH_MODIFY_LIMIT = 1000  # max message ids per users.messages.batchModify call
+LABEL_FLUSH_THRESHOLD = int(os.getenv("LABEL_FLUSH_THRESHOLD", 500))  # pending messages that trigger a flush
+LABEL_RETRIES = 3  # retries per batchModify call (429/5xx, exponential backoff)
+LABEL_MAX_FLUSH_ATTEMPTS = 5  # flushes a failing change is kept for before it is dropped
+AUTO_REPLIED_LABEL = os.getenv("AUTO_REPLIED_LABEL", "auto-replied")
+ESCALATED_LABEL = os.getenv("ESCALATED_LABEL", "escalated")
+LABEL_MODIFY = metrics.stage("label_modify")  # one batchModify call
+
+
+class LabelUpdater:
+    """
+    Collects label changes during a cycle and applies them with
+    users.messages.batchModify: one call per distinct change, up to 1000
+    messages each, instead of one messages.modify per message.
+
+    Changes are flushed at the end of a cycle or once `flush_threshold`
+    messages are pending. A change whose call still fails after the client
+    retries stays pending and is retried on the next flush.
+    Custom labels (e.g. "auto-replied") are created on first use.
+    """
+
+    def __init__(self, service=None, flush_threshold: int = LABEL_FLUSH_THRESHOLD):
+        self.service = service
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(set)  # (add label names, remove label names) -> message ids
+        self._attempts = defaultdict(int)  # change -> failed flushes so far
+        self._label_ids = None  # label name -> id
+
+        self.queued = 0
+        self.applied = 0
+        self.batch_calls = 0
+        self.failed_calls = 0
+        self.dropped = 0
+
+    # ---------------- public API ----------------
+    def mark(self, message_id: str, add=(), remove=()):
+        """Queue a label change for one message."""
+        change = (tuple(sorted(add)), tuple(sorted(remove)))
+        with self._lock:
+            self._pending[change].add(message_id)
+            self.queued += 1
+            pending = sum(len(ids) for ids in self._pending.values())
+        if pending >= self.flush_threshold:
+            self.flush()
+
+    def mark_replied(self, message_id: str):
+        """Mark read and add the "auto-replied" label."""
+        self.mark(message_id, add=[AUTO_REPLIED_LABEL], remove=["UNREAD"])
+
+    def mark_escalated(self, message_id: str):
+        """Add the "escalated" label; the message stays unread so it stands out for the team."""
+        self.mark(message_id, add=[ESCALATED_LABEL])
+
+    def flush(self, service=None) -> int:
+        """Apply every pending change. Returns the number of messages updated."""
+        service = service or self.service or gmail_services.get()
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(set)
+            updated = 0
+            for change, ids in pending.items():
+                add, remove = change
+                ids = sorted(ids)
+                try:
+                    body = {"addLabelIds": self._resolve(service, add), "removeLabelIds": self._resolve(service, remove)}
+                except Exception as e:
+                    logger.error(f"⚠️ Could not resolve labels {add}: {e}")
+                    self._retry_later(change, ids)
+                    continue
+                failed = []
+                for start in range(0, len(ids), BATCH_MODIFY_LIMIT):
+                    chunk = ids[start:start + BATCH_MODIFY_LIMIT]
+                    try:
+                        gmail_quota.charge("users.messages.batchModify")
+                        with LABEL_MODIFY.time():
+                            service.users().messages().batchModify(
+                                userId="me", body={"ids": chunk, **body}
+                            ).execute(num_retries=LABEL_RETRIES)
+                    except Exception as e:
+                        self.failed_calls += 1
+                        logger.error(f"⚠️ batchModify failed for {len(chunk)} message(s) ({change}): {e}")
+                        failed += chunk
+                        continue
+                    self.batch_calls += 1
+                    self.applied += len(chunk)
+                    updated += len(chunk)
+                if failed:
+                    self._retry_later(change, failed)
+                else:
+                    self._attempts.pop(change, None)
+            if updated:
+                logger.info(f"🏷 Updated labels of {updated} message(s)")
+            return updated
+
+    # ---------------- internals ----------------
+    def _retry_later(self, change, ids):
+        self._attempts[change] += 1
+        if self._attempts[change] >= LABEL_MAX_FLUSH_ATTEMPTS:
+            self.dropped += len(ids)
+            self._attempts.pop(change)
+            logger.error(f"❌ Giving up on label change {change} for {len(ids)} message(s)")
+            return
+        with self._lock:
+            self._pending[change].update(ids)
+
+    def _resolve(self, service, names) -> list:
+        """Map label names to ids; system labels (UNREAD, INBOX, ...) are their own ids."""
+        ids = []
+        for name in names:
+            if name.isupper():
+                ids.append(name)
+                continue
+            if self._label_ids is None:
+                gmail_quota.charge("users.labels.list")
+                labels = service.users().labels().list(userId="me").execute().get("labels", [])
+                self._label_ids = {label["name"]: label["id"] for label in labels}
+            if name not in self._label_ids:
+                gmail_quota.charge("users.labels.create")
+                label = service.users().labels().create(
+                    userId="me",
+                    body={"name": name, "labelListVisibility": "labelShow", "messageListVisibility": "show"},
+                ).execute()
+                self._label_ids[name] = label["id"]
+                logger.info(f"🏷 Created Gmail label '{name}'")
+            ids.append(self._label_ids[name])
+        return ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(len(ids) for ids in self._pending.values())
+        return {
+            "pending": pending,
+            "queued": self.queued,
+            "applied": self.applied,
+            "batch_calls": self.batch_calls,
+            "modify_calls_saved": self.applied - self.batch_calls,
+            "failed_calls": self.failed_calls,
+            "dropped": self.dropped,
+        }
+
+
+# Shared accumulator used by the main loop
+label_updater = LabelUpdater()
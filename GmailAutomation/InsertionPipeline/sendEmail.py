@@ -1,16 +1,60 @@
 import base64
+import threading
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import Any, Dict
 from googleapiclient.discovery import Resource
-from GmailAutomation.auth import get_gmail_service
+from GmailAutomation.auth import gmail_services
+from GmailAutomation.metrics import metrics
+from GmailAutomation.quota import gmail_quota
 from logger import logger
 
 DEFAULT_USER_ID = "me"
 EMAIL_PREVIEW_LENGTH = 500  # Number of characters to show in preview
+REPLY_HEADERS = ["Subject", "From", "Message-ID", "References"]
+SEND = metrics.stage("send")  # messages.send (replies and direct emails)
 
-# Initialize Gmail service
-service: Resource = get_gmail_service()
+# Sender identity, looked up once per process
+_sender_address = None
+_sender_lock = threading.Lock()
+
+
+def get_sender_address(service: Resource, user_id: str = DEFAULT_USER_ID) -> str:
+    """Return the authenticated mailbox address, calling getProfile only the first time."""
+    global _sender_address
+    with _sender_lock:
+        if _sender_address is None:
+            gmail_quota.charge("users.getProfile")
+            _sender_address = service.users().getProfile(userId=user_id).execute().get("emailAddress")
+        return _sender_address
+
+
+def remember_sender_address(address: str):
+    """Seed the sender cache with an address already known (e.g. from the fetch loop's getProfile)."""
+    global _sender_address
+    if address:
+        _sender_address = address
+
+
+def reply_headers_from_message(message: dict) -> dict:
+    """Pick the fields a reply needs from a Gmail message (metadata or full format)."""
+    headers = {h["name"].lower(): h["value"] for h in message.get("payload", {}).get("headers", [])}
+    return {
+        "threadId": message.get("threadId"),
+        "subject": headers.get("subject", ""),
+        "from_header": headers.get("from", ""),
+        "message_id_header": headers.get("message-id"),
+        "references": headers.get("references"),
+    }
+
+
+def fetch_reply_headers(service: Resource, user_id: str, message_id: str) -> dict:
+    """Fetch only the headers a reply needs (format=metadata: no body, no attachments)."""
+    gmail_quota.charge("users.messages.get")
+    original = service.users().messages().get(
+        userId=user_id, id=message_id, format="metadata", metadataHeaders=REPLY_HEADERS
+    ).execute()
+    return reply_headers_from_message(original)
 
 def create_mime_message(sender: str, to: str, subject: str, body: str) -> Dict[str, Any]:
     """Create a MIME message for sending via Gmail API"""
@@ -23,34 +67,42 @@ def create_mime_message(sender: str, to: str, subject: str, body: str) -> Dict[s
     raw_message = base64.urlsafe_b64encode(msg.as_bytes()).decode()
     return {"raw": raw_message}
 
-def create_reply_message(service: Resource, user_id: str, message_id: str, body: str) -> Dict[str, Any]:
-    """Create a reply to an existing email"""
-    original = service.users().messages().get(userId=user_id, id=message_id, format="full").execute()
-    thread_id = original["threadId"]
-
-    headers = original["payload"]["headers"]
-    subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "")
-    sender_email = next((h["value"] for h in headers if h["name"].lower() == "from"), "")
-    msg_id_header = next((h["value"] for h in headers if h["name"].lower() == "message-id"), None)
+def create_reply_message(
+    service: Resource, user_id: str, message_id: str, body: str, original: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """
+    Create a reply to an existing email.
+    `original` holds the headers already parsed by the fetch loop (threadId,
+    subject, from_header, message_id_header, references); without it they
+    are fetched with a metadata-only lookup.
+    """
+    if not original or not original.get("threadId"):
+        original = fetch_reply_headers(service, user_id, message_id)
 
+    subject = original.get("subject") or ""
+    msg_id_header = original.get("message_id_header")
     reply_subject = subject if subject.lower().startswith("re:") else f"Re: {subject}"
 
     message = MIMEText(body, "plain")
-    message["to"] = sender_email
-    message["from"] = service.users().getProfile(userId=user_id).execute().get("emailAddress")
+    message["to"] = original.get("from_header") or ""
+    message["from"] = get_sender_address(service, user_id)
     message["subject"] = reply_subject
     if msg_id_header:
         message["In-Reply-To"] = msg_id_header
-        message["References"] = msg_id_header
+        references = original.get("references")
+        message["References"] = f"{references} {msg_id_header}" if references else msg_id_header
 
     raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    return {"raw": raw_message, "threadId": thread_id}
+    return {"raw": raw_message, "threadId": original["threadId"]}
 
 def send_email(to: str, subject: str, body: str) -> str:
     """Send a direct email"""
-    sender = service.users().getProfile(userId=DEFAULT_USER_ID).execute().get("emailAddress")
+    service = gmail_services.get()  # this thread's client
+    sender = get_sender_address(service)
     message = create_mime_message(sender, to, subject, body)
-    sent = service.users().messages().send(userId=DEFAULT_USER_ID, body=message).execute()
+    gmail_quota.charge("users.messages.send")
+    with SEND.time():
+        sent = service.users().messages().send(userId=DEFAULT_USER_ID, body=message).execute()
 
     return f"""
 Message ID: {sent.get("id")}
@@ -59,10 +111,13 @@ Subject: {subject}
 Body: {body[:EMAIL_PREVIEW_LENGTH]}{"..." if len(body) > EMAIL_PREVIEW_LENGTH else ""}
 """
 
-def send_reply(message_id: str, body: str) -> str:
-    """Send a reply to an existing message"""
-    reply_msg = create_reply_message(service, DEFAULT_USER_ID, message_id, body)
-    sent = service.users().messages().send(userId=DEFAULT_USER_ID, body=reply_msg).execute()
+def send_reply(message_id: str, body: str, original: Dict[str, Any] = None) -> str:
+    """Send a reply to an existing message (pass `original` headers to skip the lookup)"""
+    service = gmail_services.get()  # this thread's client
+    reply_msg = create_reply_message(service, DEFAULT_USER_ID, message_id, body, original)
+    gmail_quota.charge("users.messages.send")
+    with SEND.time():
+        sent = service.users().messages().send(userId=DEFAULT_USER_ID, body=reply_msg).execute()
 
     return f"""
 Message ID: {message_id}
@@ -70,6 +125,17 @@ Thread ID: {sent.get("id")}
 Body: {body[:EMAIL_PREVIEW_LENGTH]}{"..." if len(body) > EMAIL_PREVIEW_LENGTH else ""}
 """
 
+def reply_in_thread(service: Resource, thread_id: str, since: float) -> bool:
+    """True if the thread holds a message we sent at or after `since` (unix seconds), i.e. a reply went out."""
+    if not thread_id:
+        return False
+    gmail_quota.charge("users.threads.get")
+    thread = service.users().threads().get(userId=DEFAULT_USER_ID, id=thread_id, format="minimal").execute()
+    return any(
+        "SENT" in message.get("labelIds", []) and int(message.get("internalDate", 0)) / 1000 >= since
+        for message in thread.get("messages", [])
+    )
+
 def handle_escalation(subject: str, reason: str) -> str:
     """Generate escalation email body"""
     escalation_body = f"""
@@ -86,6 +152,7 @@ def mark_message_as_read(service, user_id: str, message_id: str):
     Remove the UNREAD label from a message.
     """
     try:
+        gmail_quota.charge("users.messages.modify")
         service.users().messages().modify(
             userId=user_id,
             id=message_id,
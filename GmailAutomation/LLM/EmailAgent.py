@@ -1,48 +1,94 @@
-from GmailAutomation.db import fetch_personality_settings, fetch_client_and_project_data
-from openai import AsyncOpenAI
-from agents import Agent, OpenAIChatCompletionsModel, RunConfig, Runner
-from dotenv import load_dotenv
+from GmailAutomation.db import (
+    fetch_client_and_project_data,
+    fetch_personality_settings,
+    get_client_and_project_data,
+    get_personality_settings,
+)
+import GmailAutomation.LLM.fast_path  # noqa: F401 (registers app.fast_path)
+from GmailAutomation.LLM.response_cache import response_cache
+from GmailAutomation.LLM.response_parser import (
+    ResponseParseError,
+    fallback_response,
+    parse_agent_response,
+    parse_stats,
+    reask_prompt,
+)
+from GmailAutomation.app_context import app
+from GmailAutomation.metrics import metrics
+from logger import logger
+from email.utils import parseaddr
 
+import asyncio
 import os
-import ast
-import re
-
-load_dotenv()
+import threading
+import time
 
 # ----------------------------
 # Setup OpenAI client
+# openai/agents are imported, and the clients built, on first use through `app`
 # ----------------------------
-external_client = AsyncOpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url=os.getenv("BASE_URL")
-)
+def create_openai_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        base_url=os.getenv("BASE_URL")
+    )
 
-model = OpenAIChatCompletionsModel(
-    model=os.getenv("MODEL_NAME"),
-    openai_client=external_client
-)
 
-config = RunConfig(
-    model=model,
-    model_provider=external_client,  # type: ignore
-    tracing_disabled=True
-)
+def create_model():
+    from agents import OpenAIChatCompletionsModel
+    return OpenAIChatCompletionsModel(
+        model=os.getenv("MODEL_NAME"),
+        openai_client=app.openai_client
+    )
+
+
+def create_run_config():
+    from agents import RunConfig
+    return RunConfig(
+        model=app.model,
+        model_provider=app.openai_client,  # type: ignore
+        tracing_disabled=True
+    )
+
+
+def create_runner():
+    from agents import Runner
+    return Runner
+
+
+app.register("openai_client", create_openai_client)
+app.register("model", create_model)
+app.register("run_config", create_run_config)
+app.register("runner", create_runner)
 
 # ----------------------------
 # Gmail Agent definition
 # ----------------------------
-gmail_agent = Agent(
-    name="Gmail Agent",
-    instructions="""
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "tools")  # "tools" or "preresolved"
+
+INTRO = """
 You are an escalation triage assistant.
 You analyze client queries and output solution in strict JSON.
+"""
 
+TOOL_WORKFLOW = """
 ## Workflow
 # 1. ALWAYS call 'fetch_personality_settings' tool first and use it to shape your response accordingly.
 # 2. If the "body" explicitly refers to project/client details or requires project context, optionally call 'fetch_project_and_client' tool. Otherwise, skip.
 # 3. After required tool calls, analyze the mail and produce final response in strict JSON. No markdown style at this stage email is getting process only if there's no attachment.
 # 4. If the email has attachments, proceeses if it in the processable formate otherwise tell user that can you please provide some attachment related details. 
+"""
 
+PRERESOLVED_WORKFLOW = """
+## Workflow
+# 1. "personality_settings" in the input holds the client's personality settings; ALWAYS use it to shape your response accordingly.
+# 2. "client_context" holds the client's details and projects; use it only if the "body" refers to project/client details or requires project context.
+# 3. There are no tools: analyze the mail and produce the final response in strict JSON right away. No markdown style.
+# 4. If the email has attachments, proceeses if it in the processable formate otherwise tell user that can you please provide some attachment related details. 
+"""
+
+RULES = """
 ## Escalation Rules
 Escalation is required if the query indicates:
 - Negative sentiment
@@ -69,21 +115,22 @@ Escalation is required if the query indicates:
 - Only make reply_to = False when the email content is no need to reference from previous emails and genrated response is also don't refrening the user email content.
 
 ## JSON output fields
-for 'boolean' fields use True/False (not true/false)
+for 'boolean' fields use JSON true/false
 - Always output valid JSON, no markdown or other text
 - Output fields:
 - "Message_ID": original email Message_ID  
 - "query": body
-- "escalate": boolean ('True' or 'False')
+- "escalate": boolean (true or false)
 - "priority": "high" | "medium" | "low" if escalate == true, otherwise empty string
 - "escalation_reason": one-sentence factual summary if escalate == true, otherwise empty string
 - "response": a concise, action-oriented reply
 - "subject": subject of the email should be in this formate= Re: user subject line as it is
 - "to_email": user's from email address
-- "reply_to": boolean ('True' or 'False')
+- "reply_to": boolean (true or false)
 
 ## Attachments
 - If "attachment_data" exists, include a brief summary of attachments in "response"
+- If "attachment_content" exists, it holds extracted text/metadata of the attachments (CSV/Excel head and columns, PDF text, image size); use it to understand the attachments
 - Do not include raw binary content in JSON
 - If "Body" is empty but there are attachments, infer the query is about the attachment content
 
@@ -99,11 +146,11 @@ is_important: True
 Date: "2025-10-01 15:56:26.000000"
 attachment_data: [{'filename': '1000374153.jpg', 'mimeType': 'image/jpeg', 'path': 'attachments/1000374153.jpg'}, {'filename': '1000373981.jpg', 'mimeType': 'image/jpeg', 'path': 'attachments/1000373981.jpg'}]
 Output=
-{"Message_ID":"178f3a4e5c6d7e8f","query": "Hi, I keep getting an error whenever I try logging into the dashboard today. Can you check?",escalate": True,
+{"Message_ID":"178f3a4e5c6d7e8f","query": "Hi, I keep getting an error whenever I try logging into the dashboard today. Can you check?","escalate": true,
 "priority": "high","escalation_reason": "user cannot log into dashboard, critical usage issue", 
 "response": "This kind of login error may occur due to a session or configuration mismatch. You might try refreshing the environment variables, as that could help. 
 If the issue still persists, let me know and I will escalate this to our technical team for review.",
-"subject": "Re: Login Issue on Dashboard", "to_email": "client@example.com", "reply_to": True}
+"subject": "Re: Login Issue on Dashboard", "to_email": "client@example.com", "reply_to": true}
 
 Example 2:
 Input=
@@ -116,10 +163,10 @@ Date: "2025-10-02 10:20:15.000000"
 attachment_data: [{'filename': '1000374153.jpg', 'mimeType': 'image/jpeg', 'path': 'attachments/1000374153.jpg'}]
 Output=
 {"Message_ID":"189a4b5c6d7e8f9g","query": "Hi Team, I created a Builder called \"Urbanest Realty\". It has 3 projects — how do I add the projects under this Builder?",
-"escalate": True, "priority": "medium","escalation_reason": "requested technical guidance on adding projects under a builder record",
+"escalate": true, "priority": "medium","escalation_reason": "requested technical guidance on adding projects under a builder record",
 "response": "You can add projects under Urbanest Realty by going to Projects → Add Project, selecting Urbanest Realty from the Builder dropdown, and then entering 
 the project details. Repeat this for all 3 projects, and they'll be linked under the Builder.", "subject": "Re: Adding projects under a Builder", 
-"to_email": "jane.doe@example.com", "reply_to": False}
+"to_email": "jane.doe@example.com", "reply_to": false}
 
 Example 3:
 Input=
@@ -131,9 +178,9 @@ is_important: False
 Date: "2025-10-03 09:15:42.000000"
 attachment_data: []
 Output=
-{"Message_ID":"190b5c6d7e8f9g0h","query": "The latest patch fixed everything. Thanks for confirming.","priority": "low","escalate": False, "escalation_reason": "", 
+{"Message_ID":"190b5c6d7e8f9g0h","query": "The latest patch fixed everything. Thanks for confirming.","priority": "low","escalate": false, "escalation_reason": "", 
 "response": "Glad to hear the latest patch resolved everything! Thanks for confirming.", "subject": "Re: Patch update feedback", "to_email": "supportuser@example.com",
-"reply_to": True}
+"reply_to": true}
 
 Example 4:
 Input=
@@ -145,18 +192,53 @@ is_important: False
 Date: "2025-10-03 09:15:42.000000"
 attachment_data: [{'filename': 'error_screenshot.png', 'mimeType': 'image/png', 'path': 'attachments/error_screenshot.png'}]
 Output=
-{"Message_ID":"190b5c6d7e8f9g0h","query": "only attachment about some error","priority": "medium","escalate": True, "escalation_reason": "user's query suggests a potential issue or 
+{"Message_ID":"190b5c6d7e8f9g0h","query": "only attachment about some error","priority": "medium","escalate": true, "escalation_reason": "user's query suggests a potential issue or 
 need for assistance, despite an empty body only with attachment.", "response": "I can see in attachment problem exactly in login password. for corrcte credentials conntect admin", 
-"subject": "Re: Facing error", "to_email": "user@example.com", "reply_to": True}
+"subject": "Re: Facing error", "to_email": "user@example.com", "reply_to": true}
 
-""",
-    model=model,
-    tools=[fetch_personality_settings, fetch_client_and_project_data],
-)
+"""
+
+def create_gmail_agent():
+    from agents import Agent, function_tool
+    return Agent(
+        name="Gmail Agent",
+        instructions=INTRO + TOOL_WORKFLOW + RULES,
+        model=app.model,
+        tools=[function_tool(fetch_personality_settings), function_tool(fetch_client_and_project_data)],
+    )
+
+
+# Same rules, but personality/client/project data arrive in the message: one model turn per email
+def create_context_agent():
+    from agents import Agent
+    return Agent(
+        name="Gmail Agent (pre-resolved context)",
+        instructions=INTRO + PRERESOLVED_WORKFLOW + RULES,
+        model=app.model,
+    )
+
+
+# Single follow-up when the output fails validation: short prompt, no rules, no tools
+def create_repair_agent():
+    from agents import Agent
+    return Agent(
+        name="Gmail Agent (output repair)",
+        instructions="You fix JSON produced by another assistant. Output only the corrected JSON object, no markdown.",
+        model=app.model,
+    )
+
+
+app.register("gmail_agent", create_gmail_agent)
+app.register("context_agent", create_context_agent)
+app.register("repair_agent", create_repair_agent)
+
+ATTACHMENT_FIELDS = ("filename", "mimeType", "path", "skipped")
 
 # format dict → message string
 def dict_to_message_text(raw: dict) -> str:
-    return f"""Message_ID: {raw.get('id', raw.get('Message_ID', ''))}
+    attachments = raw.get('attachments', raw.get('attachment_data', []))
+    attachment_data = [{k: a[k] for k in ATTACHMENT_FIELDS if k in a} for a in attachments]
+    text = f"""Message_ID: {raw.get('id', raw.get('Message_ID', ''))}
 From: {raw.get('from', raw.get('From', ''))}
 Subject: {raw.get('subject', raw.get('Subject', ''))}
 Body: 
@@ -164,43 +246,177 @@ Body:
 is_important: {raw.get('is_important', False)}
 Date: {raw.get('date', raw.get('Date', ''))}
 attachment_data: 
-\"\"\"{raw.get('attachments', raw.get('attachment_data', []))}\"\"\"
+\"\"\"{attachment_data}\"\"\"
+"""
+    summaries = [a for a in attachments if a.get("summary")]
+    if summaries:
+        text += "attachment_content:\n" + "\n".join(
+            f"--- {a['filename']} ---\n{a['summary']}" for a in summaries
+        ) + "\n"
+    if "personality_settings" in raw:
+        text += f"""personality_settings: 
+\"\"\"{raw['personality_settings']}\"\"\"
+client_context: 
+\"\"\"{raw.get('client_context', {})}\"\"\"
 """
+    return text
 
-# format string → message dict
-def llm_response_to_dict(response_str: str) -> dict:
+
+def with_context(raw: dict) -> dict:
     """
-    Convert LLM text response into a Python dict safely.
-    - Strips markdown fences
-    - Fixes lowercase true/false/null → Python True/False/None
-    - Fixes double double-quotes ("") issues
-    - Tries JSON first, then literal_eval
+    Attach the sender's personality settings and client/project data to the
+    email (served from the db caches, which main pre-fills once per poll cycle).
     """
-    if not response_str:
-        return {}
+    if "personality_settings" in raw:
+        return raw
+    sender = parseaddr(raw.get('from', raw.get('From', '')))[1]
+    if not sender:
+        return {**raw, "personality_settings": {}, "client_context": {}}
+    return {
+        **raw,
+        "personality_settings": get_personality_settings(sender),
+        "client_context": get_client_and_project_data(sender),
+    }
+
+# ----------------------------
+# Run statistics
+# ----------------------------
+class AgentRunStats:
+    """Latency, model turns and tokens per email, split by context mode."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode: str, result, elapsed: float):
+        responses = result.raw_responses
+        input_tokens = sum(r.usage.input_tokens for r in responses)
+        output_tokens = sum(r.usage.output_tokens for r in responses)
+        metrics.stage(f"llm_run_{mode}").observe(elapsed)
+        metrics.counter("llm_turns_total", "Model turns", mode=mode).inc(len(responses))
+        metrics.counter("llm_tokens_total", "Model tokens", mode=mode, kind="input").inc(input_tokens)
+        metrics.counter("llm_tokens_total", "Model tokens", mode=mode, kind="output").inc(output_tokens)
+        with self._lock:
+            m = self._modes.setdefault(
+                mode, {"emails": 0, "seconds": 0.0, "turns": 0, "input_tokens": 0, "output_tokens": 0}
+            )
+            m["emails"] += 1
+            m["seconds"] += elapsed
+            m["turns"] += len(responses)
+            m["input_tokens"] += input_tokens
+            m["output_tokens"] += output_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                mode: {
+                    "emails": m["emails"],
+                    "avg_latency_s": round(m["seconds"] / m["emails"], 3),
+                    "avg_turns": round(m["turns"] / m["emails"], 2),
+                    "avg_input_tokens": round(m["input_tokens"] / m["emails"]),
+                    "avg_output_tokens": round(m["output_tokens"] / m["emails"]),
+                }
+                for mode, m in self._modes.items()
+                if m["emails"]
+            }
+
+
+agent_run_stats = AgentRunStats()
+
+
+def _agent_for(mode: str):
+    return app.context_agent if mode == "preresolved" else app.gmail_agent
+
 
-    # 1. Strip markdown fences like ```json ... ```
-    cleaned = re.sub(r"^```(?:json)?|```$", "", response_str.strip(), flags=re.MULTILINE).strip()
+def _reask_failed(raw: dict, error: ResponseParseError) -> dict:
+    parse_stats.record("failed")
+    logger.error(f"❌ Agent output for {raw.get('Message_ID')} unusable after re-ask, escalating: {error}")
+    return fallback_response(raw, error)
 
-    # 2. If JSON fails, fallback to Python literal
+
+def parse_response(raw: dict, output: str) -> dict:
+    """Validate the agent output; on failure re-ask once with only the errors and the bad output."""
+    try:
+        return parse_agent_response(output, raw)
+    except ResponseParseError as error:
+        logger.warning(f"⚠️ Agent output for {raw.get('Message_ID')} failed validation, re-asking: {error}")
+        retry = app.runner.run_sync(app.repair_agent, reask_prompt(error), run_config=app.run_config)
     try:
-        # replace json booleans for Python eval
-        py_ready = cleaned.replace("true", "True").replace("false", "False").replace("null", "None")
-        return ast.literal_eval(py_ready)
-    except Exception as e:
-        raise ValueError(f"❌ Could not parse LLM response into dict.\nRaw output:\n{response_str}\nError: {e}")
+        return parse_agent_response(retry.final_output, raw, reasked=True)
+    except ResponseParseError as error:
+        return _reask_failed(raw, error)
+
+
+async def parse_response_async(raw: dict, output: str) -> dict:
+    try:
+        return parse_agent_response(output, raw)
+    except ResponseParseError as error:
+        logger.warning(f"⚠️ Agent output for {raw.get('Message_ID')} failed validation, re-asking: {error}")
+        retry = await app.runner.run(app.repair_agent, reask_prompt(error), run_config=app.run_config)
+    try:
+        return parse_agent_response(retry.final_output, raw, reasked=True)
+    except ResponseParseError as error:
+        return _reask_failed(raw, error)
+
 
 # ----------------------------
 # Main callable function
 # ----------------------------
-def process_email(raw: dict) -> dict:
+def process_email(raw: dict, mode: str = None) -> dict:
     """
     Takes a raw email dictionary, runs it through the Gmail Agent,
     and returns the JSON response as dict.
     """
+    mode = mode or CONTEXT_MODE
+    if mode == "preresolved":
+        raw = with_context(raw)
+    # Trivial emails get a templated reply; a sample of them still runs the agent to score the fast path
+    fast_path = app.fast_path
+    quick = fast_path.answer(raw) if fast_path is not None else None
+    if quick is not None and not fast_path.audit(quick):
+        return quick
+    if response_cache is not None:
+        cached = response_cache.lookup(raw)
+        if cached is not None:
+            return cached
     message_text = dict_to_message_text(raw)
 
-    result = Runner.run_sync(gmail_agent, message_text, run_config=config)
-    parsed= llm_response_to_dict(result.final_output)
+    start = time.perf_counter()
+    result = app.runner.run_sync(_agent_for(mode), message_text, run_config=app.run_config)
+    agent_run_stats.record(mode, result, time.perf_counter() - start)
+    parsed= parse_response(raw, result.final_output)
+    if quick is not None:
+        fast_path.score(quick, parsed)
+    if response_cache is not None:
+        response_cache.store(raw, parsed)
     
     return parsed
+
+async def process_email_async(raw: dict, mode: str = None) -> dict:
+    """
+    Async variant of process_email for running many emails concurrently
+    on one event loop (see GmailAutomation/LLM/processing_pool.py).
+    """
+    mode = mode or CONTEXT_MODE
+    if mode == "preresolved":
+        raw = await asyncio.to_thread(with_context, raw)
+    fast_path = app.fast_path
+    quick = await asyncio.to_thread(fast_path.answer, raw) if fast_path is not None else None
+    if quick is not None and not fast_path.audit(quick):
+        return quick
+    if response_cache is not None:
+        cached = await asyncio.to_thread(response_cache.lookup, raw)
+        if cached is not None:
+            return cached
+    message_text = dict_to_message_text(raw)
+
+    start = time.perf_counter()
+    result = await app.runner.run(_agent_for(mode), message_text, run_config=app.run_config)
+    agent_run_stats.record(mode, result, time.perf_counter() - start)
+    parsed = await parse_response_async(raw, result.final_output)
+    if quick is not None:
+        fast_path.score(quick, parsed)
+    if response_cache is not None:
+        response_cache.store(raw, parsed)
+
+    return parsed
@@ -0,0 +1,297 @@
+import importlib
+import json
+import os
+import random
+import threading
+from collections import Counter, deque
+from dataclasses import asdict
+from email.utils import parseaddr
+
+from GmailAutomation.LLM.response_cache import normalize_body
+from GmailAutomation.LLM.response_parser import AgentResponse
+from GmailAutomation.app_context import app
+from GmailAutomation.db import get_personality_settings
+from GmailAutomation.metrics import metrics
+from logger import logger
+
+# ------------------------------------------------------------
+# Rule-based fast path for trivial emails
+# ------------------------------------------------------------
+FAST_PATH = os.getenv("FAST_PATH", "off")  # "on", "shadow" (classify and score only, never answer) or "off"
+FAST_PATH_RULES = os.getenv("FAST_PATH_RULES", "fast_path_rules.json")  # optional per-client rules
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", 20))
+FAST_PATH_SAMPLE_RATE = float(os.getenv("FAST_PATH_SAMPLE_RATE", 0.05))  # hits also run through the LLM, for scoring
+FAST_PATH_MIN_ACCURACY = float(os.getenv("FAST_PATH_MIN_ACCURACY", 0.9))  # below this the fast path stops answering
+FAST_PATH_MODEL = os.getenv("FAST_PATH_MODEL", "")  # optional local classifier, "module:function"
+FAST_PATH_MODEL_CONFIDENCE = float(os.getenv("FAST_PATH_MODEL_CONFIDENCE", 0.9))
+ACCURACY_WINDOW = 200  # recent scored samples the accuracy is computed over
+MIN_SAMPLES = 20  # scored samples needed before the accuracy can stop the fast path
+
+# Category -> phrases that make an email one of them, checked in this order
+CATEGORIES = {
+    "resolved": ("fixed", "resolved", "works now", "working now", "all good now", "sorted", "that did it", "that worked"),
+    "thanks": ("thanks", "thank you", "thx", "appreciate", "appreciated", "cheers"),
+    "acknowledged": ("got it", "noted", "received", "sounds good", "will do", "understood", "ok", "okay", "perfect", "great"),
+}
+# Besides the category phrases, the only words a fast path email may contain: greetings, pronouns,
+# politeness and sign-offs. Anything else ("locked out", "keeps freezing", "got hacked") needs the LLM.
+FILLER_WORDS = frozenset("""
+hi hello hey dear there team everyone all guys folks
+i we me us my our you your it its this that is was s re ll ve m d
+a the and so very much lot for just really everything now
+help support quick reply response
+have nice good great day weekend
+best kind regards
+""".split())
+# Any of these words sends the email to the LLM, also when a local model would call it trivial:
+# negation, problems, requests, questions, money, urgency
+BLOCKERS = frozenset("""
+not no never still but however although again also another additionally one more else
+issue issues problem problems error errors bug bugs broken fail failed failing failure crash crashed down outage
+wrong missing unable cannot can couldn doesn don didn isn wasn won aren
+urgent asap immediately refund refunds charge charged invoice billing payment cancel cancellation
+complaint complain disappointed unhappy frustrated angry terrible worst slow
+how why what when where which who could would should please need needs want question questions confused
+send share provide schedule call meeting change add remove delete create configure install let know attached attachment
+""".split())
+
+TEMPLATES = {
+    "resolved": "Glad to hear everything is working now! Thanks for confirming.",
+    "thanks": "You're welcome, happy we could help!",
+    "acknowledged": "Thanks for confirming.",
+}
+FORMAL_TEMPLATES = {
+    "resolved": "We are pleased to hear that everything is working as expected. Thank you for confirming.",
+    "thanks": "You are most welcome. We are pleased to have been of help.",
+    "acknowledged": "Thank you for confirming.",
+}
+FORMAL_LEVELS = {"high", "formal", "very formal", "professional"}
+
+DEFAULT_RULES = {
+    "enabled": True,
+    "max_words": FAST_PATH_MAX_WORDS,
+    "categories": list(CATEGORIES),
+    "blockers": [],  # extra blocking words
+    "templates": {},  # category -> reply line, overrides the built-in one
+}
+
+FAST_PATH_EMAILS = {
+    result: metrics.counter("fast_path_emails_total", "Emails seen by the fast path", result=result)
+    for result in ("answered", "audited", "llm")
+}
+FAST_PATH_AUDITS = {
+    result: metrics.counter("fast_path_audits_total", "Fast path decisions checked against the LLM", result=result)
+    for result in ("agree", "disagree")
+}
+
+
+def load_rules(path: str = FAST_PATH_RULES) -> dict:
+    """
+    Read the per-client rules: {"default": {...}, "clients": {"a@b.com" or
+    "@b.com": {...}}}, each with any of DEFAULT_RULES' keys. A missing file
+    means the defaults for everyone.
+    """
+    if not path or not os.path.exists(path):
+        return {"default": DEFAULT_RULES, "clients": {}}
+    with open(path) as f:
+        data = json.load(f)
+    default = {**DEFAULT_RULES, **data.get("default", {})}
+    clients = {key.strip().lower(): {**default, **rules} for key, rules in data.get("clients", {}).items()}
+    return {"default": default, "clients": clients}
+
+
+def load_model(spec: str = FAST_PATH_MODEL):
+    """Import the optional local classifier: a callable text -> (category or None, confidence)."""
+    if not spec:
+        return None
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name or "classify")
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return f" {phrase} " in f" {text} "
+
+
+class FastPath:
+    """
+    Answers obviously trivial emails ("Thanks, that fixed it!") with a
+    templated reply instead of an agent run, like the prompt's own Example 3.
+
+    An email qualifies when it has no attachments, is not marked important,
+    has no question mark, is at most `max_words` words long, contains none
+    of the blocking words and consists only of category phrases and filler
+    words (or, when a local model is configured and the rules found nothing,
+    the model is confident enough). Everything else goes to the LLM.
+
+    A `sample_rate` share of the hits runs through the LLM anyway; that
+    decision is used and the fast path is scored against it. When the
+    recent accuracy falls below `min_accuracy` the fast path stops
+    answering (every candidate is scored) until it recovers. In "shadow"
+    mode it never answers and every candidate is scored.
+    """
+
+    def __init__(self, mode: str = FAST_PATH, rules: dict = None, model=None,
+                 sample_rate: float = FAST_PATH_SAMPLE_RATE, min_accuracy: float = FAST_PATH_MIN_ACCURACY,
+                 personality=get_personality_settings):
+        self.mode = mode
+        self.rules = rules if rules is not None else load_rules()
+        self.model = model
+        self.sample_rate = sample_rate
+        self.min_accuracy = min_accuracy
+        self._personality = personality
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=ACCURACY_WINDOW)
+        self.standing_down = False
+
+        self.seen = 0
+        self.answered = 0
+        self.audited = 0
+        self.categories = Counter()
+        self.agreements = Counter()
+        metrics.gauge("fast_path_accuracy", "Share of recent fast path decisions the LLM agreed with",
+                      fn=lambda: self.accuracy() or 0.0)
+
+    # ---------------- classification ----------------
+    def _rules_for(self, sender: str) -> dict:
+        clients = self.rules["clients"]
+        return clients.get(sender) or clients.get("@" + sender.rpartition("@")[2]) or self.rules["default"]
+
+    def classify(self, raw: dict, rules: dict):
+        """
+        The category of a trivial email, or None if it needs the LLM. The
+        rules only match when the email is nothing but category phrases,
+        filler words and the sender's name ("Thanks, that fixed it! Anna").
+        """
+        if not rules["enabled"] or raw.get("attachment_data") or raw.get("attachments") or raw.get("is_important"):
+            return None
+        body = raw.get("Body", raw.get("body", "")) or ""
+        text = normalize_body(body)
+        words = text.split()
+        if not words or len(words) > rules["max_words"] or "?" in body:
+            return None
+        if any(word in BLOCKERS for word in words) or any(_contains(text, word) for word in rules["blockers"]):
+            return None
+
+        phrases = [phrase for category in rules["categories"] for phrase in CATEGORIES.get(category, ())]
+        known = FILLER_WORDS | {word for phrase in phrases for word in phrase.split()}
+        known |= set(normalize_body(parseaddr(raw.get("From", raw.get("from", "")))[0]).split())
+        if all(word in known for word in words):
+            for category in rules["categories"]:
+                if any(_contains(text, phrase) for phrase in CATEGORIES.get(category, ())):
+                    return category
+        if self.model is not None:
+            category, confidence = self.model(body)
+            if category in rules["categories"] and confidence >= FAST_PATH_MODEL_CONFIDENCE:
+                return category
+        return None
+
+    def reply(self, category: str, rules: dict, settings: dict) -> str:
+        """Templated reply shaped by the client's personality settings (greeting, formality, follow-up, name)."""
+        formal = any(
+            str(settings.get(key) or "").strip().lower() in FORMAL_LEVELS
+            for key in ("formality_level", "communication_tone")
+        )
+        line = rules["templates"].get(category) or (FORMAL_TEMPLATES if formal else TEMPLATES)[category]
+        if settings.get("followup_message"):
+            line += " " + settings["followup_message"]
+        parts = [f"{settings['default_greeting']},", line] if settings.get("default_greeting") else [line]
+        if settings.get("assistant_name"):
+            parts.append(f"{'Kind regards' if formal else 'Best'},\n{settings['assistant_name']}")
+        return "\n\n".join(parts)
+
+    # ---------------- public API ----------------
+    def answer(self, raw: dict):
+        """A non-escalating reply for a trivial email, or None if it needs the LLM."""
+        sender = parseaddr(raw.get("From", raw.get("from", "")))[1].strip().lower()
+        rules = self._rules_for(sender) if sender else None
+        category = self.classify(raw, rules) if rules else None
+        with self._lock:
+            self.seen += 1
+        if category is None:
+            FAST_PATH_EMAILS["llm"].inc()
+            return None
+
+        settings = raw.get("personality_settings")
+        if settings is None:
+            settings = self._personality(sender)
+        subject = raw.get("Subject", raw.get("subject", ""))
+        response = asdict(AgentResponse(
+            Message_ID=raw.get("Message_ID", raw.get("id", "")),
+            query=raw.get("Body", raw.get("body", "")),
+            escalate=False,
+            priority="",
+            escalation_reason="",
+            response=self.reply(category, rules, settings or {}),
+            subject=subject if subject.lower().startswith("re:") else f"Re: {subject}",
+            to_email=raw.get("From", raw.get("from", "")),
+            reply_to=True,
+        ))
+        response["fast_path"] = category
+        return response
+
+    def audit(self, response: dict) -> bool:
+        """True if this fast path answer must go through the LLM anyway (to be scored); False to use it."""
+        with self._lock:
+            audited = self.mode != "on" or self.standing_down or random.random() < self.sample_rate
+            self.categories[response["fast_path"]] += 1
+            if audited:
+                self.audited += 1
+            else:
+                self.answered += 1
+        FAST_PATH_EMAILS["audited" if audited else "answered"].inc()
+        return audited
+
+    def score(self, response: dict, llm_response: dict):
+        """Compare an audited fast path answer with the LLM's decision for the same email."""
+        # The fast path never escalates and always replies in the thread; the LLM must have done the same
+        escalated = llm_response.get("escalate", False)
+        agreed = not escalated and llm_response.get("reply_to", False) == response["reply_to"]
+        FAST_PATH_AUDITS["agree" if agreed else "disagree"].inc()
+        if not agreed:
+            decision = (
+                f"escalated it: {llm_response.get('escalation_reason', '')}" if escalated
+                else f"sent a new email to {llm_response.get('to_email', '')} instead of a reply"
+            )
+            logger.warning(
+                f"⚡ Fast path answered {response['Message_ID']} as '{response['fast_path']}' but the LLM {decision}"
+            )
+        with self._lock:
+            self.agreements[(response["fast_path"], agreed)] += 1
+            self._recent.append(agreed)
+            accuracy = sum(self._recent) / len(self._recent)
+            enough = len(self._recent) >= MIN_SAMPLES
+            was_standing_down = self.standing_down
+            self.standing_down = enough and accuracy < self.min_accuracy
+        if self.standing_down != was_standing_down:
+            state = "stops answering" if self.standing_down else "answers again"
+            logger.warning(f"⚡ Fast path {state}: recent accuracy {accuracy:.2f} (minimum {self.min_accuracy})")
+
+    def accuracy(self):
+        with self._lock:
+            return round(sum(self._recent) / len(self._recent), 3) if self._recent else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            scored = sum(self.agreements.values())
+            return {
+                "mode": self.mode,
+                "standing_down": self.standing_down,
+                "seen": self.seen,
+                "answered": self.answered,
+                "audited": self.audited,
+                "hit_rate": round((self.answered + self.audited) / self.seen, 3) if self.seen else 0.0,
+                "llm_calls_avoided": self.answered,
+                "categories": dict(self.categories),
+                "scored": scored,
+                "accuracy": round(sum(n for (_, agreed), n in self.agreements.items() if agreed) / scored, 3) if scored else None,
+                "recent_accuracy": round(sum(self._recent) / len(self._recent), 3) if self._recent else None,
+            }
+
+
+def create_fast_path():
+    """Rules are read and the model imported on first use; None when FAST_PATH=off."""
+    return FastPath(model=load_model()) if FAST_PATH != "off" else None
+
+
+# Shared fast path used by process_email (`app.fast_path`)
+app.register("fast_path", create_fast_path)
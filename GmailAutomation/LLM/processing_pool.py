@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+from logger import logger
+from GmailAutomation.LLM.EmailAgent import process_email_async
+
+# ------------------------------------------------------------
+# Concurrent email processing
+# ------------------------------------------------------------
+PROCESSING_CONCURRENCY = int(os.getenv("PROCESSING_CONCURRENCY", 8))
+
+
+def ordering_key(data: dict) -> str:
+    """Emails sharing a Gmail thread (or, without one, a sender) are processed in order."""
+    return data.get("threadId") or data.get("From") or data.get("Message_ID")
+
+
+class EmailProcessingPool:
+    """
+    Runs the agent for many emails concurrently on one persistent event loop.
+
+    At most `max_concurrency` agent runs are in flight. Emails with the same
+    `ordering_key` run one after another, in submission order, so follow-ups
+    in a thread never overtake the message they follow up on.
+    """
+
+    def __init__(self, max_concurrency: int = PROCESSING_CONCURRENCY, process=process_email_async, key=ordering_key):
+        self.max_concurrency = max_concurrency
+        self._process = process
+        self._key = key
+        # One loop for the pool's lifetime so the AsyncOpenAI connection pool is reused
+        self._loop = asyncio.new_event_loop()
+
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_latency_s = 0.0
+        self.busy_s = 0.0
+
+    def process_batch(self, items: list) -> list:
+        """
+        Process a list of email data dicts concurrently.
+        Returns a list of (response, error) tuples in the same order as `items`.
+        """
+        if not items:
+            return []
+        start = time.perf_counter()
+        results = self._loop.run_until_complete(self._run_all(items))
+        elapsed = time.perf_counter() - start
+        self.busy_s += elapsed
+        logger.info(
+            f"⚡ Processed {len(items)} email(s) in {elapsed:.2f}s "
+            f"({len(items) / elapsed:.2f} emails/s, max in flight {self.max_in_flight})"
+        )
+        return results
+
+    async def _run_all(self, items):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        key_locks = defaultdict(asyncio.Lock)
+        self.queue_depth += len(items)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return await asyncio.gather(*(self._run_one(data, semaphore, key_locks[self._key(data)]) for data in items))
+
+    async def _run_one(self, data, semaphore, key_lock):
+        # Take the per-key lock first so a queued follow-up never holds a concurrency slot
+        async with key_lock:
+            async with semaphore:
+                self.queue_depth -= 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                start = time.perf_counter()
+                try:
+                    response = await self._process(data)
+                    self.processed += 1
+                    return response, None
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"❌ Failed to process email {data.get('Message_ID')}: {e}")
+                    return None, e
+                finally:
+                    self.in_flight -= 1
+                    self.total_latency_s += time.perf_counter() - start
+
+    def close(self):
+        self._loop.close()
+
+    def stats(self) -> dict:
+        completed = self.processed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_latency_s": round(self.total_latency_s / completed, 3) if completed else 0.0,
+            "throughput_per_s": round(completed / self.busy_s, 3) if self.busy_s else 0.0,
+        }
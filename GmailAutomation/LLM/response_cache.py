@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from GmailAutomation.db import get_personality_settings
+
+# ------------------------------------------------------------
+# Near-duplicate response cache
+# ------------------------------------------------------------
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "off")  # "on": send a stored reply for (near-)duplicate emails
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 6 * 3600))  # seconds
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 2000))
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", 12))  # candidate filter, differing bits out of 64
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", 0.75))  # Jaccard over shingles
+NEAR_MATCH_MIN_TOKENS = 8  # shorter bodies ("thanks" vs "no thanks") only match exactly
+NEAR_MATCH_MAX_CHARS = 4000  # longer bodies only match exactly
+
+WORD = re.compile(r"\w+")
+
+
+def normalize_body(text: str) -> str:
+    """Lower-case and keep only the words, so whitespace/punctuation changes do not matter."""
+    return " ".join(WORD.findall((text or "").lower()))
+
+
+def shingles(tokens: list) -> frozenset:
+    """Words plus word bigrams."""
+    return frozenset(tokens) | frozenset(" ".join(tokens[i:i + 2]) for i in range(len(tokens) - 1))
+
+
+def simhash(features) -> int:
+    """64-bit SimHash of a set of features."""
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class ResponseCache:
+    """
+    Reuses agent decisions for emails that say the same thing.
+
+    Entries are scoped by sender, importance and a digest of the sender's
+    personality settings, so a cached reply is only reused where the agent
+    would have been given the same inputs. Lookups try the exact normalized
+    body first, then near duplicates: entries whose SimHash is within
+    `max_distance` bits are candidates, and the most similar one is used if
+    its shingle Jaccard similarity reaches `min_similarity` (SimHash alone
+    is too noisy on short emails). Emails with attachments are never cached.
+    Hits are re-targeted to the new Message_ID, subject and sender before
+    they are returned.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_SIZE,
+                 max_distance: int = SIMHASH_MAX_DISTANCE, min_similarity: float = NEAR_DUPLICATE_SIMILARITY,
+                 personality=get_personality_settings):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.min_similarity = min_similarity
+        self._personality = personality
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (scope, body_digest) -> entry, least recently used first
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ---------------- keys ----------------
+    def _fingerprint(self, raw: dict):
+        """Return (scope, body_digest, (simhash, shingles) or None), or None if the email must not be cached."""
+        if raw.get("attachment_data") or raw.get("attachments"):
+            return None
+        sender = (raw.get("From") or raw.get("from") or "").strip().lower()
+        body = normalize_body(raw.get("Body", raw.get("body", "")))
+        if not sender or not body:
+            return None
+
+        settings = raw.get("personality_settings")
+        if settings is None:
+            settings = self._personality(sender)
+        settings_digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        scope = (sender, bool(raw.get("is_important")), settings_digest)
+
+        tokens = body.split()
+        near = None
+        if NEAR_MATCH_MIN_TOKENS <= len(tokens) and len(body) <= NEAR_MATCH_MAX_CHARS:
+            features = shingles(tokens)
+            near = (simhash(features), features)
+        return scope, hashlib.sha256(body.encode()).hexdigest(), near
+
+    # ---------------- public API ----------------
+    def lookup(self, raw: dict):
+        """Return a re-targeted cached response for `raw`, or None."""
+        fingerprint = self._fingerprint(raw)
+        with self._lock:
+            self.lookups += 1
+            if fingerprint is None:
+                self.bypassed += 1
+                return None
+            scope, digest, near = fingerprint
+            now = time.monotonic()
+
+            entry = self._entries.get((scope, digest))
+            if entry is not None and entry["expires_at"] <= now:
+                del self._entries[(scope, digest)]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.exact_hits += 1
+            elif near is not None:
+                entry = self._closest(scope, near, now)
+                if entry is not None:
+                    self.near_hits += 1
+            if entry is None:
+                return None
+            self._entries.move_to_end(entry["key"])
+            return retarget(entry["response"], raw)
+
+    def store(self, raw: dict, response: dict):
+        fingerprint = self._fingerprint(raw)
+        if fingerprint is None or not response.get("response"):
+            return
+        scope, digest, near = fingerprint
+        key = (scope, digest)
+        with self._lock:
+            self._entries[key] = {
+                "key": key,
+                "response": dict(response),
+                "near": near,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _closest(self, scope, near, now: float):
+        sketch, features = near
+        best, best_similarity = None, self.min_similarity
+        for (entry_scope, _), entry in self._entries.items():
+            if entry_scope != scope or entry["near"] is None or entry["expires_at"] <= now:
+                continue
+            entry_sketch, entry_features = entry["near"]
+            if (entry_sketch ^ sketch).bit_count() > self.max_distance:
+                continue
+            similarity = len(features & entry_features) / len(features | entry_features)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        return best
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.near_hits
+        return {
+            "size": len(self._entries),
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "hit_rate": round(hits / self.lookups, 3) if self.lookups else 0.0,
+            "llm_calls_avoided": hits,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def retarget(response: dict, raw: dict) -> dict:
+    """Point a cached decision at a new email."""
+    subject = raw.get("Subject", raw.get("subject", ""))
+    return {
+        **response,
+        "Message_ID": raw.get("Message_ID", raw.get("id", "")),
+        "query": raw.get("Body", raw.get("body", "")),
+        "subject": subject if subject.lower().startswith("re:") else f"Re: {subject}",
+        "to_email": raw.get("From", raw.get("from", "")),
+    }
+
+
+# Shared cache used by process_email (None when RESPONSE_CACHE=off)
+response_cache = ResponseCache() if RESPONSE_CACHE == "on" else None
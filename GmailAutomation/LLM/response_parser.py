@@ -0,0 +1,253 @@
+import ast
+import json
+import re
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, fields
+
+from GmailAutomation.metrics import metrics
+
+# ------------------------------------------------------------
+# Agent response schema + parser
+# ------------------------------------------------------------
+PRIORITIES = ("high", "medium", "low", "")
+OPTIONAL_FIELDS = ("escalation_reason", "priority")  # may be omitted when escalate is false
+PARSE_WINDOW = 500  # recent outcomes kept for the rolling rates
+
+FENCE = re.compile(r"^```(?:json)?|```$", re.MULTILINE)
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+# `"...",escalate":` -> `"...","escalate":` (must be fixed before strings can be tracked)
+HALF_QUOTED_KEY = re.compile(r"([{,]\s*)([A-Za-z_]\w*)\"(\s*:)")
+# `, escalate:` -> `, "escalate":`
+UNQUOTED_KEY = re.compile(r"([{,]\s*)([A-Za-z_]\w*)(\s*:)")
+PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+TRUE_STRINGS = {"true", "yes", "1"}
+FALSE_STRINGS = {"false", "no", "0", ""}
+
+RESPONSE_PARSE = metrics.stage("response_parse")  # errors = outputs that failed validation
+
+
+@dataclass
+class AgentResponse:
+    """The JSON object the Gmail agent is instructed to return."""
+    Message_ID: str
+    query: str
+    escalate: bool
+    priority: str
+    escalation_reason: str
+    response: str
+    subject: str
+    to_email: str
+    reply_to: bool
+
+
+class ResponseParseError(ValueError):
+    def __init__(self, message: str, errors: list, raw_output: str):
+        super().__init__(message)
+        self.errors = errors
+        self.raw_output = raw_output
+
+
+# ---------------- decoding ----------------
+def _outside_strings(text: str, replace) -> str:
+    """Apply `replace` to the parts of `text` that are not inside double-quoted strings."""
+    out, start, i, in_string = [], 0, 0, False
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                i += 1
+            elif ch == '"':
+                out.append(text[start:i + 1])
+                start, in_string = i + 1, False
+        elif ch == '"':
+            out.append(replace(text[start:i]))
+            start, in_string = i, True
+        i += 1
+    out.append(text[start:] if in_string else replace(text[start:]))
+    return "".join(out)
+
+
+def _fix_structure(chunk: str) -> str:
+    chunk = re.sub(r"\b(True|False|None)\b", lambda m: PY_LITERALS[m.group(1)], chunk)
+    chunk = UNQUOTED_KEY.sub(r'\1"\2"\3', chunk)
+    return TRAILING_COMMA.sub(r"\1", chunk)
+
+
+def decode(text: str):
+    """
+    Decode the model output into a dict.
+    Returns (data, repaired) where `repaired` is True if the raw text was not valid JSON.
+    """
+    cleaned = FENCE.sub("", (text or "").strip()).strip()
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in output")
+    candidate = cleaned[start:end + 1]
+
+    try:
+        return json.loads(candidate), candidate != cleaned
+    except json.JSONDecodeError:
+        pass
+    # Raw newlines inside strings, Python booleans, trailing commas, half-quoted keys.
+    # Only text outside string literals is touched, so "true"/"None" inside the reply survive.
+    try:
+        repaired = HALF_QUOTED_KEY.sub(r'\1"\2"\3', candidate)
+        return json.loads(_outside_strings(repaired, _fix_structure), strict=False), True
+    except json.JSONDecodeError as e:
+        error = e
+    # Python dict syntax (single-quoted strings)
+    try:
+        data = ast.literal_eval(candidate)
+    except (ValueError, SyntaxError):
+        raise ValueError(f"invalid JSON: {error}")
+    if not isinstance(data, dict):
+        raise ValueError("output is not a JSON object")
+    return data, True
+
+
+# ---------------- validation ----------------
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS | FALSE_STRINGS:
+        return value.strip().lower() in TRUE_STRINGS
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+
+def validate(data: dict, email: dict):
+    """
+    Check `data` against AgentResponse. Fields the email already determines
+    (Message_ID, to_email, subject, query) are filled from it when missing,
+    and Message_ID always points at the email being answered.
+    Returns (AgentResponse, repaired, errors).
+    """
+    errors, repaired = [], False
+    values = {}
+    defaults = {
+        "Message_ID": email.get("Message_ID", email.get("id", "")),
+        "to_email": email.get("From", email.get("from", "")),
+        "subject": f"Re: {email.get('Subject', email.get('subject', ''))}",
+        "query": email.get("Body", email.get("body", "")),
+        "escalation_reason": "",
+        "priority": "",
+    }
+    for field in fields(AgentResponse):
+        value = data.get(field.name)
+        if value is None or (value == "" and field.name in ("Message_ID", "to_email")):
+            if field.name not in defaults:
+                errors.append(f"missing field '{field.name}'")
+                continue
+            values[field.name] = defaults[field.name]
+            repaired = repaired or field.name not in OPTIONAL_FIELDS
+        elif field.type is bool:
+            try:
+                values[field.name] = _as_bool(value)
+                repaired = repaired or not isinstance(value, bool)
+            except ValueError as e:
+                errors.append(f"'{field.name}': {e}")
+        elif isinstance(value, (dict, list)):
+            errors.append(f"'{field.name}': expected a string, got {type(value).__name__}")
+        else:
+            values[field.name] = str(value)
+
+    if defaults["Message_ID"] and values.get("Message_ID") != defaults["Message_ID"]:
+        values["Message_ID"] = defaults["Message_ID"]
+        repaired = True
+
+    if not errors:
+        priority = values["priority"].strip().lower()
+        if priority not in PRIORITIES:
+            errors.append(f"'priority' must be one of high/medium/low, got {values['priority']!r}")
+        values["priority"] = priority
+        if values["escalate"] and not priority:
+            errors.append("'priority' is required when escalate is true")
+        if not values["escalate"] and not values["response"].strip():
+            errors.append("'response' is empty")
+        if "@" not in values["to_email"]:
+            errors.append(f"'to_email' is not an email address: {values['to_email']!r}")
+    if errors:
+        return None, repaired, errors
+    return AgentResponse(**values), repaired, []
+
+
+def parse_agent_response(text: str, email: dict, reasked: bool = False) -> dict:
+    """
+    Decode and validate the agent output. Raises ResponseParseError with the list of problems.
+    `reasked` marks the answer to the follow-up sent after a failed first parse.
+    """
+    with RESPONSE_PARSE.time():
+        try:
+            data, decode_repaired = decode(text)
+        except ValueError as e:
+            raise ResponseParseError(str(e), [str(e)], text)
+        response, repaired, errors = validate(data, email)
+        if errors:
+            raise ResponseParseError("; ".join(errors), errors, text)
+    if reasked:
+        parse_stats.record("reasked")
+    else:
+        parse_stats.record("repaired" if decode_repaired or repaired else "clean")
+    return asdict(response)
+
+
+def reask_prompt(error: ResponseParseError) -> str:
+    """A short follow-up asking the model to fix only its output (no rules, no email)."""
+    names = ", ".join(f.name for f in fields(AgentResponse))
+    return (
+        "Your previous answer could not be used:\n"
+        + "\n".join(f"- {e}" for e in error.errors)
+        + f"\n\nPrevious answer:\n{error.raw_output}\n\n"
+        f"Return only the corrected JSON object with the fields {names}. "
+        "Use true/false for escalate and reply_to, and high/medium/low (or \"\" when not escalating) for priority."
+    )
+
+
+def fallback_response(email: dict, error: ResponseParseError) -> dict:
+    """Escalate to a human when the output is still unusable after the re-ask, so the email is not lost."""
+    return asdict(
+        AgentResponse(
+            Message_ID=email.get("Message_ID", email.get("id", "")),
+            query=email.get("Body", email.get("body", "")),
+            escalate=True,
+            priority="medium",
+            escalation_reason=f"Automatic reply failed: agent output could not be parsed ({error})",
+            response="",
+            subject=f"Re: {email.get('Subject', email.get('subject', ''))}",
+            to_email=email.get("From", email.get("from", "")),
+            reply_to=False,
+        )
+    )
+
+
+# ---------------- metrics ----------------
+class ParseStats:
+    """Counts parse outcomes: clean, repaired, reasked (fixed by the re-ask) and failed."""
+
+    OUTCOMES = ("clean", "repaired", "reasked", "failed")
+
+    def __init__(self, window: int = PARSE_WINDOW):
+        self._lock = threading.Lock()
+        self.totals = dict.fromkeys(self.OUTCOMES, 0)
+        self._recent = deque(maxlen=window)
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.totals[outcome] += 1
+            self._recent.append(outcome)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.totals.values())
+            recent = len(self._recent)
+            window = {o: sum(1 for r in self._recent if r == o) for o in self.OUTCOMES}
+            return {
+                **self.totals,
+                "first_pass_failure_rate": round((self.totals["reasked"] + self.totals["failed"]) / total, 3) if total else 0.0,
+                "repair_rate": round(self.totals["repaired"] / total, 3) if total else 0.0,
+                "recent_failure_rate": round((window["reasked"] + window["failed"]) / recent, 3) if recent else 0.0,
+                "recent_repair_rate": round(window["repaired"] / recent, 3) if recent else 0.0,
+            }
+
+
+parse_stats = ParseStats()
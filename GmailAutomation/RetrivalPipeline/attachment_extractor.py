@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from logger import logger
+from GmailAutomation.RetrivalPipeline.attachment_summaries import extract_summary
+
+# ------------------------------------------------------------
+# Attachment text extraction
+# ------------------------------------------------------------
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 30))  # seconds per attachment
+EXTRACTION_CACHE_SIZE = 2048
+
+
+class AttachmentExtractor:
+    """
+    Turns downloaded attachments into bounded text summaries for the agent.
+
+    Parsing runs in a process pool so CPU-heavy files do not stall the poll
+    loop, and results are cached by content digest (from the attachment
+    store), so the same file is never parsed twice. Workers are spawned,
+    not forked, since the pipeline runs background threads. A parse that
+    times out cannot be cancelled once it runs, so the pool is torn down
+    (its workers killed) and a fresh one takes the remaining work.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, timeout: float = EXTRACTION_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._cache = OrderedDict()  # digest -> summary
+        self._lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self.per_kind = defaultdict(lambda: {"count": 0, "seconds": 0.0, "bytes": 0})
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _restart_pool(self, executor):
+        """Drop `executor` (if still current) and kill its workers; the next submit starts a new pool."""
+        if executor is not self._executor:
+            return
+        self._executor = None
+        self.pool_restarts += 1
+        for process in list((executor._processes or {}).values()):  # shutdown() waits for running parses
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, entry):
+        executor = self._pool()
+        return executor, executor.submit(extract_summary, entry["path"], entry["mimeType"], entry["filename"])
+
+    def annotate(self, attachment_data: list) -> list:
+        """
+        Add a "summary" to every downloaded entry of `attachment_data` (in place).
+        Accepts the entries of one email or of a whole batch of emails.
+        """
+        pending = {}
+        for entry in attachment_data:
+            if "path" not in entry:
+                continue
+            digest = entry.get("digest")
+            with self._lock:
+                if digest in self._cache:
+                    self._cache.move_to_end(digest)
+                    entry["summary"] = self._cache[digest]
+                    self.cache_hits += 1
+                    continue
+            if digest in pending:
+                pending[digest][2].append(entry)
+                continue
+            pending[digest] = (*self._submit(entry), [entry])
+
+        for digest, (executor, future, entries) in pending.items():
+            try:
+                try:
+                    kind, summary, elapsed, size = future.result(timeout=self.timeout)
+                except (BrokenProcessPool, CancelledError):
+                    # The pool was restarted (another parse hung or a worker died): run this one again
+                    self._restart_pool(executor)
+                    executor, future = self._submit(entries[0])
+                    kind, summary, elapsed, size = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self.timeouts += 1
+                self._restart_pool(executor)
+                summary = "Attachment could not be processed in time"
+                logger.warning(f"⚠️ Extraction timed out for {entries[0]['filename']}, restarting the extraction pool")
+            except (BrokenProcessPool, CancelledError) as e:
+                summary = "Attachment could not be processed"
+                logger.warning(f"⚠️ Extraction failed for {entries[0]['filename']}: {e!r}")
+            else:
+                stats = self.per_kind[kind]
+                stats["count"] += 1
+                stats["seconds"] += elapsed
+                stats["bytes"] += size
+                with self._lock:
+                    self._cache[digest] = summary
+                    if len(self._cache) > EXTRACTION_CACHE_SIZE:
+                        self._cache.popitem(last=False)
+            for entry in entries:
+                entry["summary"] = summary
+        return attachment_data
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "cache_hits": self.cache_hits,
+            "timeouts": self.timeouts,
+            "pool_restarts": self.pool_restarts,
+            "per_kind": {
+                kind: {
+                    "count": s["count"],
+                    "avg_ms": round(s["seconds"] / s["count"] * 1000, 2) if s["count"] else 0.0,
+                    "bytes": s["bytes"],
+                    "mb_per_s": round(s["bytes"] / s["seconds"] / 1024 / 1024, 2) if s["seconds"] else 0.0,
+                }
+                for kind, s in self.per_kind.items()
+            },
+        }
+
+
+# Shared extractor used by the main loop
+attachment_extractor = AttachmentExtractor()
@@ -0,0 +1,213 @@
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from logger import logger
+from GmailAutomation.app_context import app
+from GmailAutomation.metrics import metrics
+from GmailAutomation.quota import gmail_quota
+
+# ------------------------------------------------------------
+# Content-addressed attachment store
+# ------------------------------------------------------------
+ATTACHMENT_STORE_DIR = os.getenv("ATTACHMENT_STORE_DIR", "attachments_cache")
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", 20 * 1024 * 1024))
+MAX_MESSAGE_ATTACHMENT_BYTES = int(os.getenv("MAX_MESSAGE_ATTACHMENT_BYTES", 35 * 1024 * 1024))
+ATTACHMENT_STORE_BUDGET_BYTES = int(os.getenv("ATTACHMENT_STORE_BUDGET_BYTES", 512 * 1024 * 1024))
+DECODE_CHUNK_CHARS = 1024 * 1024  # multiple of 4, so every chunk is valid base64 on its own
+MAX_TRACKED_REFS = 10000  # remembered (message_id, attachment_id) -> digest mappings
+
+ATTACHMENT_DOWNLOAD = metrics.stage("attachment_download")  # attachments.get + decode to disk
+ATTACHMENT_BYTES = metrics.counter("attachment_downloaded_bytes_total", "Attachment bytes downloaded from Gmail")
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class AttachmentStore:
+    """
+    Stores attachments on disk keyed by the SHA-256 of their content.
+
+    - the same logo/signature image sent with many emails is stored once
+    - an attachment already fetched for a message is never downloaded again
+    - base64 payloads are decoded to disk in chunks, so there is never a
+      second full in-memory copy of the file
+    - per-file and per-message size limits are checked from the part size
+      before downloading
+    - least recently used blobs are evicted once the store exceeds its byte budget
+    """
+
+    def __init__(
+        self,
+        root: str = ATTACHMENT_STORE_DIR,
+        max_file_bytes: int = MAX_ATTACHMENT_BYTES,
+        max_message_bytes: int = MAX_MESSAGE_ATTACHMENT_BYTES,
+        budget_bytes: int = ATTACHMENT_STORE_BUDGET_BYTES,
+    ):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.max_message_bytes = max_message_bytes
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._blobs = OrderedDict()  # digest -> {"path", "size"}, least recently used first
+        self._refs = OrderedDict()  # (message_id, attachment_id) -> digest
+        self.total_bytes = 0
+
+        self.downloads = 0
+        self.downloaded_bytes = 0
+        self.ref_hits = 0
+        self.dedup_hits = 0
+        self.evictions = 0
+        self.rejected = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Rebuild the index from disk, oldest access first."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isfile(path) and not name.startswith("."):
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name.split(".", 1)[0], path, stat.st_size))
+        for _, digest, path, size in sorted(entries):
+            self._blobs[digest] = {"path": path, "size": size}
+            self.total_bytes += size
+
+    # ---------------- public API ----------------
+    def fetch(self, service, message_id: str, att: dict, pinned=()) -> dict:
+        """
+        Return {"digest", "path", "size"} for one attachment of a message,
+        downloading it only if it is not already in the store.
+        """
+        key = (message_id, att["attachmentId"])
+        with self._lock:
+            digest = self._refs.get(key)
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                self.ref_hits += 1
+                return {"digest": digest, **self._blobs[digest]}
+
+        declared = att.get("size") or 0
+        if declared > self.max_file_bytes:
+            self.rejected += 1
+            raise AttachmentTooLarge(f"{att['filename']} is {declared} bytes (limit {self.max_file_bytes})")
+
+        gmail_quota.charge("users.messages.attachments.get")
+        with ATTACHMENT_DOWNLOAD.time():
+            response = (
+                service.users()
+                .messages()
+                .attachments()
+                .get(userId="me", messageId=message_id, id=att["attachmentId"])
+                .execute()
+            )
+            digest, tmp_path, size = self._decode_to_disk(response.pop("data"))
+        ATTACHMENT_BYTES.inc(size)
+        self.downloads += 1
+        self.downloaded_bytes += size
+
+        with self._lock:
+            if digest in self._blobs:
+                os.remove(tmp_path)
+                self.dedup_hits += 1
+                self._blobs.move_to_end(digest)
+            else:
+                ext = os.path.splitext(att["filename"])[1].lower()
+                path = os.path.join(self.root, digest + ext)
+                os.replace(tmp_path, path)
+                self._blobs[digest] = {"path": path, "size": size}
+                self.total_bytes += size
+                self._evict(pinned=set(pinned) | {digest})
+            self._refs[key] = digest
+            if len(self._refs) > MAX_TRACKED_REFS:
+                self._refs.popitem(last=False)
+            return {"digest": digest, **self._blobs[digest]}
+
+    def materialize(self, service, email: dict) -> list:
+        """
+        Fetch every attachment of an email and return the `attachment_data`
+        list for the agent. Attachments over the per-file or per-message
+        limit are listed with a "skipped" reason instead of a path.
+        """
+        attachment_data = []
+        pinned = set()
+        message_bytes = 0
+        for att in email.get("attachments", []):
+            entry = {"filename": att["filename"], "mimeType": att["mimeType"]}
+            declared = att.get("size") or 0
+            if message_bytes + declared > self.max_message_bytes:
+                self.rejected += 1
+                entry["skipped"] = f"message attachment limit of {self.max_message_bytes} bytes reached"
+                attachment_data.append(entry)
+                continue
+            try:
+                # A merged follow-up (thread_coalescer) keeps the id of the message each attachment came from
+                blob = self.fetch(service, att.get("messageId", email["id"]), att, pinned=pinned)
+            except AttachmentTooLarge as e:
+                entry["skipped"] = str(e)
+                attachment_data.append(entry)
+                continue
+            pinned.add(blob["digest"])
+            message_bytes += blob["size"]
+            entry.update({"path": blob["path"], "digest": blob["digest"], "size": blob["size"]})
+            attachment_data.append(entry)
+            logger.info(f"📎 Attachment ready: {att['filename']} -> {blob['path']}")
+        return attachment_data
+
+    # ---------------- internals ----------------
+    def _decode_to_disk(self, data: str):
+        """Decode base64url `data` into a temp file chunk by chunk while hashing it."""
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".download-")
+        with os.fdopen(fd, "wb") as f:
+            for start in range(0, len(data), DECODE_CHUNK_CHARS):
+                chunk = data[start:start + DECODE_CHUNK_CHARS]
+                if start + DECODE_CHUNK_CHARS >= len(data):
+                    chunk += "=" * (-len(chunk) % 4)
+                decoded = base64.urlsafe_b64decode(chunk)
+                sha.update(decoded)
+                f.write(decoded)
+                size += len(decoded)
+                if size > self.max_file_bytes:
+                    f.close()
+                    os.remove(tmp_path)
+                    self.rejected += 1
+                    raise AttachmentTooLarge(f"attachment exceeds {self.max_file_bytes} bytes")
+        return sha.hexdigest(), tmp_path, size
+
+    def _evict(self, pinned):
+        for digest in list(self._blobs):
+            if self.total_bytes <= self.budget_bytes:
+                break
+            if digest in pinned:
+                continue
+            blob = self._blobs.pop(digest)
+            self.total_bytes -= blob["size"]
+            self.evictions += 1
+            try:
+                os.remove(blob["path"])
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "blobs": len(self._blobs),
+            "total_bytes": self.total_bytes,
+            "downloads": self.downloads,
+            "downloaded_bytes": self.downloaded_bytes,
+            "ref_hits": self.ref_hits,
+            "dedup_hits": self.dedup_hits,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+        }
+
+
+# Shared store used by the main loop, indexed on first use (`app.attachment_store`)
+app.register("attachment_store", AttachmentStore)
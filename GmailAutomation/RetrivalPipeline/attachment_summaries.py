@@ -0,0 +1,161 @@
+import csv
+import io
+import os
+import struct
+import time
+
+# ------------------------------------------------------------
+# Attachment summaries, run in the extraction pool's workers
+# ------------------------------------------------------------
+# Workers are spawned, so each one imports this module again: only the
+# standard library is imported here (no logger, nothing from the pipeline),
+# and the optional parsers (`uv sync --extra attachments`) are imported by
+# the summarizer that needs them.
+MAX_SUMMARY_CHARS = 2000
+HEAD_ROWS = 5
+PDF_MAX_PAGES = 5
+
+CSV_TYPES = {"text/csv", "application/csv", "text/comma-separated-values"}
+EXCEL_TYPES = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.ms-excel",
+}
+TEXT_TYPES = {"text/plain", "application/json", "text/markdown"}
+
+
+def attachment_kind(mime_type: str, filename: str) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if mime_type in CSV_TYPES or ext == ".csv":
+        return "csv"
+    if mime_type in EXCEL_TYPES or ext in (".xlsx", ".xlsm", ".xls"):
+        return "excel"
+    if mime_type == "application/pdf" or ext == ".pdf":
+        return "pdf"
+    if (mime_type or "").startswith("image/"):
+        return "image"
+    if mime_type in TEXT_TYPES or ext in (".txt", ".log", ".json", ".md"):
+        return "text"
+    return "other"
+
+
+def _bounded(text: str) -> str:
+    text = text.strip()
+    return text if len(text) <= MAX_SUMMARY_CHARS else text[:MAX_SUMMARY_CHARS] + " …[truncated]"
+
+
+def summarize_csv(path: str) -> str:
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        head = [row for _, row in zip(range(HEAD_ROWS), reader)]
+        rows = len(head) + sum(1 for _ in reader)
+    lines = [f"CSV: {rows} data row(s), {len(header)} column(s)", f"columns: {', '.join(header)}"]
+    lines += [" | ".join(row) for row in head]
+    return "\n".join(lines)
+
+
+def summarize_excel(path: str) -> str:
+    try:
+        import openpyxl
+    except ImportError:
+        return "Excel file (install openpyxl to extract its contents)"
+    if path.lower().endswith(".xls"):
+        return "Legacy .xls workbook (only .xlsx/.xlsm can be read)"
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    lines = []
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, ())
+            head = [row for _, row in zip(range(HEAD_ROWS), rows)]
+            lines.append(f"Sheet '{sheet.title}': {sheet.max_row or 0} row(s), {len(header)} column(s)")
+            lines.append(f"columns: {', '.join('' if c is None else str(c) for c in header)}")
+            lines += [" | ".join("" if c is None else str(c) for c in row) for row in head]
+    finally:
+        workbook.close()
+    return "\n".join(lines)
+
+
+def summarize_pdf(path: str) -> str:
+    try:
+        import pypdf
+    except ImportError:
+        return "PDF document (install pypdf to extract its text)"
+    reader = pypdf.PdfReader(path)
+    pages = len(reader.pages)
+    text = []
+    for page in reader.pages[:PDF_MAX_PAGES]:
+        text.append(page.extract_text() or "")
+        if sum(len(t) for t in text) > MAX_SUMMARY_CHARS:
+            break
+    return f"PDF: {pages} page(s)\n" + "\n".join(text)
+
+
+def _image_size_from_header(path: str):
+    """Read (format, width, height) from PNG/GIF/JPEG headers without decoding the image."""
+    with open(path, "rb") as f:
+        head = f.read(26)
+        if head[:8] == b"\x89PNG\r\n\x1a\n":
+            width, height = struct.unpack(">II", head[16:24])
+            return "PNG", width, height
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", head[6:10])
+            return "GIF", width, height
+        if head[:2] == b"\xff\xd8":
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                length = struct.unpack(">H", f.read(2))[0]
+                if marker[1] in (0xC0, 0xC1, 0xC2):
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return "JPEG", width, height
+                f.seek(length - 2, io.SEEK_CUR)
+            return "JPEG", None, None
+    return None, None, None
+
+
+def summarize_image(path: str) -> str:
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        with Image.open(path) as img:
+            return f"Image: {img.format}, {img.width}x{img.height}, mode {img.mode}"
+    fmt, width, height = _image_size_from_header(path)
+    if fmt and width:
+        return f"Image: {fmt}, {width}x{height}"
+    return f"Image: {fmt or 'unknown format'}"
+
+
+def summarize_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read(MAX_SUMMARY_CHARS + 1)
+
+
+SUMMARIZERS = {
+    "csv": summarize_csv,
+    "excel": summarize_excel,
+    "pdf": summarize_pdf,
+    "image": summarize_image,
+    "text": summarize_text,
+}
+
+
+def extract_summary(path: str, mime_type: str, filename: str):
+    """
+    Worker entry point (runs in the process pool).
+    Returns (kind, summary, elapsed_seconds, bytes_processed).
+    """
+    start = time.perf_counter()
+    kind = attachment_kind(mime_type, filename)
+    summarizer = SUMMARIZERS.get(kind)
+    size = 0
+    try:
+        size = os.path.getsize(path)  # a blob evicted from the store since it was downloaded fails here
+        summary = summarizer(path) if summarizer else f"Unsupported attachment type ({mime_type})"
+    except Exception as e:
+        summary = f"Could not read {kind} attachment: {e}"
+    return kind, _bounded(summary), time.perf_counter() - start, size
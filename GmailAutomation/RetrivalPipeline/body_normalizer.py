@@ -0,0 +1,144 @@
+import base64
+import html
+import re
+
+"""
+Body Normalizer:
+Turns the payload of a Gmail message into the clean text the agent sees.
+- text/plain parts are preferred; text/html is converted only when there is no plain part
+- quoted replies ("On ... wrote:", Outlook "From:/Sent:/To:/Subject:" blocks, "> " lines) are dropped
+- all patterns are compiled once and every step is a single linear pass over the text
+"""
+
+# Lines that start a previous message in the thread
+QUOTE_HEADER_PREFIXES = ("From: ", "Sent: ", "To: ", "Subject: ", "---")
+ON_WROTE = re.compile(r"On .* wrote:$")
+
+# Anything between '<' and the next '>' (broken or real HTML tags)
+TAG = re.compile(r"<[^>]*>")
+EXTRA_NEWLINES = re.compile(r"\n{3,}")
+
+# HTML -> text
+HTML_DROP_BLOCKS = re.compile(r"<(script|style|head)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+HTML_LINE_BREAKS = re.compile(r"<br\s*/?>|</(?:p|div|tr|li|h[1-6]|blockquote)\s*>", re.IGNORECASE)
+HTML_QUOTE_BLOCK = re.compile(r"<blockquote\b.*?</blockquote\s*>", re.IGNORECASE | re.DOTALL)
+HTML_GMAIL_QUOTE = re.compile(r"<div[^>]*class=\"?gmail_quote[^>]*>.*", re.IGNORECASE | re.DOTALL)
+HORIZONTAL_SPACE = re.compile(r"[ \t\xa0]+")
+
+
+def decode_data(data: str) -> str:
+    """Decode a Gmail base64url body into text."""
+    return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+
+
+def normalize_newlines(text: str) -> str:
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def strip_tags(text: str) -> str:
+    """
+    Remove '<...>' sequences. Only the text up to the last '>' is scanned,
+    so a stray '<' without a closing '>' cannot make the scan quadratic.
+    """
+    last = text.rfind(">")
+    if last == -1:
+        return text
+    return TAG.sub("", text[:last + 1]) + text[last + 1:]
+
+
+def html_to_text(markup: str) -> str:
+    """Convert an HTML body into plain text, dropping Gmail-quoted history."""
+    markup = HTML_DROP_BLOCKS.sub("", markup)
+    markup = HTML_GMAIL_QUOTE.sub("", markup)
+    markup = HTML_QUOTE_BLOCK.sub("", markup)
+    markup = HTML_LINE_BREAKS.sub("\n", markup)
+    text = html.unescape(strip_tags(markup))
+    return HORIZONTAL_SPACE.sub(" ", text)
+
+
+def extract_parts(parts):
+    """
+    Walk a (possibly nested) multipart payload.
+    Returns (plain_text, html_text, attachments).
+    """
+    plain, html_parts, attachments = [], [], []
+    stack = list(reversed(parts))
+    while stack:
+        part = stack.pop()
+        if "parts" in part:
+            stack.extend(reversed(part["parts"]))
+            continue
+
+        mime_type = part.get("mimeType", "")
+        part_body = part.get("body", {})
+        if "data" in part_body and not part.get("filename"):
+            if mime_type == "text/plain":
+                plain.append(normalize_newlines(decode_data(part_body["data"])))
+            elif mime_type == "text/html":
+                html_parts.append(decode_data(part_body["data"]))
+
+        # Collect attachments
+        if part.get("filename") and "attachmentId" in part_body:
+            attachments.append(
+                {
+                    "filename": part["filename"],
+                    "mimeType": mime_type,
+                    "attachmentId": part_body["attachmentId"],
+                    "size": part_body.get("size", 0),
+                }
+            )
+
+    return "".join(plain), "".join(html_parts), attachments
+
+
+def get_body_from_message(msg):
+    """Return (body, attachments) for a full Gmail message, falling back to text/html."""
+    payload = msg["payload"]
+
+    if "parts" in payload:
+        plain, html_body, attachments = extract_parts(payload["parts"])
+        if not plain and html_body:
+            plain = html_to_text(html_body)
+        return plain, attachments
+
+    # Single-part message
+    data = payload.get("body", {}).get("data")
+    if not data:
+        return "", []
+    body = decode_data(data)
+    if payload.get("mimeType") == "text/html":
+        body = html_to_text(body)
+    return body, []
+
+
+def clean_body(text: str) -> str:
+    """
+    Cleans Gmail email body:
+    - Normalize newlines (\r\n -> \n)
+    - Remove broken HTML tags
+    - Collapse multiple newlines
+    - Keep replies, but remove repeated quoted headers
+    - Strip spaces
+    """
+    if not text:
+        return ""
+    text = strip_tags(normalize_newlines(text))
+
+    cleaned_lines = []
+    append = cleaned_lines.append
+    skip_block = False
+    for line in text.split("\n"):
+        line = line.strip()
+        # Check for previous thread headers
+        if line.startswith(QUOTE_HEADER_PREFIXES) or (line.startswith("On ") and ON_WROTE.match(line)):
+            skip_block = True  # start skipping repeated thread
+            continue
+        if skip_block and line:
+            # Skip only lines fully quoted with >, reset on normal text after quotes
+            if line[0] == ">":
+                continue
+            skip_block = False
+        append(line)
+
+    # Collapse multiple newlines into max 2
+    return EXTRA_NEWLINES.sub("\n\n", "\n".join(cleaned_lines)).strip()
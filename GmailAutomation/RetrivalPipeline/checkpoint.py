@@ -0,0 +1,185 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from logger import logger
+from GmailAutomation.app_context import app
+
+# ------------------------------------------------------------
+# Durable history cursor + processed-message ledger
+# ------------------------------------------------------------
+DEFAULT_CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "gmail_checkpoint.db")
+LEDGER_RETENTION_DAYS = 14  # Gmail history IDs rarely stay valid longer than a week
+LEDGER_PRUNE_INTERVAL = 3600  # seconds between retention sweeps of a running store
+
+_STOP = object()
+
+
+class CheckpointStore:
+    """
+    SQLite-backed store for the Gmail history cursor and the IDs of
+    messages that were already processed.
+
+    All writes go through a single background writer thread, which
+    commits whatever is queued in one transaction, in order.
+    `mark_processed` only queues its row (no disk write per message);
+    `commit_cursor` is called once per consumed history page and waits, so
+    the ledger rows queued before it are committed with or before the
+    cursor and the cursor never gets ahead of the ledger. A hard kill
+    before that commit replays the page: emails whose ledger row was lost
+    are processed again, and their send markers (work_queue) keep them
+    from being answered twice. Entries older than the retention are
+    dropped at startup and every LEDGER_PRUNE_INTERVAL seconds.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self._queue = queue.Queue()
+        self._processed = {}  # message_id -> processed_at
+        self._cursors = {}
+        self._last_prune = time.time()
+
+        self.ledger_writes = 0
+        self.cursor_writes = 0
+        self.last_write_ms = 0.0
+        self.max_write_ms = 0.0
+        self.total_write_ms = 0.0
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cursor ("
+            "mailbox TEXT PRIMARY KEY, history_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "message_id TEXT PRIMARY KEY, mailbox TEXT, processed_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "DELETE FROM processed WHERE processed_at < ?",
+            (time.time() - LEDGER_RETENTION_DAYS * 86400,),
+        )
+        conn.commit()
+        self._cursors = dict(conn.execute("SELECT mailbox, history_id FROM cursor"))
+        self._processed = dict(conn.execute("SELECT message_id, processed_at FROM processed"))
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        logger.info(
+            f"💾 Checkpoint store opened at {path} "
+            f"({len(self._cursors)} cursor(s), {len(self._processed)} processed message(s))"
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------------- reads (in memory) ----------------
+    def load_cursor(self, mailbox: str):
+        return self._cursors.get(mailbox)
+
+    def is_processed(self, message_id: str) -> bool:
+        return message_id in self._processed
+
+    # ---------------- writes (background thread) ----------------
+    def mark_processed(self, message_id: str, mailbox: str = None, wait: bool = False):
+        """Record a handled message so a replay skips it; written behind, or durable on return with `wait`."""
+        if message_id in self._processed:
+            return
+        now = time.time()
+        self._processed[message_id] = now
+        done = threading.Event() if wait else None
+        self._queue.put(("processed", (message_id, mailbox, now), done))
+        if done is not None:
+            done.wait()
+
+    def commit_cursor(self, mailbox: str, history_id: str, wait: bool = True):
+        """Persist the history cursor after a batch has been fully consumed."""
+        self._cursors[mailbox] = history_id
+        if time.time() - self._last_prune >= LEDGER_PRUNE_INTERVAL:
+            self.prune()
+        done = threading.Event() if wait else None
+        self._queue.put(("cursor", (mailbox, history_id, time.time()), done))
+        if done is not None:
+            done.wait()
+
+    def prune(self):
+        """Forget ledger entries older than the retention, in memory and on disk."""
+        now = time.time()
+        cutoff = now - LEDGER_RETENTION_DAYS * 86400
+        for message_id in [m for m, processed_at in list(self._processed.items()) if processed_at < cutoff]:
+            self._processed.pop(message_id, None)
+        self._last_prune = now
+        self._queue.put(("prune", (cutoff,), None))
+
+    def close(self):
+        self._queue.put((_STOP, None, None))
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            items = [self._queue.get()]
+            # Drain whatever else is queued and write it in one transaction
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            stop = False
+            try:
+                for kind, row, _ in items:
+                    if kind is _STOP:
+                        stop = True
+                    elif kind == "processed":
+                        conn.execute(
+                            "INSERT OR IGNORE INTO processed (message_id, mailbox, processed_at) VALUES (?, ?, ?)",
+                            row,
+                        )
+                        self.ledger_writes += 1
+                    elif kind == "cursor":
+                        conn.execute(
+                            "INSERT INTO cursor (mailbox, history_id, updated_at) VALUES (?, ?, ?) "
+                            "ON CONFLICT(mailbox) DO UPDATE SET history_id=excluded.history_id, "
+                            "updated_at=excluded.updated_at",
+                            row,
+                        )
+                        self.cursor_writes += 1
+                    elif kind == "prune":
+                        conn.execute("DELETE FROM processed WHERE processed_at < ?", row)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"⚠️ Checkpoint write failed: {e}")
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.last_write_ms = elapsed_ms
+                self.max_write_ms = max(self.max_write_ms, elapsed_ms)
+                self.total_write_ms += elapsed_ms
+                for _, _, done in items:
+                    if done is not None:
+                        done.set()
+
+            if stop:
+                conn.close()
+                return
+
+    def stats(self) -> dict:
+        return {
+            "processed_ids": len(self._processed),
+            "ledger_writes": self.ledger_writes,
+            "cursor_writes": self.cursor_writes,
+            "pending_writes": self._queue.qsize(),
+            "last_write_ms": round(self.last_write_ms, 3),
+            "max_write_ms": round(self.max_write_ms, 3),
+            "total_write_ms": round(self.total_write_ms, 3),
+        }
+
+
+# Shared store used by the retrieval pipeline and main loop, opened on first use (`app.checkpoint_store`)
+app.register("checkpoint_store", CheckpointStore)
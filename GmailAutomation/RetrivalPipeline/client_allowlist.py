@@ -0,0 +1,164 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parseaddr
+
+from logger import logger
+from GmailAutomation.db import fetch_client_emails, fetch_client_emails_updated_since, invalidate_client
+
+# ------------------------------------------------------------
+# Client Allowlist
+# ------------------------------------------------------------
+DEFAULT_TTL_SECONDS = 300  # full reload of the clients table
+DEFAULT_DELTA_INTERVAL_SECONDS = 30  # incremental updated_at refresh
+DELTA_OVERLAP_SECONDS = 5  # re-read a small window to absorb clock skew
+
+
+def normalize_address(value: str) -> str:
+    """
+    Normalize an email header value or address for lookups:
+    'Jane Doe <Jane.Doe@Example.com>' -> 'jane.doe@example.com'
+    """
+    if not value:
+        return ""
+    _, address = parseaddr(value)
+    return (address or value).strip().lower()
+
+
+class ClientAllowlist:
+    """
+    In-memory set of client contact emails.
+
+    Loads the 'clients' table once, answers membership checks in O(1),
+    and keeps itself fresh with a full reload every `ttl_seconds` plus
+    cheaper `updated_at` deltas every `delta_interval_seconds`.
+    Clients seen in a delta are passed to `on_change`, which by default
+    drops their cached personality/client/project rows in `db`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        delta_interval_seconds: float = DEFAULT_DELTA_INTERVAL_SECONDS,
+        loader=fetch_client_emails,
+        delta_loader=fetch_client_emails_updated_since,
+        on_change=invalidate_client,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.delta_interval_seconds = delta_interval_seconds
+        self._loader = loader
+        self._delta_loader = delta_loader
+        self._on_change = on_change
+        self._lock = threading.Lock()
+
+        self._emails = frozenset()
+        self._loaded_at = None  # monotonic time of the last full load
+        self._delta_at = None  # monotonic time of the last delta
+        self._delta_cursor = None  # ISO timestamp for the next updated_at query
+
+        self.hits = 0
+        self.misses = 0
+        self.full_refreshes = 0
+        self.delta_refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_ms = 0.0
+        self.total_refresh_ms = 0.0
+
+    def __contains__(self, sender: str) -> bool:
+        self.ensure_fresh()
+        if normalize_address(sender) in self._emails:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self._emails)
+
+    def ensure_fresh(self):
+        """Reload or apply a delta if the cached set is stale."""
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl_seconds:
+            self.refresh(full=True)
+        elif (
+            self._delta_loader is not None
+            and now - self._delta_at >= self.delta_interval_seconds
+        ):
+            self.refresh(full=False)
+
+    def invalidate(self):
+        """Force a full reload on the next lookup."""
+        with self._lock:
+            self._loaded_at = None
+
+    def refresh(self, full: bool = True):
+        with self._lock:
+            start = time.perf_counter()
+            started_at = datetime.now(timezone.utc)
+            try:
+                if full or self._delta_cursor is None:
+                    emails = {normalize_address(e) for e in self._loader() if e}
+                    self._emails = frozenset(emails)
+                    self._loaded_at = time.monotonic()
+                    self.full_refreshes += 1
+                    cursor = started_at
+                else:
+                    rows = self._delta_loader(self._delta_cursor)
+                    added = {normalize_address(r.get("contact_email")) for r in rows if r.get("contact_email")}
+                    if added:
+                        self._emails = self._emails | added
+                    if self._on_change is not None:
+                        for row in rows:
+                            if row.get("contact_email"):
+                                self._on_change(row["contact_email"])
+                    self.delta_refreshes += 1
+                    stamps = [_parse_timestamp(r.get("updated_at")) for r in rows]
+                    cursor = max([s for s in stamps if s] + [started_at])
+                self._delta_cursor = (cursor - timedelta(seconds=DELTA_OVERLAP_SECONDS)).isoformat()
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.error(f"⚠️ Client allowlist refresh failed (full={full}): {e}")
+                if self._loaded_at is None:
+                    raise
+                if full:
+                    # Keep serving the old set and retry after one delta interval
+                    self._loaded_at = time.monotonic() - self.ttl_seconds + self.delta_interval_seconds
+                else:
+                    # Deltas are optional (e.g. no updated_at column); rely on the TTL reload
+                    self._delta_loader = None
+            finally:
+                self._delta_at = time.monotonic()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.last_refresh_ms = elapsed_ms
+                self.total_refresh_ms += elapsed_ms
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._emails),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "full_refreshes": self.full_refreshes,
+            "delta_refreshes": self.delta_refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_ms": round(self.last_refresh_ms, 2),
+            "total_refresh_ms": round(self.total_refresh_ms, 2),
+        }
+
+
+def _parse_timestamp(value: str):
+    """Parse a Supabase timestamp, returning None if it is missing or malformed."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+# Shared allowlist used by the retrieval pipeline
+client_allowlist = ClientAllowlist()
@@ -0,0 +1,119 @@
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from logger import logger
+from GmailAutomation.quota import GMAIL_QUOTA_UNITS, gmail_quota
+
+# ------------------------------------------------------------
+# Adaptive polling
+# ------------------------------------------------------------
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", 3))  # idle interval after new mail
+POLL_BURST_INTERVAL = float(os.getenv("POLL_BURST_INTERVAL", 0.5))  # while mail keeps arriving
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 60))  # ceiling for idle backoff
+RATE_LIMIT_BACKOFF = 10.0  # used when a 429/503 carries no Retry-After
+
+# Units spent by one empty poll cycle (getProfile + history.list)
+POLL_CYCLE_UNITS = GMAIL_QUOTA_UNITS["users.getProfile"] + GMAIL_QUOTA_UNITS["users.history.list"]
+
+
+def parse_retry_after(value) -> float:
+    """Parse a Retry-After header (seconds or HTTP date). Returns None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptivePollScheduler:
+    """
+    Decides how long to wait before the next poll:
+    - polls every `burst_interval` while cycles keep returning mail
+    - backs off exponentially (with jitter) from `base_interval` to
+      `max_interval` while the mailbox is idle
+    - honors Retry-After after a 429/503
+    - never polls faster than the Gmail quota bucket can pay for
+    """
+
+    def __init__(
+        self,
+        base_interval: float = POLL_INTERVAL,
+        burst_interval: float = POLL_BURST_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        quota=gmail_quota,
+    ):
+        self.base_interval = base_interval
+        self.burst_interval = burst_interval
+        self.max_interval = max_interval
+        self.quota = quota
+
+        self._idle_streak = 0
+        self._retry_after = None
+        self._next_delay = base_interval
+
+        self.cycles = 0
+        self.decisions = {"burst": 0, "idle": 0, "rate_limited": 0, "quota": 0}
+        self.rate_limits = 0
+        self.total_sleep_seconds = 0.0
+        self.last_decision = {}
+
+    def note_rate_limited(self, retry_after: float = None):
+        """Record a 429/503 so the next delay honors Retry-After."""
+        self.rate_limits += 1
+        self._retry_after = retry_after if retry_after is not None else RATE_LIMIT_BACKOFF
+        logger.warning(f"⏳ Rate limit hit, next poll in {self._retry_after:.1f}s")
+
+    def record_cycle(self, emails_found: int) -> float:
+        """Decide the delay before the next poll based on this cycle's outcome."""
+        self.cycles += 1
+        if self._retry_after is not None:
+            reason, delay = "rate_limited", self._retry_after
+            self._retry_after = None
+        elif emails_found:
+            self._idle_streak = 0
+            reason, delay = "burst", self.burst_interval
+        else:
+            ceiling = min(self.max_interval, self.base_interval * (2 ** self._idle_streak))
+            if ceiling < self.max_interval:  # stop doubling at the ceiling, or 2 ** streak overflows a float
+                self._idle_streak += 1
+            reason, delay = "idle", random.uniform(ceiling / 2, ceiling)
+
+        quota_delay = self.quota.time_until(POLL_CYCLE_UNITS) if self.quota is not None else 0.0
+        if quota_delay > delay:
+            reason, delay = "quota", quota_delay
+
+        self.decisions[reason] += 1
+        self._next_delay = delay
+        self.last_decision = {
+            "reason": reason,
+            "delay": round(delay, 3),
+            "emails_found": emails_found,
+            "idle_streak": self._idle_streak,
+        }
+        return delay
+
+    def wait(self):
+        """Sleep for the delay chosen by the last `record_cycle` call."""
+        self.total_sleep_seconds += self._next_delay
+        time.sleep(self._next_delay)
+
+    def stats(self) -> dict:
+        return {
+            "cycles": self.cycles,
+            "decisions": dict(self.decisions),
+            "rate_limits": self.rate_limits,
+            "total_sleep_seconds": round(self.total_sleep_seconds, 1),
+            "last_decision": self.last_decision,
+            "quota": self.quota.stats() if self.quota is not None else {},
+        }
+
+
+# Shared scheduler used by the main poll loop
+poll_scheduler = AdaptivePollScheduler()
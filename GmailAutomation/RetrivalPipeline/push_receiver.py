@@ -0,0 +1,196 @@
+import base64
+import ipaddress
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from googleapiclient.errors import HttpError
+
+from logger import logger
+from GmailAutomation.quota import gmail_quota
+
+# ------------------------------------------------------------
+# Push notification ingestion (Gmail watch -> Pub/Sub push)
+# ------------------------------------------------------------
+PUSH_HOST = os.getenv("PUSH_HOST", "127.0.0.1")  # put a proxy in front, or bind wider with a verification token
+PUSH_PORT = int(os.getenv("PUSH_PORT", 8085))
+PUSH_PATH = os.getenv("PUSH_PATH", "/gmail/push")
+PUSH_VERIFICATION_TOKEN = os.getenv("PUSH_VERIFICATION_TOKEN")  # expected ?token=... on the push URL
+PUSH_TOPIC = os.getenv("PUSH_TOPIC")  # projects/<project>/topics/<topic> for users.watch
+PUSH_FALLBACK_POLL_INTERVAL = float(os.getenv("PUSH_FALLBACK_POLL_INTERVAL", 300))  # safety-net poll
+WATCH_RENEW_SECONDS = 24 * 3600  # Gmail recommends renewing the watch once a day
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def decode_push_payload(payload) -> dict:
+    """
+    Decode a Pub/Sub push body:
+    {"message": {"data": base64({"emailAddress": ..., "historyId": ...})}, "subscription": ...}
+    Raises ValueError if it does not have that shape.
+    """
+    message = payload.get("message") if isinstance(payload, dict) else None
+    data = message.get("data") if isinstance(message, dict) else None
+    if not isinstance(data, str):
+        raise ValueError('expected {"message": {"data": "<base64>"}}')
+    decoded = json.loads(base64.b64decode(data + "=" * (-len(data) % 4)))
+    history_id = str(decoded.get("historyId", "")) if isinstance(decoded, dict) else ""
+    if not history_id.isdigit():
+        raise ValueError(f"notification has no numeric historyId: {decoded!r:.200}")
+    return {"emailAddress": decoded.get("emailAddress"), "historyId": history_id}
+
+
+class PushReceiver:
+    """
+    Small HTTP receiver for Gmail push notifications.
+
+    Each notification carries the mailbox historyId. A notification only
+    wakes the main loop if its historyId is newer than the current history
+    cursor (`cursor()`) and the newest one already seen, so duplicate and
+    out-of-order deliveries are acknowledged without triggering a fetch.
+    """
+
+    def __init__(
+        self,
+        host: str = PUSH_HOST,
+        port: int = PUSH_PORT,
+        path: str = PUSH_PATH,
+        verification_token: str = PUSH_VERIFICATION_TOKEN,
+        cursor=None,
+    ):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.verification_token = verification_token
+        self._cursor = cursor
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+        self._server = None
+
+        self.latest_history_id = None
+        self.received = 0
+        self.triggers = 0
+        self.stale = 0
+        self.rejected = 0
+        self.fallback_polls = 0
+
+    # ---------------- HTTP side ----------------
+    def start(self):
+        if not self.verification_token and not is_loopback(self.host):
+            # Anyone who can reach the port could trigger polls
+            raise ValueError(f"PUSH_VERIFICATION_TOKEN is required to listen on {self.host}")
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                status = receiver.handle_request(self.path, self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="push-receiver", daemon=True).start()
+        logger.info(f"🔔 Push receiver listening on http://{self.host}:{self.port}{self.path}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def handle_request(self, raw_path: str, body: bytes) -> int:
+        """Validate and record one push delivery. Returns the HTTP status to answer with."""
+        url = urlparse(raw_path)
+        if url.path != self.path:
+            return 404
+        if self.verification_token and parse_qs(url.query).get("token", [None])[0] != self.verification_token:
+            self.rejected += 1
+            return 403
+        try:
+            notification = decode_push_payload(json.loads(body))
+        except ValueError as e:  # also bad JSON, base64 and UTF-8
+            # Pub/Sub retries it with backoff until the message expires (or moves it to a dead-letter topic)
+            self.rejected += 1
+            logger.warning(f"⚠️ Rejecting malformed push payload: {e}")
+            return 400
+
+        self.received += 1
+        self.notify(notification["historyId"])
+        return 204
+
+    # ---------------- main loop side ----------------
+    def notify(self, history_id: str):
+        history_id = int(history_id)
+        with self._lock:
+            cursor = self._cursor() if self._cursor else None
+            newest = max(int(cursor or 0), int(self.latest_history_id or 0))
+            if history_id <= newest:
+                self.stale += 1
+                return
+            self.latest_history_id = history_id
+            self.triggers += 1
+        self._changed.set()
+
+    def wait_for_change(self, timeout: float = PUSH_FALLBACK_POLL_INTERVAL) -> bool:
+        """
+        Block until a notification reports new history, or until `timeout`
+        expires (safety-net poll). Returns True if woken by a notification.
+        """
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        if not changed:
+            self.fallback_polls += 1
+        return changed
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "triggers": self.triggers,
+            "stale": self.stale,
+            "rejected": self.rejected,
+            "fallback_polls": self.fallback_polls,
+            "latest_history_id": self.latest_history_id,
+        }
+
+
+class GmailWatch:
+    """Keeps a Gmail users.watch registration alive for a Pub/Sub topic."""
+
+    def __init__(self, topic: str = PUSH_TOPIC, label_ids=None):
+        self.topic = topic
+        self.label_ids = label_ids or ["INBOX"]
+        self.renewed_at = None
+        self.expiration = None
+
+    def ensure(self, service):
+        """Register or renew the watch if it is missing or due for renewal."""
+        if not self.topic:
+            return
+        if self.renewed_at is not None and time.monotonic() - self.renewed_at < WATCH_RENEW_SECONDS:
+            return
+        gmail_quota.charge("users.watch")
+        try:
+            response = (
+                service.users()
+                .watch(userId="me", body={"topicName": self.topic, "labelIds": self.label_ids})
+                .execute()
+            )
+        except HttpError as error:
+            logger.error(f"⚠️ Gmail watch registration failed, relying on fallback polling: {error}")
+            return
+        self.renewed_at = time.monotonic()
+        self.expiration = response.get("expiration")
+        logger.info(f"🔔 Gmail watch active on {self.topic}, historyId={response.get('historyId')}")
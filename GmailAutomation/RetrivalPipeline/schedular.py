@@ -6,12 +6,28 @@ import time
 from logger import logger
 from datetime import datetime
 from googleapiclient.errors import HttpError
-from GmailAutomation.db import fetch_client_emails
+from GmailAutomation.app_context import app
+from GmailAutomation.RetrivalPipeline.body_normalizer import clean_body, get_body_from_message
+from GmailAutomation.RetrivalPipeline.client_allowlist import client_allowlist
+from GmailAutomation.RetrivalPipeline.poll_scheduler import parse_retry_after, poll_scheduler
+from GmailAutomation.metrics import metrics
+from GmailAutomation.quota import gmail_quota
 
 # ------------------------------------------------------------
 # Polling Logic
 # ------------------------------------------------------------
 last_history_id = None
+BATCH_SIZE = 50  # Gmail allows up to 100 calls per batch but recommends 50 or fewer
+MAX_RETRIES = 3  # per-message retries for sub-requests that failed inside a batch
+MAX_FETCH_FAILURES = 5  # polls a message may fail to download before it is skipped
+FETCH_GIVE_UP_AFTER = 3600  # ... and seconds since its first failure, so an outage does not drop mail
+_fetch_failures = {}  # message_id -> (failed polls, time of the first failure)
+
+HISTORY_FETCH = metrics.stage("history_fetch")
+MESSAGE_GET = metrics.stage("message_get")  # one batch (or single retry) of messages.get
+BODY_CLEAN = metrics.stage("body_clean")
+MESSAGES_FETCHED = metrics.counter("messages_fetched_total", "Full messages downloaded")
+MESSAGES_SKIPPED = metrics.counter("messages_unfetchable_total", "Messages skipped after failing to download on every poll")
 
 """
 Symbol Handling Helper if needed in future:
@@ -25,218 +41,256 @@ SYMBOL -> Result
 """
 # ======================
 """
-Body Formater:
-Feched irrelevant -> replace with
-\n>>> -> \n
-\n\r -> \n
-'   ' -> ' ' (single space)
+Body Formater: see body_normalizer.py
 """
 
 def fetch_new_emails(service):
+    """Fetch all new client emails as a list (see iter_new_emails)."""
+    return list(iter_new_emails(service))
+
+
+def iter_new_emails(service):
+    """Yield new client emails one at a time (see iter_new_email_batches)."""
+    for batch in iter_new_email_batches(service):
+        yield from batch
+
+
+def iter_new_email_batches(service):
+    """
+    Yield lists of new client emails, following every history.list page.
+
+    Messages are fetched in batches of BATCH_SIZE so at most one batch of
+    full messages is held in memory. The history cursor only advances after
+    every email of a page has been yielded (i.e. consumed by the caller), so
+    an error mid-page re-reads that page on the next poll. The cursor is
+    persisted in the checkpoint store, and messages already recorded in its
+    ledger are skipped, so a restart resumes exactly where it stopped.
+    """
     global last_history_id
+    profile = None
     try:
+        gmail_quota.charge("users.getProfile")
         profile = service.users().getProfile(userId="me").execute()
         new_email = profile["emailAddress"]
 
+        if last_history_id is None:
+            last_history_id = app.checkpoint_store.load_cursor(new_email)
+            if last_history_id is not None:
+                logger.info(f"✅ Gmail Trigger resumed for {new_email}, historyId={last_history_id}")
+
         if last_history_id is None:
             last_history_id = profile["historyId"]
+            app.checkpoint_store.commit_cursor(new_email, last_history_id)
             logger.info(f"✅ Gmail Trigger initialized for {new_email}, historyId={last_history_id}")
-            return []
-
-        history = (
-            service.users()
-            .history()
-            .list(userId="me", startHistoryId=last_history_id, historyTypes=["messageAdded"])
-            .execute()
-        )
-
-        messages = []
-        if "history" in history:
-            for record in history["history"]:
-                if "messagesAdded" in record:
-                    for msg in record["messagesAdded"]:
-                        msg_id = msg["message"]["id"]
-                        
-                        # Fetch client emails once
-                        client_emails = fetch_client_emails()
-                        
-                        full_msg = (
-                            service.users()
-                            .messages()
-                            .get(
-                                userId="me",
-                                id=msg_id,
-                                format="full",
-                                metadataHeaders=["Subject", "From", "LabelIds", "Date"],
-                            )
-                            .execute()
-                        )
-
-                        def extract_parts(parts, body="", attachments=None):
-                            if attachments is None:
-                                attachments = []
-
-                            for part in parts:
-                                mime_type = part.get("mimeType", "")
-                                part_body = part.get("body", {})
-
-                                # If this part has sub-parts (multipart/*), go deeper
-                                if "parts" in part:
-                                    body, attachments = extract_parts(part["parts"], body, attachments)
-                                else:
-                                    # Extract text content
-                                    if mime_type == "text/plain" and "data" in part_body:
-                                        decoded = base64.urlsafe_b64decode(part_body["data"]).decode(
-                                            "utf-8", errors="ignore"
-                                        )
-                                        decoded = decoded.replace("\r\n", "\n").replace("\r", "\n")
-                                        body += decoded
-
-                                    # Collect attachments
-                                    if part.get("filename") and "attachmentId" in part_body:
-                                        attachments.append(
-                                            {
-                                                "filename": part["filename"],
-                                                "mimeType": mime_type,
-                                                "attachmentId": part_body["attachmentId"],
-                                            }
-                                        )
-
-                            return body, attachments
-
-                        def get_body_from_message(msg):
-                            payload = msg["payload"]
-                            body = ""
-                            attachments = []
-
-                            if "parts" in payload:
-                                body, attachments = extract_parts(payload["parts"])
-
-                            else:
-                                # Single-part message
-                                body = payload["body"].get("data")
-                                if body:
-                                    body = base64.urlsafe_b64decode(body).decode("utf-8")
-
-                            return body, attachments
-
-                        def clean_body(text):
-                            """
-                            Cleans Gmail email body:
-                            - Normalize newlines (\r\n -> \n)
-                            - Remove broken HTML tags
-                            - Collapse multiple newlines
-                            - Keep replies, but remove repeated quoted headers
-                            - Strip spaces
-                            """
-
-                            # Normalize newlines
-                            text = text.replace("\r\n", "\n").replace("\r", "\n")
-
-                            # Remove broken HTML tags like <\n> or <>
-                            text = re.sub(r"<\s*[^>]*>", "", text)
-
-                            lines = text.split("\n")
-                            cleaned_lines = []
-                            skip_block = False
-
-                            # Patterns that indicate start of previous messages
-                            quote_headers = [
-                                r"^On .* wrote:$",
-                                r"^From: .*",
-                                r"^Sent: .*",
-                                r"^To: .*",
-                                r"^Subject: .*",
-                                r"^---+",  # for "---Original Message---"
-                            ]
-
-                            for line in lines:
-                                line = line.strip()
-                                # Check for previous thread headers
-                                if any(re.match(p, line) for p in quote_headers):
-                                    skip_block = True  # start skipping repeated thread
-                                    continue
-                                # Skip only lines fully quoted with >
-                                if skip_block and re.match(r"^>+", line):
-                                    continue
-                                # Reset skip if it's normal text after quotes
-                                if skip_block and line and not line.startswith(">"):
-                                    skip_block = False
-
-                                cleaned_lines.append(line)
-
-                            # Collapse multiple newlines into max 2
-                            cleaned_text = "\n".join(cleaned_lines)
-                            cleaned_text = re.sub(r"\n{3,}", "\n\n", cleaned_text)
-                            cleaned_text = cleaned_text.strip()
-
-                            return cleaned_text
-
-                        subject, sender, date = "", "", ""
-                        for header in full_msg["payload"].get("headers", []):
-                            if header["name"] == "Subject":
-                                subject = header["value"]
-                            if header["name"] == "From":
-                                sender = re.search(r"<(.*?)>", header["value"])  # Extract the email address
-                                if sender:
-                                    sender = sender.group(1)  # Get the email from the regex match
-                                else:
-                                    sender = header["value"]  # Fallback to full value if no angle brackets
-                            if header["name"] == "Date":
-                                date = header["value"]
-
-                        # Convert the date to the required format (YYYY-MM-DD HH:MM:SS.ssssss)
-                        if date:
-                            try:
-                                # Parse the Gmail date string into a datetime object
-                                parsed_date = datetime.strptime(date, "%a, %d %b %Y %H:%M:%S %z")
-
-                                # Convert to the format required by Supabase (YYYY-MM-DD HH:MM:SS.ssssss)
-                                formatted_date = (
-                                    parsed_date.strftime("%Y-%m-%d %H:%M:%S")
-                                    + "."
-                                    + str(parsed_date.microsecond).zfill(6)
-                                )
-                            except ValueError as e:
-                                logger.error(f"⚠️ Date parsing error for date '{date}': {e}")
-                                formatted_date = None
-                        else:
-                            formatted_date = None
-
-                        # Check if the email has the "IMPORTANT" label
-                        is_important = "IMPORTANT" in full_msg.get("labelIds", [])
-
-                        # Only continue if sender is in client emails
-                        if sender not in client_emails:
-                            continue  # Skip this email and move to the next one
-
-                        full_msg.get("snippet", "")
-                        body, attachments = get_body_from_message(full_msg)
-                        messages.append(
-                            {
-                                "id": msg_id,
-                                "from": sender,
-                                "subject": subject,
-                                "body": clean_body(body),
-                                "emailAddress": new_email,
-                                "is_important": is_important,
-                                "date": formatted_date,
-                                "attachments": attachments,
-                            }
-                        )
-
-        if "historyId" in history:
-            last_history_id = history["historyId"]
-
-        return messages
+            return
+
+        start_history_id = last_history_id  # page tokens are tied to the original query
+        page_token = None
+        while True:
+            gmail_quota.charge("users.history.list")
+            with HISTORY_FETCH.time():
+                history = (
+                    service.users()
+                    .history()
+                    .list(
+                        userId="me",
+                        startHistoryId=start_history_id,
+                        historyTypes=["messageAdded"],
+                        pageToken=page_token,
+                    )
+                    .execute()
+                )
+
+            records = history.get("history", [])
+            msg_ids = list(dict.fromkeys(
+                msg["message"]["id"] for record in records for msg in record.get("messagesAdded", [])
+                if not app.checkpoint_store.is_processed(msg["message"]["id"])
+            ))
+
+            for start in range(0, len(msg_ids), BATCH_SIZE):
+                chunk = msg_ids[start:start + BATCH_SIZE]
+                full_msgs = fetch_messages_batched(service, chunk)
+                parsed = [parse_message(full_msgs[msg_id], new_email) for msg_id in chunk if msg_id in full_msgs]
+                del full_msgs
+                batch = [email for email in parsed if email]
+                if batch:
+                    yield batch
+
+            # Page fully consumed: commit the cursor before loading the next one
+            page_token = history.get("nextPageToken")
+            if not page_token:
+                if "historyId" in history:
+                    last_history_id = history["historyId"]
+                    app.checkpoint_store.commit_cursor(new_email, last_history_id)
+                break
+            if records:
+                last_history_id = records[-1]["id"]
+                app.checkpoint_store.commit_cursor(new_email, last_history_id)
 
     except HttpError as error:
         logger.error(f"⚠️ Gmail API error: {error}")
-        # If rate limit error, wait longer before retrying
+        # A stored cursor older than Gmail's history retention is rejected with 404
+        if error.resp.status == 404 and profile is not None:
+            logger.warning(f"⚠️ History cursor {last_history_id} expired, re-initializing from profile")
+            last_history_id = profile["historyId"]
+            app.checkpoint_store.commit_cursor(profile["emailAddress"], last_history_id)
+        # If rate limit error, let the poll scheduler back off before retrying
         if error.resp.status in [429, 503]:
-            logger.warning("⏳ Rate limit hit, waiting 10 seconds...")
-            time.sleep(10)
-        return []
+            poll_scheduler.note_rate_limited(parse_retry_after(error.resp.get("retry-after")))
+
+
+def _message_get_request(service, msg_id):
+    return (
+        service.users()
+        .messages()
+        .get(
+            userId="me",
+            id=msg_id,
+            format="full",
+            metadataHeaders=["Subject", "From", "LabelIds", "Date"],
+        )
+    )
+
+
+def fetch_messages_batched(service, message_ids, batch_size=BATCH_SIZE):
+    """
+    Fetch full messages using Gmail batch HTTP requests.
+    Sub-requests that fail inside a batch are retried one by one.
+    Returns {message_id: message}; deleted messages (404) are left out.
+    Any other failure of a retry is raised once every message was tried, so
+    the caller does not commit the history page and the message is fetched
+    again on the next poll. A message that keeps failing (MAX_FETCH_FAILURES
+    polls over at least FETCH_GIVE_UP_AFTER seconds) is logged and left out
+    instead, so one unreadable message cannot hold back the mailbox forever.
+    """
+    results = {}
+    failed = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+        else:
+            results[request_id] = response
+
+    unique_ids = list(dict.fromkeys(message_ids))
+    for start in range(0, len(unique_ids), batch_size):
+        chunk = unique_ids[start:start + batch_size]
+        gmail_quota.charge("users.messages.get", len(chunk))
+        batch = service.new_batch_http_request(callback=callback)
+        for msg_id in chunk:
+            batch.add(_message_get_request(service, msg_id), request_id=msg_id)
+        try:
+            with MESSAGE_GET.time():
+                batch.execute()
+        except HttpError as error:
+            logger.warning(f"⚠️ Batch get failed ({error}), retrying {len(chunk)} message(s) individually")
+            failed.extend(msg_id for msg_id in chunk if msg_id not in results)
+
+    errors = []
+    for msg_id in failed:
+        try:
+            gmail_quota.charge("users.messages.get")
+            with MESSAGE_GET.time():
+                results[msg_id] = _message_get_request(service, msg_id).execute(num_retries=MAX_RETRIES)
+            _fetch_failures.pop(msg_id, None)
+        except HttpError as error:
+            if error.resp.status == 404:
+                logger.info(f"Message {msg_id} no longer exists, skipping")
+            elif error.resp.status == 429:
+                errors.append(error)  # rate limited: says nothing about the message
+            elif _note_fetch_failure(msg_id):
+                MESSAGES_SKIPPED.inc()
+                logger.error(f"☠️ Message {msg_id} could not be fetched on {MAX_FETCH_FAILURES} polls, skipping it: {error}")
+            else:
+                logger.error(f"⚠️ Failed to fetch message {msg_id}: {error}")
+                errors.append(error)
+
+    MESSAGES_FETCHED.inc(len(results))
+    if errors:
+        raise errors[0]
+    return results
+
+
+def _note_fetch_failure(msg_id) -> bool:
+    """Count one more failed poll for `msg_id`; True once it should be given up on."""
+    now = time.time()
+    count, first_failed_at = _fetch_failures.get(msg_id, (0, now))
+    count += 1
+    if count >= MAX_FETCH_FAILURES and now - first_failed_at >= FETCH_GIVE_UP_AFTER:
+        _fetch_failures.pop(msg_id, None)
+        return True
+    _fetch_failures[msg_id] = (count, first_failed_at)
+    return False
+
+
+def parse_message(full_msg, new_email):
+    """
+    Convert a full Gmail message into the email dict used by the pipeline.
+    Returns None if the sender is not a known client.
+    """
+    subject, sender, date = "", "", ""
+    from_header, message_id_header, references = "", None, None
+    for header in full_msg["payload"].get("headers", []):
+        if header["name"] == "Subject":
+            subject = header["value"]
+        if header["name"].lower() == "message-id":
+            message_id_header = header["value"]  # kept so replies can thread without re-fetching
+        if header["name"] == "References":
+            references = header["value"]
+        if header["name"] == "From":
+            from_header = header["value"]
+            sender = re.search(r"<(.*?)>", header["value"])  # Extract the email address
+            if sender:
+                sender = sender.group(1)  # Get the email from the regex match
+            else:
+                sender = header["value"]  # Fallback to full value if no angle brackets
+        if header["name"] == "Date":
+            date = header["value"]
+
+    # Convert the date to the required format (YYYY-MM-DD HH:MM:SS.ssssss)
+    if date:
+        try:
+            # Parse the Gmail date string into a datetime object
+            parsed_date = datetime.strptime(date, "%a, %d %b %Y %H:%M:%S %z")
+
+            # Convert to the format required by Supabase (YYYY-MM-DD HH:MM:SS.ssssss)
+            formatted_date = (
+                parsed_date.strftime("%Y-%m-%d %H:%M:%S")
+                + "."
+                + str(parsed_date.microsecond).zfill(6)
+            )
+        except ValueError as e:
+            logger.error(f"⚠️ Date parsing error for date '{date}': {e}")
+            formatted_date = None
+    else:
+        formatted_date = None
+
+    # Check if the email has the "IMPORTANT" label
+    is_important = "IMPORTANT" in full_msg.get("labelIds", [])
+
+    # Only continue if sender is in client emails
+    if sender not in client_allowlist:
+        return None  # Skip this email
+
+    with BODY_CLEAN.time():
+        body, attachments = get_body_from_message(full_msg)
+        body = clean_body(body)
+    return {
+        "id": full_msg["id"],
+        "threadId": full_msg.get("threadId"),
+        "from": sender,
+        "subject": subject,
+        "body": body,
+        "emailAddress": new_email,
+        "is_important": is_important,
+        "date": formatted_date,
+        "received_at": int(full_msg["internalDate"]) / 1000 if full_msg.get("internalDate") else time.time(),
+        "attachments": attachments,
+        # Reply headers (see sendEmail.create_reply_message)
+        "from_header": from_header,
+        "message_id_header": message_id_header,
+        "references": references,
+    }
 
 
 def download_attachment(service, message_id, attachment_id, filename, save_dir):
@@ -246,6 +300,7 @@ def download_attachment(service, message_id, attachment_id, filename, save_dir):
     """
     os.makedirs(save_dir, exist_ok=True)
 
+    gmail_quota.charge("users.messages.attachments.get")
     attachment = (
         service.users()
         .messages()
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+from GmailAutomation.metrics import metrics
+
+# ------------------------------------------------------------
+# Per-thread coalescing of follow-up messages
+# ------------------------------------------------------------
+THREAD_COALESCING = os.getenv("THREAD_COALESCING", "off")  # "on" or "off"
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 30))  # max seconds between messages merged together
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", 120))  # never hold a thread longer than this
+
+COALESCED_MESSAGES = metrics.counter("coalesced_messages_total", "Follow-up messages merged into another one")
+SENDS_SAVED = metrics.counter("coalesced_sends_saved_total", "Replies not sent because messages were merged")
+
+
+class ThreadCoalescer:
+    """
+    Merges new messages of one Gmail thread that arrived within `window`
+    seconds of each other into a single email: one agent run over the
+    combined context and one reply, to the latest message.
+
+    `coalesce` merges what is already at hand (main's poll cycle).
+    `split_due` also debounces: a thread whose latest message is younger
+    than `window` is held back until it has been quiet that long (or its
+    first message has waited `max_wait`), so quick follow-ups still join.
+    Holding mail needs a durable place to put it, so only the work queue
+    consumer uses it.
+    """
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_wait: float = COALESCE_MAX_WAIT):
+        self.window = window
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+
+        self.groups = 0
+        self.merged_messages = 0
+        self.deferred = 0
+        self.sends_saved = 0
+
+    # ---------------- grouping ----------------
+    def _groups(self, emails) -> list:
+        """Split emails into runs of one thread whose consecutive messages are at most `window` apart."""
+        by_thread = defaultdict(list)
+        for email in emails:
+            by_thread[email.get("threadId") or email["id"]].append(email)
+
+        groups = []
+        for messages in by_thread.values():
+            messages.sort(key=_received_at)
+            group = [messages[0]]
+            for email in messages[1:]:
+                if _received_at(email) - _received_at(group[-1]) <= self.window:
+                    group.append(email)
+                else:
+                    groups.append(group)
+                    group = [email]
+            groups.append(group)
+        # Oldest first, like the emails came in
+        return sorted(groups, key=lambda group: _received_at(group[0]))
+
+    def coalesce(self, emails) -> list:
+        """Merge same-thread messages of `emails`; returns the emails to process."""
+        return [self.merge(group) for group in self._groups(emails)]
+
+    def split_due(self, emails, now: float = None):
+        """
+        Returns (due emails, merged; [(message ids, hold until), ...]): the
+        second list holds back threads that may still get a follow-up.
+        """
+        now = time.time() if now is None else now
+        due, held = [], []
+        for group in self._groups(emails):
+            quiet_at = _received_at(group[-1]) + self.window
+            give_up_at = _received_at(group[0]) + self.max_wait
+            if now < quiet_at and now < give_up_at:
+                held.append(([email["id"] for email in group], min(quiet_at, give_up_at)))
+            else:
+                due.append(self.merge(group))
+        with self._lock:
+            self.deferred += sum(len(ids) for ids, _ in held)
+        return due, held
+
+    def merge(self, group) -> dict:
+        """One email for a run of messages: the latest one's headers, every body and attachment."""
+        if len(group) == 1:
+            return group[0]
+        latest = group[-1]
+        merged = dict(latest)
+        merged["body"] = "\n\n".join(
+            f"[Message {i} of {len(group)}{', ' + email['date'] if email.get('date') else ''}]\n{email['body']}"
+            for i, email in enumerate(group, 1)
+        )
+        merged["attachments"] = [
+            {**att, "messageId": email["id"]} for email in group for att in email.get("attachments", [])
+        ]
+        merged["is_important"] = any(email.get("is_important") for email in group)
+        merged["coalesced"] = [{"id": email["id"], "received_at": email.get("received_at")} for email in group]
+        with self._lock:
+            self.groups += 1
+            self.merged_messages += len(group) - 1
+        COALESCED_MESSAGES.inc(len(group) - 1)
+        return merged
+
+    def record_sent(self, email):
+        """Called once the merged email was answered: one reply went out instead of one per message."""
+        saved = len(email.get("coalesced", ())) - 1
+        if saved > 0:
+            with self._lock:
+                self.sends_saved += saved
+            SENDS_SAVED.inc(saved)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "window_s": self.window,
+                "merged_groups": self.groups,
+                "merged_messages": self.merged_messages,
+                "llm_calls_saved": self.merged_messages,
+                "sends_saved": self.sends_saved,
+                "deferred": self.deferred,
+            }
+
+
+def _received_at(email) -> float:
+    return email.get("received_at") or 0.0
+
+
+def message_ids(email) -> list:
+    """Every message a (possibly merged) email stands for."""
+    return [member["id"] for member in email.get("coalesced", ())] or [email["id"]]
+
+
+# Shared coalescer used by main (None when coalescing is off)
+thread_coalescer = ThreadCoalescer() if THREAD_COALESCING == "on" else None
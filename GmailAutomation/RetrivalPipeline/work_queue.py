@@ -0,0 +1,307 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from logger import logger
+from GmailAutomation.app_context import app
+from GmailAutomation.metrics import metrics
+from GmailAutomation.RetrivalPipeline.checkpoint import DEFAULT_CHECKPOINT_PATH, LEDGER_RETENTION_DAYS
+
+# ------------------------------------------------------------
+# Durable work queue between fetching and processing
+# ------------------------------------------------------------
+WORK_QUEUE = os.getenv("WORK_QUEUE", "off")  # "on": fetch and process in separate loops, through the queue
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", DEFAULT_CHECKPOINT_PATH)  # same file as the checkpoint by default
+WORK_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv("WORK_QUEUE_VISIBILITY_TIMEOUT", 600))  # seconds a lease lasts
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", 5))  # then the item is dead-lettered
+WORK_QUEUE_RETRY_DELAY = float(os.getenv("WORK_QUEUE_RETRY_DELAY", 30))  # first retry delay, doubled per attempt
+WORK_QUEUE_MAX_RETRY_DELAY = 3600
+WORK_QUEUE_MAX_BACKLOG = int(os.getenv("WORK_QUEUE_MAX_BACKLOG", 500))  # ready + leased items that pause fetching
+WORK_QUEUE_LEASE_BATCH = int(os.getenv("WORK_QUEUE_LEASE_BATCH", 10))  # items the consumer takes at once
+
+QUEUE_EVENTS = {
+    event: metrics.counter("work_queue_items_total", "Work queue item transitions", event=event)
+    for event in ("enqueued", "acked", "retried", "dead")
+}
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of fetched emails waiting for the agent, plus the
+    send markers that keep a reprocessed email from being answered twice.
+
+    The producer enqueues parsed emails before the history cursor moves
+    past them, so a crash never loses fetched mail. The consumer leases
+    items: a leased item is invisible until it is acked, failed, or its
+    visibility timeout runs out. Failed items are retried with exponential
+    backoff and dead-lettered after `max_attempts`. `backlogged()` tells the
+    producer to stop fetching while too much work is waiting.
+
+    One process owns a queue file (one per mailbox), so leases left over by
+    a previous run are released when the queue is opened.
+    """
+
+    def __init__(
+        self,
+        path: str = WORK_QUEUE_PATH,
+        visibility_timeout: float = WORK_QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts: int = WORK_QUEUE_MAX_ATTEMPTS,
+        max_backlog: int = WORK_QUEUE_MAX_BACKLOG,
+    ):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.max_backlog = max_backlog
+        self._lock = threading.Lock()
+        self._work = threading.Event()  # set when something was enqueued
+        self._paused = False
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.acked = 0
+        self.retried = 0
+        self.dead = 0
+        self.pauses = 0
+        self.deferrals = 0
+        self.skipped_sends = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_items ("
+                "message_id TEXT PRIMARY KEY, mailbox TEXT, thread_id TEXT, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, "
+                "lease_until REAL, enqueued_at REAL NOT NULL, last_error TEXT)"
+            )
+            if "thread_id" not in {row[1] for row in self._conn.execute("PRAGMA table_info(work_items)")}:
+                self._conn.execute("ALTER TABLE work_items ADD COLUMN thread_id TEXT")  # queues created before it
+            self._conn.execute("CREATE INDEX IF NOT EXISTS work_items_ready ON work_items (status, available_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS work_items_thread ON work_items (thread_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS send_markers ("
+                "message_id TEXT PRIMARY KEY, action TEXT NOT NULL, state TEXT NOT NULL, "
+                "result TEXT, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "DELETE FROM send_markers WHERE updated_at < ?", (time.time() - LEDGER_RETENTION_DAYS * 86400,)
+            )
+            released = self._conn.execute(
+                "UPDATE work_items SET status='ready', lease_until=NULL WHERE status='leased'"
+            ).rowcount
+        if released:
+            logger.info(f"📥 Released {released} work item(s) leased by the previous run")
+
+    # ---------------- producer ----------------
+    def enqueue(self, emails) -> int:
+        """Add parsed emails (one transaction); emails already queued are ignored. Returns how many were added."""
+        now = time.time()
+        rows = [
+            (email["id"], email.get("emailAddress"), email.get("threadId"), json.dumps(email), now, now)
+            for email in emails
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO work_items "
+                "(message_id, mailbox, thread_id, payload, status, available_at, enqueued_at) "
+                "VALUES (?, ?, ?, ?, 'ready', ?, ?)",
+                rows,
+            )
+            added = self._conn.total_changes - before
+        self.enqueued += added
+        self.duplicates += len(rows) - added
+        QUEUE_EVENTS["enqueued"].inc(added)
+        if added:
+            self._work.set()
+        return added
+
+    def backlogged(self) -> bool:
+        """True while ready + leased items reach `max_backlog`; the producer should not fetch more."""
+        backlog = self.backlog()
+        paused = backlog >= self.max_backlog
+        if paused != self._paused:
+            self._paused = paused
+            if paused:
+                self.pauses += 1
+                logger.warning(f"⏸ Work queue backlog at {backlog}, pausing fetching until it drains")
+            else:
+                logger.info(f"▶️ Work queue backlog down to {backlog}, fetching again")
+        return paused
+
+    # ---------------- consumer ----------------
+    def lease(self, limit: int = WORK_QUEUE_LEASE_BATCH) -> list:
+        """
+        Take up to `limit` visible items, oldest first, and hide them for the
+        visibility timeout. Other due items of the same Gmail threads come
+        along, so a thread is handled as a whole; a sibling still waiting out
+        its retry delay is left for later.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT message_id, payload, attempts, thread_id FROM work_items "
+                "WHERE (status='ready' AND available_at <= ?) OR (status='leased' AND lease_until <= ?) "
+                "ORDER BY enqueued_at LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            threads = list({row[3] for row in rows if row[3]})
+            if threads:
+                leased = {row[0] for row in rows}
+                siblings = self._conn.execute(
+                    "SELECT message_id, payload, attempts, thread_id FROM work_items "
+                    "WHERE status='ready' AND available_at <= ? "
+                    f"AND thread_id IN ({','.join('?' * len(threads))}) ORDER BY enqueued_at",
+                    [now, *threads],
+                ).fetchall()
+                rows += [row for row in siblings if row[0] not in leased]
+            self._conn.executemany(
+                "UPDATE work_items SET status='leased', lease_until=?, attempts=attempts+1 WHERE message_id=?",
+                [(now + self.visibility_timeout, row[0]) for row in rows],
+            )
+        return [{"email": json.loads(payload), "attempt": attempts + 1} for _, payload, attempts, _ in rows]
+
+    def defer(self, message_ids, until: float):
+        """Hand leased items back untouched, visible again at `until` (not counted as an attempt)."""
+        message_ids = list(message_ids)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE work_items SET status='ready', lease_until=NULL, available_at=?, attempts=attempts-1 "
+                "WHERE message_id=? AND status='leased'",
+                [(until, message_id) for message_id in message_ids],
+            )
+        self.deferrals += len(message_ids)
+
+    def wait_for_work(self, timeout: float):
+        """Block until something is enqueued (or `timeout`); retries that come due are picked up on the timeout."""
+        self._work.wait(timeout)
+        self._work.clear()
+
+    def ack(self, message_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM work_items WHERE message_id=?", (message_id,))
+        self.acked += 1
+        QUEUE_EVENTS["acked"].inc()
+
+    def fail(self, message_id: str, error: Exception):
+        """Make a failed item visible again after a backoff, or dead-letter it once it ran out of attempts."""
+        reason = f"{type(error).__name__}: {error}"[:1000]
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts FROM work_items WHERE message_id=? AND status='leased'", (message_id,)
+            ).fetchone()
+            if row is None:  # not ours any more (acked, or already failed)
+                return
+            attempts = row[0]
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE work_items SET status='dead', lease_until=NULL, last_error=? WHERE message_id=?",
+                    (reason, message_id),
+                )
+            else:
+                delay = min(WORK_QUEUE_RETRY_DELAY * 2 ** (attempts - 1), WORK_QUEUE_MAX_RETRY_DELAY)
+                self._conn.execute(
+                    "UPDATE work_items SET status='ready', lease_until=NULL, available_at=?, last_error=? "
+                    "WHERE message_id=?",
+                    (time.time() + delay, reason, message_id),
+                )
+        if attempts >= self.max_attempts:
+            self.dead += 1
+            QUEUE_EVENTS["dead"].inc()
+            logger.error(f"☠️ Email {message_id} failed {attempts} time(s), moved to the dead-letter queue: {reason}")
+        else:
+            self.retried += 1
+            QUEUE_EVENTS["retried"].inc()
+            logger.warning(f"🔁 Email {message_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {reason}")
+
+    # ---------------- dead letters ----------------
+    def dead_letters(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, attempts, last_error FROM work_items WHERE status='dead' ORDER BY enqueued_at"
+            ).fetchall()
+        return [{"message_id": m, "attempts": a, "last_error": e} for m, a, e in rows]
+
+    def requeue_dead(self, message_ids=None) -> int:
+        """Give dead-lettered items (all, or the given ones) a fresh set of attempts."""
+        query = "UPDATE work_items SET status='ready', attempts=0, available_at=? WHERE status='dead'"
+        params = [time.time()]
+        if message_ids is not None:
+            message_ids = list(message_ids)
+            query += f" AND message_id IN ({','.join('?' * len(message_ids))})"
+            params += message_ids
+        with self._lock, self._conn:
+            count = self._conn.execute(query, params).rowcount
+        if count:
+            self._work.set()
+        return count
+
+    # ---------------- send markers ----------------
+    def send_marker(self, message_id: str):
+        """{"action", "state": "pending" | "sent", "result"} for an email we started answering, else None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT action, state, result FROM send_markers WHERE message_id=?", (message_id,)
+            ).fetchone()
+        return {"action": row[0], "state": row[1], "result": row[2]} if row else None
+
+    def begin_send(self, message_id: str, action: str):
+        """Written (durably) right before the Gmail send call."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO send_markers (message_id, action, state, result, updated_at) "
+                "VALUES (?, ?, 'pending', NULL, ?)",
+                (message_id, action, time.time()),
+            )
+
+    def complete_send(self, message_id: str, result: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE send_markers SET state='sent', result=?, updated_at=? WHERE message_id=?",
+                (result, time.time(), message_id),
+            )
+
+    def clear_send(self, message_id: str):
+        """The send definitely did not go out (Gmail answered with an error): allow a retry."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM send_markers WHERE message_id=?", (message_id,))
+
+    # ---------------- stats ----------------
+    def counts(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM work_items GROUP BY status"))
+        return {status: counts.get(status, 0) for status in ("ready", "leased", "dead")}
+
+    def backlog(self) -> int:
+        counts = self.counts()
+        return counts["ready"] + counts["leased"]
+
+    def oldest_ready_age(self) -> float:
+        with self._lock:
+            (oldest,) = self._conn.execute("SELECT MIN(enqueued_at) FROM work_items WHERE status='ready'").fetchone()
+        return round(time.time() - oldest, 1) if oldest else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.counts(),
+            "oldest_ready_age_s": self.oldest_ready_age(),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "acked": self.acked,
+            "retried": self.retried,
+            "dead_lettered": self.dead,
+            "backpressure_pauses": self.pauses,
+            "deferrals": self.deferrals,
+            "skipped_sends": self.skipped_sends,
+        }
+
+
+# Shared queue (and send markers) used by main, opened on first use (`app.work_queue`)
+app.register("work_queue", WorkQueue)
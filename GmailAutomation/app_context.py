@@ -0,0 +1,87 @@
+import threading
+import time
+
+from logger import logger
+
+# ------------------------------------------------------------
+# Lazily created shared clients
+# ------------------------------------------------------------
+class AppContext:
+    """
+    One place for the process-wide clients and stores (Supabase, the
+    OpenAI client, model, run config, agents, the checkpoint store, work
+    queue, attachment store and fast path).
+
+    Modules register a factory under a name at import time and read the
+    client as an attribute (`app.supabase`) when they need it. Nothing is
+    created, no heavy SDK is imported and no file is opened until the
+    first access, so importing the pipeline costs no network round trip or
+    disk work and needs no credentials (main.py loads .env itself). Every
+    client is created once and shared; `override` swaps in a fake for
+    benchmarks and tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()  # factories may read other entries
+        self._factories = {}
+        self._instances = {}
+        self.init_ms = {}  # name -> time its factory took
+
+    def register(self, name: str, factory):
+        self._factories[name] = factory
+
+    def override(self, name: str, instance):
+        """Use `instance` instead of what the factory would build."""
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name: str = None):
+        """Forget one (or every) created client; the next access builds it again."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise AttributeError(f"no client registered as '{name}'")
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.init_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+            return self._instances[name]
+
+    def warm_up(self, names=None) -> threading.Thread:
+        """Create clients (default: all) on a background thread, e.g. once the first poll is done."""
+        def build():
+            for name in names or sorted(self._factories):
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not create '{name}' ahead of use: {e}")
+
+        thread = threading.Thread(target=build, name="app-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {
+            "registered": sorted(self._factories),
+            "initialized": sorted(self._instances),
+            "init_ms": dict(self.init_ms),
+        }
+
+
+# Shared context: db, EmailAgent, ... register their clients here
+app = AppContext()
@@ -1,15 +1,24 @@
 import json
 import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
 from typing import List
 
+import google_auth_httplib2
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import Resource, build
+from googleapiclient.discovery import Resource, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from logger import logger
 
 # Default settings
-DEFAULT_CREDENTIALS_PATH = "credentials.json"
-DEFAULT_TOKEN_PATH = "token.json"
+DEFAULT_CREDENTIALS_PATH = os.getenv("MCP_GMAIL_CREDENTIALS_PATH", "credentials.json")
+DEFAULT_TOKEN_PATH = os.getenv("MCP_GMAIL_TOKEN_PATH", "token.json")
 DEFAULT_USER_ID = "me"
 
 # Gmail API scopes
@@ -21,16 +30,20 @@ GMAIL_SCOPES = [
     "https://www.googleapis.com/auth/gmail.labels",
 ]
 
+HTTP_TIMEOUT = 60  # seconds per Gmail API request
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", 600))  # refresh this many seconds before expiry
+TOKEN_REFRESH_RETRY = 30  # seconds between attempts after a failed background refresh
+
 # Type alias for the Gmail service
 GmailService = Resource
 
-def get_gmail_service(
+def load_credentials(
     credentials_path: str = DEFAULT_CREDENTIALS_PATH,
     token_path: str = DEFAULT_TOKEN_PATH,
     scopes: List[str] = GMAIL_SCOPES,
-) -> GmailService:
+) -> Credentials:
     """
-    Authenticate with Gmail API and return the service object.
+    Load (refreshing or running the OAuth flow if needed) the Gmail credentials.
 
     Args:
         credentials_path: Path to the credentials JSON file
@@ -38,7 +51,7 @@ def get_gmail_service(
         scopes: OAuth scopes to request
 
     Returns:
-        Authenticated Gmail API service
+        Valid OAuth credentials
     """
     creds = None
 
@@ -64,9 +77,247 @@ def get_gmail_service(
             creds = flow.run_local_server(port=0)
 
         # Save credentials for future runs
-        token_json = json.loads(creds.to_json())
-        with open(token_path, "w") as token:
-            json.dump(token_json, token)
+        save_token(creds, token_path)
+
+    return creds
+
+
+def save_token(creds: Credentials, token_path: str = DEFAULT_TOKEN_PATH):
+    """Write token.json atomically (temp file + rename), so a crash never leaves it half-written."""
+    directory = os.path.dirname(os.path.abspath(token_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as token:
+            json.dump(json.loads(creds.to_json()), token)
+            token.flush()
+            os.fsync(token.fileno())
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class CredentialManager:
+    """
+    Keeps the shared Gmail credentials valid for a process that runs for days.
+
+    A background thread refreshes the access token `margin` seconds before
+    it expires. The refresh runs on a copy of the credentials and only the
+    new token and expiry are swapped into the shared object, so fetches and
+    sends keep using the old (still valid) token and never wait on the
+    token endpoint. The new token is persisted to token.json atomically.
+    A failed refresh is retried every TOKEN_REFRESH_RETRY seconds; if the
+    token expires anyway, google-auth falls back to refreshing inline.
+    """
+
+    def __init__(
+        self,
+        credentials_path: str = DEFAULT_CREDENTIALS_PATH,
+        token_path: str = DEFAULT_TOKEN_PATH,
+        scopes: List[str] = GMAIL_SCOPES,
+        margin: float = TOKEN_REFRESH_MARGIN,
+    ):
+        self.credentials_path = credentials_path
+        self.token_path = token_path
+        self.scopes = scopes
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._credentials = None
 
-    # Build the Gmail service
-    return build("gmail", "v1", credentials=creds,cache_discovery=False )
+        self.refreshes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_refresh_ms = 0.0
+        self.max_refresh_ms = 0.0
+        self.total_refresh_ms = 0.0
+
+    @property
+    def credentials(self) -> Credentials:
+        """The shared credentials; loaded (and the refresher started) on first access."""
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = load_credentials(self.credentials_path, self.token_path, self.scopes)
+                self._start()
+            return self._credentials
+
+    def refresh(self):
+        """Fetch a new access token now and publish it to the shared credentials."""
+        creds = self.credentials
+        with self._refresh_lock:
+            fresh = creds.with_token_uri(creds.token_uri)  # an independent copy
+            start = time.perf_counter()
+            try:
+                fresh.refresh(Request())
+            except Exception as e:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e) or type(e).__name__
+                raise
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.last_refresh_ms = elapsed_ms
+                self.max_refresh_ms = max(self.max_refresh_ms, elapsed_ms)
+                self.total_refresh_ms += elapsed_ms
+            # In-flight requests already carry the old token, which stays valid until its expiry
+            creds.token, creds.expiry = fresh.token, fresh.expiry
+            self.refreshes += 1
+            self.consecutive_failures = 0
+            self.last_error = None
+        save_token(fresh, self.token_path)
+        logger.info(f"🔐 Refreshed Gmail access token in {elapsed_ms:.0f} ms (expires {fresh.expiry:%H:%M:%S} UTC)")
+
+    def seconds_to_expiry(self):
+        expiry = self._credentials.expiry if self._credentials is not None else None
+        if expiry is None:
+            return None
+        return (expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # ---------------- background refresher ----------------
+    def _start(self):
+        if self._thread is None and self._credentials.refresh_token:
+            self._thread = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            expires_in = self.seconds_to_expiry()
+            delay = self.margin if expires_in is None else expires_in - self.margin
+            if delay > 0 and self._stop.wait(delay):
+                return
+            if self._stop.is_set():
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"⚠️ Background token refresh failed ({self.consecutive_failures} in a row): {e}")
+                self._stop.wait(TOKEN_REFRESH_RETRY)
+
+    def stats(self) -> dict:
+        attempts = self.refreshes + self.failures
+        expires_in = self.seconds_to_expiry()
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "avg_refresh_ms": round(self.total_refresh_ms / attempts, 1) if attempts else 0.0,
+            "max_refresh_ms": round(self.max_refresh_ms, 1),
+            "expires_in_s": round(expires_in) if expires_in is not None else None,
+        }
+
+
+class CountingHttp(httplib2.Http):
+    """httplib2.Http (keep-alive) that counts new vs reused connections."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = 0
+        self.new_connections = 0
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+        self.requests += 1
+        if conn.sock is None:
+            self.new_connections += 1
+        return super()._conn_request(conn, request_uri, method, body, headers)
+
+
+class GmailServiceFactory:
+    """
+    Hands out one Gmail service per thread.
+
+    httplib2 is not thread-safe, so every thread gets its own keep-alive
+    connection; all of them share one set of credentials (kept fresh by a
+    CredentialManager) and one parsed discovery document, so an extra thread
+    costs a service object, not an OAuth round trip. Nothing is loaded until
+    the first `get()`.
+    """
+
+    def __init__(
+        self,
+        credentials_path: str = DEFAULT_CREDENTIALS_PATH,
+        token_path: str = DEFAULT_TOKEN_PATH,
+        scopes: List[str] = GMAIL_SCOPES,
+    ):
+        self.credential_manager = CredentialManager(credentials_path, token_path, scopes)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._discovery = None
+        self._transports = []  # CountingHttp of every thread, for stats
+
+    @property
+    def credentials(self) -> Credentials:
+        credentials = self.credential_manager.credentials
+        with self._lock:
+            if self._discovery is None:
+                self._discovery = get_static_doc("gmail", "v1")
+        return credentials
+
+    def get(self) -> GmailService:
+        """Return the calling thread's Gmail service, building it on first use."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            credentials = self.credentials
+            transport = CountingHttp(timeout=HTTP_TIMEOUT)
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=transport)
+            service = build_from_document(self._discovery, http=http)
+            self._local.service = service
+            with self._lock:
+                self._transports.append(transport)
+        return service
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = sum(t.requests for t in self._transports)
+            new = sum(t.new_connections for t in self._transports)
+            return {
+                "services": len(self._transports),
+                "requests": requests,
+                "new_connections": new,
+                "reused_connections": requests - new,
+                "reuse_ratio": round((requests - new) / requests, 3) if requests else 0.0,
+            }
+
+    def close(self):
+        self.credential_manager.stop()
+
+
+# Shared factory: every module asks it for its thread's service
+gmail_services = GmailServiceFactory()
+
+# One factory (and token refresher) per set of credentials passed to get_gmail_service
+_factories = {(DEFAULT_CREDENTIALS_PATH, DEFAULT_TOKEN_PATH, tuple(GMAIL_SCOPES)): gmail_services}
+_factories_lock = threading.Lock()
+
+
+def get_gmail_service(
+    credentials_path: str = DEFAULT_CREDENTIALS_PATH,
+    token_path: str = DEFAULT_TOKEN_PATH,
+    scopes: List[str] = GMAIL_SCOPES,
+) -> GmailService:
+    """
+    Authenticate with Gmail API and return the service object for the calling thread.
+
+    Args:
+        credentials_path: Path to the credentials JSON file
+        token_path: Path to save/load the token
+        scopes: OAuth scopes to request
+
+    Returns:
+        Authenticated Gmail API service
+    """
+    key = (credentials_path, token_path, tuple(scopes))
+    with _factories_lock:
+        factory = _factories.get(key)
+        if factory is None:
+            factory = _factories[key] = GmailServiceFactory(credentials_path, token_path, scopes)
+    return factory.get()
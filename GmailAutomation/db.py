@@ -1,79 +1,215 @@
-from supabase import Client, create_client
-from dotenv import load_dotenv
-from agents import function_tool
+from GmailAutomation.app_context import app
+from GmailAutomation.metrics import metrics
+from collections import OrderedDict
 import os
+import threading
+import time
 
-load_dotenv()  
 # ---------------------------
 # Config
 # ---------------------------
 SUPABASE_URL = os.getenv("SUPABASE_URL")  
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")  
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("⚠️ Please set SUPABASE_URL and SUPABASE_KEY environment variables")
-
 # ---------------------------
 # Supabase Setup
 # ---------------------------
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def create_supabase_client():
+    """Built on first use through `app.supabase` (the supabase SDK is only imported then)."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise Exception("⚠️ Please set SUPABASE_URL and SUPABASE_KEY environment variables")
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+app.register("supabase", create_supabase_client)
+
+# ---------------------------
+# Read-through cache
+# ---------------------------
+# Per-table TTLs (seconds); lookups that find nothing are cached for NEGATIVE_CACHE_TTL
+CACHE_TTLS = {
+    "ai_personality_settings": int(os.getenv("PERSONALITY_CACHE_TTL", 600)),
+    "clients": int(os.getenv("CLIENT_CACHE_TTL", 600)),
+    "projects": int(os.getenv("PROJECT_CACHE_TTL", 300)),
+}
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", 60))
+CACHE_MAX_ENTRIES = int(os.getenv("DB_CACHE_MAX_ENTRIES", 1024))  # per table
+
+_MISSING = object()
+
+
+class TableCache:
+    """
+    TTL + LRU cache for the rows of one Supabase table.
+
+    Empty results (unknown senders) are cached with a shorter TTL so a
+    stranger mailing us repeatedly does not cost a round trip each time.
+    Tracks hit ratio and the latency saved, estimated from the average
+    time a miss took to load.
+    """
+
+    def __init__(self, table: str, ttl: float, negative_ttl: float = NEGATIVE_CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.table = table
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.load_seconds = 0.0
+        self._lookup_latency = metrics.stage("supabase_lookup")
+        self._hit_counter = metrics.counter("db_cache_requests_total", "Supabase cache lookups", table=table, result="hit")
+        self._miss_counter = metrics.counter("db_cache_requests_total", "Supabase cache lookups", table=table, result="miss")
+
+    def get(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss or after expiry."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if not entry[1]:
+                    self.negative_hits += 1
+                self._hit_counter.inc()
+                return entry[1]
+
+        start = time.perf_counter()
+        with self._lookup_latency.time():
+            value = loader()
+        elapsed = time.perf_counter() - start
+        self._miss_counter.inc()
+
+        with self._lock:
+            self.misses += 1
+            self.load_seconds += elapsed
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store a value loaded elsewhere (e.g. by a bulk prefetch)."""
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key (returning its cached value), or the whole table when no key is given."""
+        with self._lock:
+            if key is _MISSING:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return None
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.invalidations += 1
+            return entry[1]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        avg_load_ms = self.load_seconds / self.misses * 1000 if self.misses else 0.0
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "avg_load_ms": round(avg_load_ms, 2),
+            "saved_ms": round(self.hits * avg_load_ms, 2),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+caches = {table: TableCache(table, ttl) for table, ttl in CACHE_TTLS.items()}
+
+
+def _cache_key(client_email: str) -> str:
+    return client_email.strip().lower()
+
+
+def invalidate_client(client_email: str):
+    """Drop everything cached for one client (call after editing its rows)."""
+    key = _cache_key(client_email)
+    caches["ai_personality_settings"].invalidate(key)
+    client = caches["clients"].invalidate(key)
+    if client:
+        caches["projects"].invalidate(client["id"])
+
+
+def invalidate_cache(table: str = None):
+    """Drop one table's cache, or every cache when no table is given."""
+    for name, cache in caches.items():
+        if table is None or name == table:
+            cache.invalidate()
+
+
+def cache_stats() -> dict:
+    return {table: cache.stats() for table, cache in caches.items()}
 
 
 def fetch_client_emails():
     """Fetch client emails from Supabase table 'clients'."""
-    data = supabase.table("clients").select("contact_email").execute()
+    data = app.supabase.table("clients").select("contact_email").execute()
     emails = [row["contact_email"] for row in data.data]
     return emails
 
-# ----------------------------
-# Tool function
-# ----------------------------
-@function_tool
-def fetch_personality_settings(client_email: str = None) -> dict:
-    """
-    Fetch essential personality settings for LLM agent use.
 
-    Returns only the key fields needed to guide responses.
-    """
-    if not client_email:
-        raise ValueError("At least one of user_id or client_id must be provided")
+def fetch_client_emails_updated_since(since: str):
+    """Fetch client emails changed after `since` (ISO timestamp) from table 'clients'."""
+    data = app.supabase.table("clients").select("contact_email, updated_at").gt("updated_at", since).execute()
+    return data.data
 
-    query = supabase.table("ai_personality_settings").select("*")
+SUPABASE_PREFETCH = metrics.stage("supabase_prefetch")  # both queries of prefetch_client_context
+PROJECT_COLUMNS = "id, name, description, billing_type, start_date, end_date, budget, status, client_goal, success_metric"
 
-    if client_email:
-        query = query.eq("contact_email", client_email)
 
-    result = query.limit(1).execute()
+# ----------------------------
+# Loaders (one Supabase round trip each, called on cache misses)
+# ----------------------------
+def _load_personality_settings(client_email: str) -> dict:
+    result = app.supabase.table("ai_personality_settings") \
+        .select("*") \
+        .eq("contact_email", client_email) \
+        .limit(1) \
+        .execute()
 
     if result.data and len(result.data) > 0:
-        data = result.data[0]
-        # Only the most important fields for LLM response shaping
-        personality_settings = {
-            "assistant_name": data.get("assistant_name"),
-            "communication_tone": data.get("communication_tone"),
-            "default_greeting": data.get("default_greeting"),
-            "followup_message": data.get("followup_message"),
-            "sentiment_analysis": data.get("sentiment_analysis"),
-            "automatic_escalation": data.get("automatic_escalation"),
-            "formality_level": data.get("formality_level"),
-            "language_style": data.get("language_style"),
-        }
-        return personality_settings
+        return _personality_from_row(result.data[0])
     else:
         return {}  # No data found
 
-@function_tool    
-def fetch_client_and_project_data(client_email: str) -> dict:
-    """
-    Fetch key client and project context for the LLM agent.
-    Returns minimal structured data.
-    """
 
-    if not client_email:
-        raise ValueError("client_email is required")
+def _personality_from_row(data: dict) -> dict:
+    # Only the most important fields for LLM response shaping
+    personality_settings = {
+        "assistant_name": data.get("assistant_name"),
+        "communication_tone": data.get("communication_tone"),
+        "default_greeting": data.get("default_greeting"),
+        "followup_message": data.get("followup_message"),
+        "sentiment_analysis": data.get("sentiment_analysis"),
+        "automatic_escalation": data.get("automatic_escalation"),
+        "formality_level": data.get("formality_level"),
+        "language_style": data.get("language_style"),
+    }
+    return personality_settings
+
 
-    # ---- Fetch client ----
-    client_result = supabase.table("clients") \
+def _load_client(client_email: str) -> dict:
+    client_result = app.supabase.table("clients") \
         .select("id, name, industry, contact_name, contact_email, priority_level, client_notes") \
         .eq("contact_email", client_email) \
         .limit(1) \
@@ -82,39 +218,124 @@ def fetch_client_and_project_data(client_email: str) -> dict:
     if not client_result.data or len(client_result.data) == 0:
         return {}
 
-    client = client_result.data[0]
-    client_id = client.get("id")  #  UUID
+    return _client_from_row(client_result.data[0])
 
-    # ---- Fetch related projects ----
-    project_result = supabase.table("projects") \
-        .select("id, name, description, billing_type, start_date, end_date, budget, status, client_goal, success_metric") \
+
+def _client_from_row(client: dict) -> dict:
+    return {
+        "id": client.get("id"),  #  UUID
+        "name": client.get("name"),
+        "industry": client.get("industry"),
+        "contact_name": client.get("contact_name"),
+        "contact_email": client.get("contact_email"),
+        "priority_level": client.get("priority_level"),
+        "notes": client.get("client_notes"),
+    }
+
+
+def _load_projects(client_id: str) -> list:
+    project_result = app.supabase.table("projects") \
+        .select(PROJECT_COLUMNS) \
         .eq("client_id", client_id) \
         .execute()
 
     projects = project_result.data if project_result.data else []
+    return _projects_from_rows(projects)
 
-    # ---- Prepare compact response ----
-    return {
-        "client": {
-            "id": client.get("id"),
-            "name": client.get("name"),
-            "industry": client.get("industry"),
-            "contact_name": client.get("contact_name"),
-            "contact_email": client.get("contact_email"),
-            "priority_level": client.get("priority_level"),
-            "notes": client.get("client_notes"),
-        },
-        "projects": [
-            {
-                "id": p.get("id"),
-                "name": p.get("name"),
-                "description": p.get("description"),                
-                "goal": p.get("client_goal"),
-                "success_metric": p.get("success_metric"),
-            }
-            for p in projects
-        ]
-    }
+
+def _projects_from_rows(projects: list) -> list:
+    return [
+        {
+            "id": p.get("id"),
+            "name": p.get("name"),
+            "description": p.get("description"),
+            "goal": p.get("client_goal"),
+            "success_metric": p.get("success_metric"),
+        }
+        for p in projects
+    ]
+
+
+def get_personality_settings(client_email: str) -> dict:
+    """Cached personality settings for a client ({} if none)."""
+    if not client_email:
+        raise ValueError("At least one of user_id or client_id must be provided")
+    return caches["ai_personality_settings"].get(
+        _cache_key(client_email), lambda: _load_personality_settings(client_email)
+    )
+
+
+def get_client_and_project_data(client_email: str) -> dict:
+    """Cached client row and its projects ({} if the sender is not a client)."""
+    if not client_email:
+        raise ValueError("client_email is required")
+
+    client = caches["clients"].get(_cache_key(client_email), lambda: _load_client(client_email))
+    if not client:
+        return {}
+
+    client_id = client["id"]
+    projects = caches["projects"].get(client_id, lambda: _load_projects(client_id))
+    return {"client": client, "projects": projects}
+
+
+def prefetch_client_context(client_emails) -> int:
+    """
+    Resolve personality, client and project rows for many senders with two
+    queries (personality settings via `in_`, clients with their projects
+    embedded) and seed the caches, so per-email lookups become cache hits.
+    Returns the number of senders that had to be fetched.
+    """
+    wanted = {}
+    for email in client_emails:
+        key = _cache_key(email)
+        if email and (key not in caches["ai_personality_settings"] or key not in caches["clients"]):
+            wanted[key] = email
+    if not wanted:
+        return 0
+
+    emails = list(wanted.values())
+    with SUPABASE_PREFETCH.time():
+        settings_result = app.supabase.table("ai_personality_settings") \
+            .select("*") \
+            .in_("contact_email", emails) \
+            .execute()
+        client_result = app.supabase.table("clients") \
+            .select(f"id, name, industry, contact_name, contact_email, priority_level, client_notes, projects({PROJECT_COLUMNS})") \
+            .in_("contact_email", emails) \
+            .execute()
+
+    settings = {_cache_key(row["contact_email"]): _personality_from_row(row) for row in settings_result.data or []}
+    clients = {_cache_key(row["contact_email"]): row for row in client_result.data or []}
+    for key in wanted:
+        caches["ai_personality_settings"].put(key, settings.get(key, {}))
+        row = clients.get(key)
+        if row is None:
+            caches["clients"].put(key, {})
+            continue
+        client = _client_from_row(row)
+        caches["clients"].put(key, client)
+        caches["projects"].put(client["id"], _projects_from_rows(row.get("projects") or []))
+    return len(wanted)
+
+
+# ----------------------------
+# Tool function (wrapped with agents.function_tool when the agent is built)
+# ----------------------------
+def fetch_personality_settings(client_email: str = None) -> dict:
+    """
+    Fetch essential personality settings for LLM agent use.
+
+    Returns only the key fields needed to guide responses.
+    """
+    return get_personality_settings(client_email)
+
+def fetch_client_and_project_data(client_email: str) -> dict:
+    """
+    Fetch key client and project context for the LLM agent.
+    Returns minimal structured data.
+    """
+    return get_client_and_project_data(client_email)
 
    
 # data=fetch_client_and_project_data("xyz@gmail.com")
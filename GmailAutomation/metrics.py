@@ -0,0 +1,263 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger import logger
+
+# ------------------------------------------------------------
+# Pipeline metrics (counters, gauges, latency histograms)
+# ------------------------------------------------------------
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # 0 = no HTTP endpoint
+METRICS_PREFIX = "gmail_automation_"
+# Seconds; Prometheus-style upper bounds (a final +Inf bucket is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+AGE_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that is set, or read from `fn` when the metrics are collected."""
+
+    __slots__ = ("value", "fn")
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, error=exc_type is not None)
+        return False
+
+
+class Histogram:
+    """Bucketed observations with their count and sum; `time()` measures a block and counts the ones that raise."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "errors", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, error: bool = False):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if error:
+                self.errors += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each with one series per label set.
+
+    Look a metric up once (at import or construction time) and keep the
+    returned object: the hot path is then a lock and an add, with no
+    dictionary or label handling per observation.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._families = {}  # name -> {"type", "help", "series": {labels: metric}}
+
+    def _get(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, {"type": kind, "help": help, "series": {}})
+            if family["type"] != kind:
+                raise ValueError(f"metric '{name}' is already registered as a {family['type']}")
+            metric = family["series"].get(key)
+            if metric is None:
+                metric = family["series"][key] = factory()
+            return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get("counter", name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str = "", fn=None, **labels) -> Gauge:
+        gauge = self._get("gauge", name, help, labels, Gauge)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def stage(self, stage: str) -> Histogram:
+        """Latency histogram of one pipeline stage."""
+        return self.histogram("stage_seconds", "Latency of each pipeline stage", stage=stage)
+
+    # ---------------- exposition ----------------
+    def _series(self):
+        with self._lock:
+            return [(name, dict(family), dict(family["series"])) for name, family in sorted(self._families.items())]
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for name, family, series in self._series():
+            full = self.prefix + name
+            lines.append(f"# HELP {full} {family['help']}")
+            lines.append(f"# TYPE {full} {family['type']}")
+            for key, metric in series.items():
+                if family["type"] == "histogram":
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + (float("inf"),), list(metric.counts)):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full}_bucket{self._labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{full}_sum{self._labels(key)} {metric.sum}")
+                    lines.append(f"{full}_count{self._labels(key)} {metric.count}")
+                else:
+                    value = metric.value if family["type"] == "counter" else _safe(metric.get)
+                    lines.append(f"{full}{self._labels(key)} {value}")
+            if family["type"] == "histogram":
+                # Observations whose block raised, as their own counter family
+                lines.append(f"# HELP {full}_errors_total {family['help']} (raised)")
+                lines.append(f"# TYPE {full}_errors_total counter")
+                lines.extend(f"{full}_errors_total{self._labels(key)} {metric.errors}" for key, metric in series.items())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view: counters/gauges as numbers, histograms as count/avg/p50/p95/p99."""
+        out = {}
+        for name, family, series in self._series():
+            values = {}
+            for key, metric in series.items():
+                label = ",".join(f"{k}={v}" for k, v in key) or "_"
+                if family["type"] == "histogram":
+                    values[label] = metric.summary()
+                elif family["type"] == "gauge":
+                    values[label] = _safe(metric.get)
+                else:
+                    values[label] = metric.value
+            out[name] = values
+        return out
+
+
+def _safe(fn):
+    try:
+        return fn()
+    except Exception:
+        return float("nan")
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json (snapshot) on a local port."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, content_type = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"📈 Metrics on http://{self.host}:{self.port}/metrics (JSON: /metrics.json)")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# Shared registry: modules create their metrics here at import time
+metrics = MetricsRegistry()
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+# ------------------------------------------------------------
+# Gmail per-user quota accounting
+# ------------------------------------------------------------
+# Quota units per method, from https://developers.google.com/gmail/api/reference/quota
+GMAIL_QUOTA_UNITS = {
+    "users.getProfile": 1,
+    "users.history.list": 2,
+    "users.labels.list": 1,
+    "users.labels.create": 5,
+    "users.messages.get": 5,
+    "users.messages.attachments.get": 5,
+    "users.messages.modify": 5,
+    "users.messages.batchModify": 50,
+    "users.messages.send": 100,
+    "users.threads.get": 10,
+    "users.watch": 100,
+}
+PER_USER_QUOTA_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", 250))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `consume` blocks until enough tokens are
+    available, so callers stay under the limit instead of reacting to 429s.
+    Requests larger than the capacity are allowed and put the bucket in debt.
+    """
+
+    def __init__(self, rate: float = PER_USER_QUOTA_UNITS_PER_SECOND, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.units_consumed = 0
+        self.wait_seconds = 0.0
+        self.waits = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def time_until(self, units: float) -> float:
+        """Seconds until `units` tokens are available (0 if available now)."""
+        with self._lock:
+            self._refill()
+            needed = min(units, self.capacity) - self._tokens
+            return max(0.0, needed / self.rate)
+
+    def consume(self, units: float) -> float:
+        """Take `units` tokens, sleeping first if needed. Returns seconds waited."""
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (min(units, self.capacity) - self._tokens) / self.rate)
+            self._tokens -= units
+            self.units_consumed += units
+            if wait:
+                self.waits += 1
+                self.wait_seconds += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def charge(self, method: str, calls: int = 1) -> float:
+        """Consume the quota units for `calls` calls of a Gmail API method."""
+        return self.consume(GMAIL_QUOTA_UNITS[method] * calls)
+
+    def stats(self) -> dict:
+        return {
+            "available_units": round(self.available(), 1),
+            "units_consumed": self.units_consumed,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+# Shared per-mailbox quota budget
+gmail_quota = TokenBucket()
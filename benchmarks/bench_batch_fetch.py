@@ -0,0 +1,146 @@
+"""
+Benchmark: batched vs. sequential Gmail message retrieval.
+
+Starts a local fake Gmail endpoint (single messages + /batch/gmail/v1),
+points a real googleapiclient service at it and reports messages/second
+for `fetch_messages_batched` against one `messages.get` per message.
+
+Usage:
+    uv run python benchmarks/bench_batch_fetch.py --messages 200 --latency-ms 20
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import httplib2  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+from googleapiclient.http import BatchHttpRequest  # noqa: E402
+
+from GmailAutomation.RetrivalPipeline.schedular import _message_get_request, fetch_messages_batched  # noqa: E402
+
+MESSAGE_PATH = re.compile(r"/gmail/v1/users/me/messages/([^/?]+)")
+
+
+def fake_message(msg_id):
+    body = base64.urlsafe_b64encode(f"Hello from message {msg_id}".encode()).decode()
+    return {
+        "id": msg_id,
+        "threadId": msg_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "From", "value": "Client <client@example.com>"},
+                {"name": "Subject", "value": f"Subject {msg_id}"},
+                {"name": "Date", "value": "Wed, 01 Oct 2025 15:56:26 +0000"},
+            ],
+            "body": {"data": body},
+        },
+    }
+
+
+def make_handler(latency_s):
+    class FakeGmailHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, content_type, payload):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            match = MESSAGE_PATH.search(self.path)
+            if not match:
+                return self._reply(404, "application/json", b"{}")
+            self._reply(200, "application/json", json.dumps(fake_message(match.group(1))).encode())
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length).decode()
+            boundary = self.headers.get_param("boundary")
+            time.sleep(latency_s)  # one round trip for the whole batch
+
+            out_boundary = "batch_benchmark_boundary"
+            parts = []
+            for part in raw.split(f"--{boundary}"):
+                content_id = re.search(r"Content-ID: <(.+?)>", part)
+                match = MESSAGE_PATH.search(part)
+                if not content_id or not match:
+                    continue
+                body = json.dumps(fake_message(match.group(1)))
+                parts.append(
+                    f"--{out_boundary}\r\n"
+                    "Content-Type: application/http\r\n"
+                    f"Content-ID: <response-{content_id.group(1)}>\r\n\r\n"
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                    f"{body}\r\n"
+                )
+            payload = ("".join(parts) + f"--{out_boundary}--\r\n").encode()
+            self._reply(200, f"multipart/mixed; boundary={out_boundary}", payload)
+
+    return FakeGmailHandler
+
+
+def build_fake_service(endpoint):
+    service = build(
+        "gmail",
+        "v1",
+        http=httplib2.Http(),
+        static_discovery=True,
+        client_options={"api_endpoint": endpoint},
+    )
+    # The batch URI comes from the discovery document's rootUrl, so redirect it too
+    service.new_batch_http_request = lambda callback=None: BatchHttpRequest(
+        callback=callback, batch_uri=f"{endpoint}batch/gmail/v1"
+    )
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated round-trip latency")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+    service = build_fake_service(endpoint)
+    ids = [f"msg{i:05d}" for i in range(args.messages)]
+
+    start = time.perf_counter()
+    sequential = {msg_id: _message_get_request(service, msg_id).execute() for msg_id in ids}
+    sequential_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = fetch_messages_batched(service, ids)
+    batched_s = time.perf_counter() - start
+
+    server.shutdown()
+    assert batched == sequential, "batched results differ from sequential results"
+
+    print(f"messages: {args.messages}, simulated latency: {args.latency_ms} ms")
+    print(f"sequential: {sequential_s:.3f}s  {args.messages / sequential_s:8.1f} msg/s")
+    print(f"batched:    {batched_s:.3f}s  {args.messages / batched_s:8.1f} msg/s")
+    print(f"speedup:    {sequential_s / batched_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
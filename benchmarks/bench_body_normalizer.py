@@ -0,0 +1,188 @@
+"""
+Benchmark: body normalization throughput and correctness.
+
+Builds a corpus of realistic support threads (Gmail "On ... wrote:" replies,
+Outlook header blocks, "> " quoting, signatures, HTML-only mails, multi-MB
+forwarded logs) and reports MB/s for `body_normalizer.clean_body` against
+the previous per-message closure implementation, checking both produce the
+same output on plain-text bodies.
+
+Usage:
+    uv run python benchmarks/bench_body_normalizer.py --scale 1.0
+"""
+import argparse
+import base64
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GmailAutomation.RetrivalPipeline.body_normalizer import clean_body, get_body_from_message  # noqa: E402
+
+
+# ------------------------------------------------------------
+# Previous implementation (closure inside fetch_new_emails), kept as the reference
+# ------------------------------------------------------------
+def legacy_clean_body(text):
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"<\s*[^>]*>", "", text)
+
+    lines = text.split("\n")
+    cleaned_lines = []
+    skip_block = False
+    quote_headers = [
+        r"^On .* wrote:$",
+        r"^From: .*",
+        r"^Sent: .*",
+        r"^To: .*",
+        r"^Subject: .*",
+        r"^---+",
+    ]
+    for line in lines:
+        line = line.strip()
+        if any(re.match(p, line) for p in quote_headers):
+            skip_block = True
+            continue
+        if skip_block and re.match(r"^>+", line):
+            continue
+        if skip_block and line and not line.startswith(">"):
+            skip_block = False
+        cleaned_lines.append(line)
+
+    cleaned_text = "\n".join(cleaned_lines)
+    cleaned_text = re.sub(r"\n{3,}", "\n\n", cleaned_text)
+    return cleaned_text.strip()
+
+
+# ------------------------------------------------------------
+# Corpus
+# ------------------------------------------------------------
+SENTENCES = [
+    "Hi team, I keep getting an error whenever I try logging into the dashboard.",
+    "Can you check why the export to CSV stops at 10,000 rows?",
+    "The latest patch fixed everything. Thanks for the quick help!",
+    "We created a Builder called \"Urbanest Realty\" with 3 projects.",
+    "Please see the attached screenshot, the button does nothing when clicked.",
+    "Is there a way to schedule the weekly report for Monday mornings?",
+    "Our users report that the page takes more than 30 seconds to load.",
+]
+SIGNATURE = "\n--\nJane Doe\nOperations Lead | Example Corp\n+1 555 0100\n"
+
+
+def paragraph(rng, n):
+    return " ".join(rng.choice(SENTENCES) for _ in range(n))
+
+
+def gmail_thread(rng, depth):
+    body = paragraph(rng, 3) + SIGNATURE
+    for level in range(1, depth + 1):
+        quoted = "\n".join(">" * level + " " + line for line in paragraph(rng, 4).split(". "))
+        body += f"\n\nOn Wed, Oct {level} 2025 at 10:{level:02d} AM Client <client@example.com> wrote:\n{quoted}\n"
+    return body
+
+
+def outlook_thread(rng, depth):
+    body = paragraph(rng, 2) + "\r\n"
+    for level in range(depth):
+        body += (
+            "\r\n-----Original Message-----\r\n"
+            f"From: Support <support@example.com>\r\nSent: Monday, October {level + 1}, 2025 9:00 AM\r\n"
+            "To: client@example.com\r\nSubject: RE: Dashboard issue\r\n\r\n"
+            + paragraph(rng, 3)
+            + "\r\n"
+        )
+    return body
+
+
+def forwarded_log(rng, size_bytes):
+    lines = []
+    total = 0
+    while total < size_bytes:
+        line = f"2025-10-01 12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} ERROR worker-{rng.randint(1, 9)} <db> timeout after {rng.randint(1, 30)}s (retries < 3)"
+        lines.append(line)
+        total += len(line) + 1
+    return "Forwarding the logs from production:\n\n" + "\n".join(lines)
+
+
+def html_mail(rng):
+    return (
+        "<html><head><style>p{color:red}</style></head><body>"
+        f"<div dir=\"ltr\"><p>{paragraph(rng, 2)}</p><p>Thanks &amp; regards,<br>Jane</p></div>"
+        "<div class=\"gmail_quote\"><div>On Tue wrote:</div><blockquote>old text</blockquote></div>"
+        "</body></html>"
+    )
+
+
+def build_corpus(scale, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(int(400 * scale)):
+        corpus.append(("short", paragraph(rng, rng.randint(1, 3))))
+    for _ in range(int(150 * scale)):
+        corpus.append(("gmail_thread", gmail_thread(rng, rng.randint(2, 12))))
+    for _ in range(int(100 * scale)):
+        corpus.append(("outlook_thread", outlook_thread(rng, rng.randint(2, 8))))
+    for _ in range(max(1, int(3 * scale))):
+        corpus.append(("forwarded_log_2mb", forwarded_log(rng, 2 * 1024 * 1024)))
+    return corpus
+
+
+def throughput(fn, texts, repeat):
+    total_bytes = sum(len(t.encode()) for t in texts) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    return total_bytes / elapsed / (1024 * 1024), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.scale)
+    mismatches = [kind for kind, text in corpus if clean_body(text) != legacy_clean_body(text)]
+    print(f"corpus: {len(corpus)} bodies, {sum(len(t) for _, t in corpus) / 1024 / 1024:.1f} MB")
+    print(f"correctness: {len(corpus) - len(mismatches)}/{len(corpus)} identical to the previous clean_body")
+    if mismatches:
+        print(f"  mismatching kinds: {sorted(set(mismatches))}")
+
+    by_kind = {}
+    for kind, text in corpus:
+        by_kind.setdefault(kind, []).append(text)
+    print(f"{'kind':<20}{'legacy MB/s':>14}{'new MB/s':>12}{'speedup':>10}")
+    for kind, texts in by_kind.items():
+        legacy_mbs, _ = throughput(legacy_clean_body, texts, args.repeat)
+        new_mbs, _ = throughput(clean_body, texts, args.repeat)
+        print(f"{kind:<20}{legacy_mbs:>14.1f}{new_mbs:>12.1f}{new_mbs / legacy_mbs:>9.1f}x")
+
+    # Linear-time check: a stray '<' with no closing '>' made the old tag regex quadratic
+    for size_kb in (64, 128, 256):
+        text = "if a < b then retry\n" * (size_kb * 1024 // 20)
+        timings = []
+        for fn in (legacy_clean_body, clean_body):
+            start = time.perf_counter()
+            fn(text)
+            timings.append(time.perf_counter() - start)
+        print(f"unclosed '<' x{text.count('<'):>6} ({size_kb:>3} KB): legacy {timings[0]:.3f}s, new {timings[1]:.4f}s")
+
+    # HTML-only messages now fall back to converted text/html instead of an empty body
+    rng = random.Random(1)
+    message = {
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "parts": [{"mimeType": "text/html", "body": {"data": base64.urlsafe_b64encode(html_mail(rng).encode()).decode()}}],
+        }
+    }
+    body, _ = get_body_from_message(message)
+    print(f"html-only fallback: {clean_body(body)[:80]!r}")
+
+
+if __name__ == "__main__":
+    main()
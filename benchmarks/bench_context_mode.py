@@ -0,0 +1,169 @@
+"""
+Benchmark: tool-calling vs pre-resolved context mode.
+
+Runs the same emails through `process_email_async` in both context modes
+and reports latency, model turns, tokens and Supabase round trips per email.
+
+By default the LLM is a scripted stand-in that behaves like the real agent
+(calls `fetch_personality_settings` first, `fetch_client_and_project_data`
+when the body mentions a project) and simulates provider latency from the
+prompt size; tokens are estimated at 4 characters per token. Pass --live to
+use the model configured in .env instead (real latency and token usage).
+
+Usage:
+    uv run python benchmarks/bench_context_mode.py --emails 20
+    uv run python benchmarks/bench_context_mode.py --emails 5 --live
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ.setdefault("MODEL_NAME", "bench-model")
+
+from agents import RunConfig  # noqa: E402
+from agents.items import ModelResponse  # noqa: E402
+from agents.models.interface import Model  # noqa: E402
+from agents.usage import Usage  # noqa: E402
+from openai.types.responses import ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText  # noqa: E402
+
+from fakes import FakeSupabase  # noqa: E402
+from GmailAutomation import db  # noqa: E402
+from GmailAutomation.app_context import app  # noqa: E402
+from GmailAutomation.LLM import EmailAgent  # noqa: E402
+
+
+# ------------------------------------------------------------
+# Scripted model
+# ------------------------------------------------------------
+class ScriptedModel(Model):
+    """Emits the tool calls the real agent makes, then a JSON answer."""
+
+    def __init__(self, base_latency, per_1k_tokens):
+        self.base_latency = base_latency
+        self.per_1k_tokens = per_1k_tokens
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                           tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else list(input)
+        prompt_text = (system_instructions or "") + json.dumps(items, default=str)
+        called = {item.get("name") for item in items if isinstance(item, dict) and item.get("type") == "function_call"}
+        message = items[0]["content"]
+        tool_names = {tool.name for tool in tools}
+
+        if "fetch_personality_settings" in tool_names and "fetch_personality_settings" not in called:
+            output = self._call("fetch_personality_settings", message, len(called))
+        elif ("fetch_client_and_project_data" in tool_names and "project" in message.lower()
+              and "fetch_client_and_project_data" not in called):
+            output = self._call("fetch_client_and_project_data", message, len(called))
+        else:
+            output = self._answer(message)
+
+        input_tokens = len(prompt_text) // 4
+        output_tokens = len(json.dumps(output.model_dump())) // 4
+        await asyncio.sleep(self.base_latency + self.per_1k_tokens * input_tokens / 1000)
+        usage = Usage(requests=1, input_tokens=input_tokens, output_tokens=output_tokens,
+                      total_tokens=input_tokens + output_tokens)
+        return ModelResponse(output=[output], usage=usage, response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @staticmethod
+    def _field(message, name):
+        for line in message.splitlines():
+            if line.startswith(f"{name}: "):
+                return line[len(name) + 2:].strip()
+        return ""
+
+    def _call(self, name, message, n):
+        arguments = json.dumps({"client_email": self._field(message, "From")})
+        return ResponseFunctionToolCall(arguments=arguments, call_id=f"call_{n}", name=name, type="function_call")
+
+    def _answer(self, message):
+        answer = {
+            "Message_ID": self._field(message, "Message_ID"), "query": "", "escalate": False, "priority": "",
+            "escalation_reason": "", "response": "Thanks for reaching out, we are looking into it.",
+            "subject": f"Re: {self._field(message, 'Subject')}", "to_email": self._field(message, "From"),
+            "reply_to": True,
+        }
+        return ResponseOutputMessage(
+            id="msg", role="assistant", status="completed", type="message",
+            content=[ResponseOutputText(text=json.dumps(answer), type="output_text", annotations=[])],
+        )
+
+
+# ------------------------------------------------------------
+# Runner
+# ------------------------------------------------------------
+def build_emails(n, senders):
+    emails = []
+    for i in range(n):
+        body = ("Can you share the status of the project rollout?" if i % 2 else
+                "Hi, I keep getting an error whenever I try logging into the dashboard.")
+        emails.append({"Message_ID": f"m{i}", "From": senders[i % len(senders)], "Subject": f"Question {i}",
+                       "Body": body, "is_important": False, "Date": "2025-10-01", "attachment_data": []})
+    return emails
+
+
+def run_mode(mode, emails, backend):
+    db.invalidate_cache()
+    before = backend.round_trips if backend else 0
+
+    async def run_all():
+        if mode == "preresolved":
+            # What main.run_cycle does once per poll cycle
+            await asyncio.to_thread(db.prefetch_client_context, {email["From"] for email in emails})
+        for email in emails:
+            await EmailAgent.process_email_async(email, mode=mode)
+
+    start = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+    stats = EmailAgent.agent_run_stats.stats()[mode]
+    stats["wall_s_per_email"] = round(elapsed / len(emails), 3)
+    stats["db_round_trips"] = (backend.round_trips - before) if backend else "n/a"
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=20)
+    parser.add_argument("--senders", type=int, default=5)
+    parser.add_argument("--db-latency", type=float, default=0.04, help="simulated Supabase round trip (s)")
+    parser.add_argument("--turn-latency", type=float, default=0.4, help="simulated fixed latency per model turn (s)")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.05, help="simulated latency per 1k prompt tokens (s)")
+    parser.add_argument("--live", action="store_true", help="use the model configured in .env")
+    args = parser.parse_args()
+
+    senders = [f"client{i}@example.com" for i in range(args.senders)]
+    EmailAgent.response_cache = None  # measure every agent run, not reused replies
+    backend = None
+    if not args.live:
+        backend = FakeSupabase(senders, args.db_latency)
+        app.override("supabase", backend)
+        app.override("run_config", RunConfig(model=ScriptedModel(args.turn_latency, args.per_1k_tokens), tracing_disabled=True))
+    emails = build_emails(args.emails, senders)
+
+    results = {mode: run_mode(mode, emails, backend) for mode in ("tools", "preresolved")}
+    columns = ["avg_latency_s", "wall_s_per_email", "avg_turns", "avg_input_tokens", "avg_output_tokens", "db_round_trips"]
+    print(f"{args.emails} emails from {args.senders} senders ({'live model' if args.live else 'scripted model'})")
+    print(f"{'':<14}" + "".join(f"{c:>19}" for c in columns))
+    for mode, stats in results.items():
+        print(f"{mode:<14}" + "".join(f"{stats[c]!s:>19}" for c in columns))
+    tools, pre = results["tools"], results["preresolved"]
+    print(f"latency x{tools['avg_latency_s'] / pre['avg_latency_s']:.2f}, "
+          f"input tokens x{tools['avg_input_tokens'] / max(pre['avg_input_tokens'], 1):.2f}, "
+          f"turns {tools['avg_turns']} -> {pre['avg_turns']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Benchmark: end-to-end load test of main's pipeline, offline.
+
+Runs `main.run_cycle()` (or, with --work-queue, `main.enqueue_cycle()` plus
+the queue consumer thread), with the adaptive poll scheduler, quota bucket,
+checkpoint store, label batching, ... exactly as main does, against the
+in-process fakes in benchmarks/fakes.py: a Gmail mailbox, the Supabase
+tables and an OpenAI-compatible endpoint that the real agents SDK talks to
+over HTTP. A background thread delivers synthetic mail in bursts; the run
+ends when every client email has been replied to / escalated (or on
+--timeout).
+
+Reports emails/second, end-to-end latency (delivery -> reply sent or
+escalation label applied) p50/p95/p99, API calls per email for each
+backend, injected errors, and the pipeline's own stage metrics.
+
+Some bodies say "project" (extra tool call in tools mode) and some say
+"urgent"/"refund" (escalated). --stranger-rate adds mail from non-clients,
+which the allowlist drops; --followup-rate adds a quick second message in
+the same thread (merged by the thread coalescer, which it turns on); --trivial-rate sends
+acknowledgements that the fast path answers without the LLM. Every backend takes a
+latency and error rate.
+
+Usage:
+    uv run python benchmarks/bench_load.py --bursts 4 --burst-size 25
+    uv run python benchmarks/bench_load.py --processing pooled --context preresolved --no-quota
+    uv run python benchmarks/bench_load.py --work-queue --processing pooled
+    uv run python benchmarks/bench_load.py --gmail-error-rate 0.02 --llm-error-rate 0.02 --bad-output-rate 0.05
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeGmail, FakeLLMServer, FakeSupabase  # noqa: E402
+
+BODIES = [
+    "Hi, I keep getting an error whenever I try logging into the dashboard. Request {n}.",
+    "Can you share the status of the project rollout? We need it for the board meeting. Request {n}.",
+    "The export to CSV leaves out the last column, see the attached report. Request {n}.",
+    "This is urgent: the invoice was charged twice and we need a refund today. Request {n}.",
+    "How do I add a new teammate to our workspace? Request {n}.",
+]
+TRIVIAL_BODIES = ("Thanks, that fixed it!", "Thank you so much, all good now.", "Got it, thanks for the quick reply.")
+ATTACHMENT = b"date,leads,closed\n" + b"2025-10-01,12,3\n" * 200
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def deliver_bursts(gmail, args, clients, delivered, done):
+    """Delivers `bursts` x `burst_size` emails, `gap` seconds apart."""
+    n = 0
+    for burst in range(args.bursts):
+        for _ in range(args.burst_size):
+            stranger = gmail.rng.random() < args.stranger_rate
+            sender = f"stranger{n}@elsewhere.com" if stranger else clients[n % len(clients)]
+            trivial = gmail.rng.random() < args.trivial_rate
+            body = TRIVIAL_BODIES[n % len(TRIVIAL_BODIES)] if trivial else BODIES[n % len(BODIES)].format(n=n)
+            attachment = ATTACHMENT if not trivial and gmail.rng.random() < args.attachment_rate else None
+            msg_id = gmail.deliver(sender, f"Question {n}", body, attachment=attachment, important=n % 7 == 0)
+            if not stranger:
+                delivered.append(msg_id)
+                if gmail.rng.random() < args.followup_rate:
+                    followup = gmail.deliver(sender, f"Re: Question {n}", f"One more detail for request {n}.",
+                                             thread_id=gmail.messages[msg_id]["threadId"])
+                    delivered.append(followup)
+            n += 1
+        if burst < args.bursts - 1:
+            time.sleep(args.gap)
+    done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--burst-size", type=int, default=25)
+    parser.add_argument("--gap", type=float, default=5.0, help="seconds between bursts")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--stranger-rate", type=float, default=0.1, help="share of mail from non-clients")
+    parser.add_argument("--attachment-rate", type=float, default=0.1)
+    parser.add_argument("--trivial-rate", type=float, default=0.0, help="share of one-line acknowledgements")
+    parser.add_argument("--followup-rate", type=float, default=0.0, help="share of emails followed up in their thread")
+    parser.add_argument("--processing", choices=["serial", "pooled"], default="serial")
+    parser.add_argument("--context", choices=["tools", "preresolved"], default="tools")
+    parser.add_argument("--work-queue", action="store_true", help="fetch and process in separate loops (WORK_QUEUE=on)")
+    parser.add_argument("--no-quota", action="store_true", help="disable the Gmail quota bucket")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--no-fast-path", action="store_true", help="send trivial emails to the LLM too")
+    parser.add_argument("--gmail-latency", type=float, default=0.05, help="per Gmail HTTP round trip (s)")
+    parser.add_argument("--db-latency", type=float, default=0.04, help="per Supabase query (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="fixed latency per model turn (s)")
+    parser.add_argument("--llm-per-1k-tokens", type=float, default=0.05, help="latency per 1k prompt tokens (s)")
+    parser.add_argument("--gmail-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--bad-output-rate", type=float, default=0.0, help="share of unparseable model answers")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's INFO logs")
+    args = parser.parse_args()
+
+    clients = [f"client{i}@example.com" for i in range(args.clients)]
+    gmail = FakeGmail(latency=args.gmail_latency, error_rate=args.gmail_error_rate, seed=args.seed)
+    supabase = FakeSupabase(clients, latency=args.db_latency, error_rate=args.db_error_rate, seed=args.seed)
+    llm = FakeLLMServer(latency=args.llm_latency, per_1k_tokens=args.llm_per_1k_tokens, error_rate=args.llm_error_rate,
+                        bad_output_rate=args.bad_output_rate, seed=args.seed).start()
+
+    # main reads its settings at import time, from a scratch working directory (log, checkpoint, attachments)
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    os.chdir(workdir)
+    os.environ.update({
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_KEY": "benchmark",
+        "OPENROUTER_API_KEY": "benchmark",
+        "MODEL_NAME": "benchmark-model",
+        "BASE_URL": llm.base_url,
+        "PROCESSING_MODE": args.processing,
+        "CONTEXT_MODE": args.context,
+        "WORK_QUEUE": "on" if args.work_queue else "off",
+        "WORK_QUEUE_RETRY_DELAY": os.environ.get("WORK_QUEUE_RETRY_DELAY", "1"),
+        "RESPONSE_CACHE": "off" if args.no_response_cache else "on",
+        "FAST_PATH": "off" if args.no_fast_path else os.environ.get("FAST_PATH", "on"),
+        "CHECKPOINT_PATH": os.path.join(workdir, "checkpoint.db"),
+        "ATTACHMENT_STORE_DIR": os.path.join(workdir, "attachments"),
+        "POLL_MAX_INTERVAL": os.environ.get("POLL_MAX_INTERVAL", "3"),
+        "THREAD_COALESCING": os.environ.get("THREAD_COALESCING", "on" if args.followup_rate else "off"),
+        "COALESCE_WINDOW": os.environ.get("COALESCE_WINDOW", "2"),
+        "EXTRACTION_WORKERS": os.environ.get("EXTRACTION_WORKERS", "2"),
+    })
+    import main as pipeline
+    from agents import set_tracing_disabled
+    from GmailAutomation.app_context import app
+    from GmailAutomation.metrics import metrics
+    from GmailAutomation.quota import gmail_quota
+    from GmailAutomation.RetrivalPipeline.poll_scheduler import poll_scheduler
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    set_tracing_disabled(True)
+    app.override("supabase", supabase)
+    pipeline.gmail_services.get = lambda: gmail
+    if args.no_quota:
+        gmail_quota.rate = gmail_quota.capacity = gmail_quota._tokens = 1e12
+
+    pipeline.run_cycle()  # initializes the history cursor, like main's first poll
+    delivered, done = [], threading.Event()
+    injector = threading.Thread(target=deliver_bursts, args=(gmail, args, clients, delivered, done), daemon=True)
+    started = time.time()
+    injector.start()
+
+    consumer, stop_consumer = None, threading.Event()
+    if args.work_queue:
+        consumer = threading.Thread(target=pipeline.consume_loop, args=(stop_consumer,), daemon=True)
+        consumer.start()
+    cycle = pipeline.enqueue_cycle if consumer is not None else pipeline.run_cycle
+
+    cycles = cycle_errors = 0
+    deadline = started + args.timeout
+    while time.time() < deadline:
+        try:
+            found = cycle()
+        except Exception as e:  # main would stop here; keep going so the run finishes
+            cycle_errors += 1
+            found = 0
+            if args.verbose:
+                print(f"cycle failed: {type(e).__name__}: {e}")
+        cycles += 1
+        if done.is_set() and all(msg_id in gmail.acted_at for msg_id in delivered):
+            break
+        poll_scheduler.record_cycle(found)
+        poll_scheduler.wait()
+
+    if consumer is not None:
+        stop_consumer.set()
+        consumer.join()
+    if pipeline.processing_pool is not None:
+        pipeline.processing_pool.close()
+    pipeline.attachment_extractor.close()
+    app.checkpoint_store.close()
+    llm.stop()
+
+    # ---------------- report ----------------
+    handled = [m for m in delivered if m in gmail.acted_at]
+    latencies = sorted(gmail.acted_at[m] - gmail.delivered_at[m] for m in handled)
+    n = max(len(handled), 1)
+    first = min((gmail.delivered_at[m] for m in delivered), default=started)
+    last = max((gmail.acted_at[m] for m in handled), default=first)
+
+    print(f"{len(delivered)} client emails in {args.bursts} burst(s) of {args.burst_size} "
+          f"({args.processing}, {args.context}, quota {'off' if args.no_quota else 'on'})")
+    print(f"handled        {len(handled)}/{len(delivered)} in {cycles} cycles ({cycle_errors} failed)"
+          f"{'  TIMED OUT' if len(handled) < len(delivered) else ''}")
+    print(f"throughput     {len(handled) / max(last - first, 1e-9):.2f} emails/s over {last - first:.1f} s")
+    print(f"end-to-end     p50 {percentile(latencies, 50):.2f} s  p95 {percentile(latencies, 95):.2f} s  "
+          f"p99 {percentile(latencies, 99):.2f} s  max {latencies[-1] if latencies else 0:.2f} s")
+
+    print("\ncalls per email")
+    for method, count in sorted(gmail.calls.items()):
+        print(f"  gmail {method:<34}{count / n:>8.2f}")
+    for table, count in sorted(supabase.calls.items()):
+        print(f"  supabase {table:<31}{count / n:>8.2f}")
+    print(f"  llm {'chat.completions':<36}{llm.calls['chat.completions'] / n:>8.2f}")
+    print(f"  llm tokens (prompt / completion)        {llm.prompt_tokens / n:>8.0f} / {llm.completion_tokens / n:.0f}")
+
+    errors = {f"gmail {k}": v for k, v in gmail.errors.items()}
+    errors.update({f"supabase {k}": v for k, v in supabase.errors.items()})
+    errors.update({f"llm {k}": v for k, v in llm.errors.items()})
+    print(f"\ninjected errors {json.dumps(errors) if errors else 'none'}")
+    print(f"quota          {gmail_quota.stats()}")
+    if consumer is not None:
+        print(f"work queue     {app.work_queue.stats()}")
+    if app.fast_path is not None:
+        print(f"fast path      {app.fast_path.stats()}")
+    if pipeline.thread_coalescer is not None:
+        print(f"coalescing     {pipeline.thread_coalescer.stats()}")
+    print(f"poll decisions {poll_scheduler.stats()['decisions']}")
+
+    print("\nstage latency (s)")
+    print(f"  {'stage':<24}{'count':>7}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, s in sorted(metrics.snapshot().get("stage_seconds", {}).items()):
+        print(f"  {label.split('=', 1)[-1]:<24}{s['count']:>7}{s['errors']:>8}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['p99']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
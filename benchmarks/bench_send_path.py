@@ -0,0 +1,161 @@
+"""
+Benchmark: Gmail API calls and bytes per reply.
+
+Starts a local fake Gmail endpoint and sends the same replies three ways:
+  legacy    - previous create_reply_message: messages.get(format=full) + getProfile + send
+  metadata  - send_reply without fetched headers: messages.get(format=metadata) + send
+              (getProfile only once per process)
+  reused    - send_reply with the headers parse_message already extracted: send only
+
+Usage:
+    uv run python benchmarks/bench_send_path.py --replies 50 --thread-kb 200
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from email.mime.text import MIMEText
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import httplib2  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+MESSAGE_PATH = re.compile(r"/gmail/v1/users/me/messages/([^/?]+)$")
+
+
+def fake_message(msg_id, thread_kb, metadata_only):
+    headers = [
+        {"name": "From", "value": "Client <client@example.com>"},
+        {"name": "Subject", "value": f"Dashboard issue {msg_id}"},
+        {"name": "Date", "value": "Wed, 01 Oct 2025 15:56:26 +0000"},
+        {"name": "Message-ID", "value": f"<{msg_id}@mail.example.com>"},
+        {"name": "References", "value": "<first@mail.example.com>"},
+    ]
+    if metadata_only:
+        return {"id": msg_id, "threadId": f"t-{msg_id}", "labelIds": ["INBOX"], "payload": {"headers": headers}}
+    history = ("> previous message in the thread with quoted history\n" * (thread_kb * 1024 // 52)).encode()
+    data = base64.urlsafe_b64encode(history).decode()
+    return {
+        "id": msg_id,
+        "threadId": f"t-{msg_id}",
+        "labelIds": ["INBOX"],
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": headers + [{"name": f"X-Header-{i}", "value": "x" * 60} for i in range(30)],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"data": data}},
+                {"mimeType": "text/html", "body": {"data": data}},
+            ],
+        },
+    }
+
+
+def make_handler(stats, thread_kb, latency_s):
+    class FakeGmailHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, method, payload, sent=0):
+            body = json.dumps(payload).encode()
+            stats["calls"][method] += 1
+            stats["bytes_down"] += len(body)
+            stats["bytes_up"] += sent
+            time.sleep(latency_s)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.endswith("/profile"):
+                return self._reply("getProfile", {"emailAddress": "support@example.com", "historyId": "1"})
+            match = MESSAGE_PATH.search(url.path)
+            fmt = parse_qs(url.query).get("format", ["full"])[0]
+            self._reply(f"messages.get({fmt})", fake_message(match.group(1), thread_kb, fmt == "metadata"))
+
+        def do_POST(self):
+            sent = len(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self._reply("messages.send", {"id": "sent", "threadId": "t"}, sent)
+
+    return FakeGmailHandler
+
+
+# ------------------------------------------------------------
+# Previous implementation, kept as the reference
+# ------------------------------------------------------------
+def legacy_send_reply(service, message_id, body):
+    original = service.users().messages().get(userId="me", id=message_id, format="full").execute()
+    headers = original["payload"]["headers"]
+    subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "")
+    sender_email = next((h["value"] for h in headers if h["name"].lower() == "from"), "")
+    msg_id_header = next((h["value"] for h in headers if h["name"].lower() == "message-id"), None)
+    message = MIMEText(body, "plain")
+    message["to"] = sender_email
+    message["from"] = service.users().getProfile(userId="me").execute().get("emailAddress")
+    message["subject"] = subject if subject.lower().startswith("re:") else f"Re: {subject}"
+    if msg_id_header:
+        message["In-Reply-To"] = msg_id_header
+        message["References"] = msg_id_header
+    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    service.users().messages().send(userId="me", body={"raw": raw, "threadId": original["threadId"]}).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=50)
+    parser.add_argument("--thread-kb", type=int, default=200, help="size of the quoted thread in each message")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated round-trip latency")
+    args = parser.parse_args()
+
+    stats = {"calls": Counter(), "bytes_down": 0, "bytes_up": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stats, args.thread_kb, args.latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+    service = build("gmail", "v1", http=httplib2.Http(), static_discovery=True, client_options={"api_endpoint": endpoint})
+
+    from GmailAutomation.InsertionPipeline import sendEmail
+    sendEmail.gmail_services.get = lambda: service
+    # Measure the API traffic, not the per-user quota pacing (the legacy copy is not paced either)
+    sendEmail.gmail_quota.rate = sendEmail.gmail_quota.capacity = float("inf")
+    ids = [f"msg{i:05d}" for i in range(args.replies)]
+    body = "Thanks for reaching out, you might try clearing the session cache."
+
+    def run(label, send_one):
+        stats["calls"].clear()
+        stats["bytes_down"] = stats["bytes_up"] = 0
+        sendEmail._sender_address = None
+        start = time.perf_counter()
+        for msg_id in ids:
+            send_one(msg_id)
+        elapsed = time.perf_counter() - start
+        calls = sum(stats["calls"].values())
+        print(f"{label:<10}{calls / len(ids):>12.2f}{stats['bytes_down'] / len(ids) / 1024:>14.1f}"
+              f"{stats['bytes_up'] / len(ids) / 1024:>12.1f}{elapsed / len(ids) * 1000:>10.1f}   {dict(stats['calls'])}")
+
+    print(f"replies: {args.replies}, thread size: {args.thread_kb} KB, latency: {args.latency_ms} ms")
+    print(f"{'path':<10}{'calls/reply':>12}{'KB down/reply':>14}{'KB up/reply':>12}{'ms/reply':>10}   calls")
+    run("legacy", lambda msg_id: legacy_send_reply(service, msg_id, body))
+    run("metadata", lambda msg_id: sendEmail.send_reply(msg_id, body))
+    # What parse_message hands over: the headers of the message it already downloaded
+    parsed = {msg_id: sendEmail.reply_headers_from_message(fake_message(msg_id, 0, True)) for msg_id in ids}
+    run("reused", lambda msg_id: sendEmail.send_reply(msg_id, body, original=parsed[msg_id]))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
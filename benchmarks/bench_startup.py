@@ -0,0 +1,127 @@
+"""
+Benchmark: cold start, from process launch to the end of the first poll.
+
+Each run launches a fresh interpreter under `python -X importtime` in an
+empty working directory, imports main, and runs one poll cycle against a
+local fake Gmail endpoint (a real googleapiclient service, no OAuth).
+Reports the launch -> imported -> first poll timings (median of the runs),
+the slowest imports, and which app context clients were created by then.
+
+--eager also creates every registered client (Supabase, OpenAI client,
+agents, ...) right after the import, which is what importing the pipeline
+used to cost before they were created lazily.
+
+Usage:
+    uv run python benchmarks/bench_startup.py --runs 5
+    uv run python benchmarks/bench_startup.py --runs 5 --eager
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+launched = float(sys.argv[1])
+marks = {{"interpreter": time.time()}}
+import main
+marks["imported"] = time.time()
+from GmailAutomation.app_context import app
+if {eager!r}:
+    for name in app.stats()["registered"]:
+        getattr(app, name)
+    marks["eager_init"] = time.time()
+import httplib2
+from googleapiclient.discovery import build
+service = build("gmail", "v1", http=httplib2.Http(), static_discovery=True,
+                client_options={{"api_endpoint": {endpoint!r}}})
+main.gmail_services.get = lambda: service
+main.run_cycle()
+marks["first_poll"] = time.time()
+app.checkpoint_store.close()
+print("RESULT " + json.dumps({{"marks": {{k: (v - launched) * 1000 for k, v in marks.items()}},
+                               "initialized": app.stats()["initialized"]}}))
+"""
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"emailAddress": "support@example.com", "historyId": "1000"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_once(endpoint, eager):
+    env = {
+        **os.environ,
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_KEY": "benchmark",
+        "OPENROUTER_API_KEY": "benchmark",
+        "MODEL_NAME": "benchmark-model",
+    }
+    code = CHILD.format(root=ROOT, endpoint=endpoint, eager=eager)
+    with tempfile.TemporaryDirectory() as cwd:
+        launched = time.time()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code, str(launched)],
+                              cwd=cwd, env=env, capture_output=True, text=True)
+    result = next((line for line in proc.stdout.splitlines() if line.startswith("RESULT ")), None)
+    if proc.returncode or result is None:
+        sys.exit(f"child failed:\n{proc.stderr[-3000:]}")
+    imports = {}
+    for match in IMPORT_LINE.finditer(proc.stderr):
+        _, cumulative, indent, name = match.groups()
+        imports[name] = (int(cumulative) / 1000, len(indent))
+    return json.loads(result[len("RESULT "):]), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="also create every app context client after import")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmailHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    runs = [run_once(endpoint, args.eager) for _ in range(args.runs)]
+    server.shutdown()
+
+    print(f"{args.runs} cold start(s){' with eager client creation' if args.eager else ''}")
+    print(f"{'milestone':<14}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for mark in runs[0][0]["marks"]:
+        values = [result["marks"][mark] for result, _ in runs]
+        print(f"{mark:<14}{statistics.median(values):>12.0f}{min(values):>10.0f}{max(values):>10.0f}")
+    print(f"clients created by the first poll: {runs[-1][0]['initialized'] or 'none'}")
+
+    # Imports are profiled on the last run; top-level packages and the repo's own modules only
+    _, imports = runs[-1]
+    top_level = [(ms, name) for name, (ms, depth) in imports.items()
+                 if "." not in name or name.startswith("GmailAutomation")]
+    print("\nslowest imports (cumulative ms, last run):")
+    for ms, name in sorted(top_level, reverse=True)[:args.top]:
+        print(f"  {ms:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
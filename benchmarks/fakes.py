@@ -0,0 +1,463 @@
+"""
+In-process stand-ins for the external services, for benchmarks.
+
+  FakeGmail     - the googleapiclient Gmail `service` resource (the calls the
+                  pipeline makes: getProfile, history.list, batched messages.get,
+                  attachments.get, send, batchModify, labels)
+  FakeSupabase  - the Supabase tables used in db.py (clients with embedded
+                  projects, projects, ai_personality_settings)
+  FakeLLMServer - an OpenAI-compatible /chat/completions endpoint on a local
+                  port, answering like the real agent (tool calls, then JSON)
+
+Each one counts its calls and takes a latency and an error rate.
+"""
+import base64
+import email
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+class FakeBackend:
+    """Latency, error injection and call counting shared by the fakes."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def round_trip(self, method: str, sleep: bool = True) -> bool:
+        """Count one call, wait the latency; returns True if this call should fail."""
+        with self.lock:
+            self.calls[method] += 1
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors[method] += 1
+        if sleep and self.latency:
+            time.sleep(self.latency)
+        return failed
+
+
+# ------------------------------------------------------------
+# Gmail
+# ------------------------------------------------------------
+def http_error(status: int, reason: str = "fake error") -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), json.dumps({"error": {"message": reason}}).encode())
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode()
+
+
+class _Request:
+    def __init__(self, gmail, method, fn):
+        self.gmail = gmail
+        self.method = method
+        self.fn = fn
+
+    def execute(self, num_retries: int = 0, sleep: bool = True):
+        for attempt in range(num_retries + 1):
+            if not self.gmail.round_trip(self.method, sleep=sleep):
+                return self.fn()
+        raise http_error(500, f"{self.method} failed")
+
+
+class _Batch:
+    """One HTTP round trip; each sub-request succeeds or fails on its own."""
+
+    def __init__(self, gmail, callback):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        if self.gmail.round_trip("batch"):
+            raise http_error(503, "batch failed")
+        for request_id, request in self.requests:
+            try:
+                response = request.execute(sleep=False)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+            else:
+                self.callback(request_id, response, None)
+
+
+class _Resource:
+    """`service.users()`, `.messages()`, ... all return the same object; methods build _Requests."""
+
+    def __init__(self, gmail):
+        self.g = gmail
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return _History(self.g)
+
+    def labels(self):
+        return _Labels(self.g)
+
+    def attachments(self):
+        return _Attachments(self.g)
+
+    def getProfile(self, userId="me"):
+        return _Request(self.g, "users.getProfile", self.g.profile)
+
+    def get(self, userId="me", id=None, format="full", metadataHeaders=None):
+        return _Request(self.g, "users.messages.get", lambda: self.g.get_message(id, format))
+
+    def send(self, userId="me", body=None):
+        return _Request(self.g, "users.messages.send", lambda: self.g.record_send(body))
+
+    def batchModify(self, userId="me", body=None):
+        return _Request(self.g, "users.messages.batchModify", lambda: self.g.record_modify(body["ids"]))
+
+    def modify(self, userId="me", id=None, body=None):
+        return _Request(self.g, "users.messages.modify", lambda: self.g.record_modify([id]))
+
+
+class _History:
+    def __init__(self, gmail):
+        self.g = gmail
+
+    def list(self, userId="me", startHistoryId=None, historyTypes=None, pageToken=None):
+        return _Request(self.g, "users.history.list", lambda: self.g.history_page(startHistoryId, pageToken))
+
+
+class _Labels:
+    def __init__(self, gmail):
+        self.g = gmail
+
+    def list(self, userId="me"):
+        return _Request(self.g, "users.labels.list", lambda: {"labels": list(self.g.labels.values())})
+
+    def create(self, userId="me", body=None):
+        return _Request(self.g, "users.labels.create", lambda: self.g.create_label(body["name"]))
+
+
+class _Attachments:
+    def __init__(self, gmail):
+        self.g = gmail
+
+    def get(self, userId="me", messageId=None, id=None):
+        return _Request(self.g, "users.messages.attachments.get", lambda: dict(self.g.attachments[id]))
+
+
+class FakeGmail(FakeBackend):
+    """A mailbox: `deliver` adds a message and a history record; actions on it are timestamped."""
+
+    HISTORY_PAGE_SIZE = 100
+
+    def __init__(self, address: str = "support@example.com", latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(latency, error_rate, seed)
+        self.address = address
+        self.messages = {}
+        self.history = []  # (history_id, message_id)
+        self.history_id = 1000
+        self.attachments = {}
+        self.labels = {name: {"id": name, "name": name} for name in ("INBOX", "UNREAD", "IMPORTANT")}
+        self.delivered_at = {}  # message id -> time.time() of delivery
+        self.acted_at = {}  # message id -> first send or label change
+        self._by_subject = {}
+
+    # ---------------- test side ----------------
+    def deliver(self, sender: str, subject: str, body: str, attachment: bytes = None, important: bool = False,
+                thread_id: str = None) -> str:
+        with self.lock:
+            self.history_id += 1
+            msg_id = f"m{self.history_id:08d}"
+            now = time.time()
+            headers = [
+                {"name": "From", "value": f"Client <{sender}>"},
+                {"name": "Subject", "value": subject},
+                {"name": "Date", "value": format_datetime(datetime.now(timezone.utc))},
+                {"name": "Message-ID", "value": f"<{msg_id}@mail.example.com>"},
+            ]
+            parts = [{"mimeType": "text/plain", "body": {"data": _b64(body.encode())}}]
+            if attachment is not None:
+                att_id = f"att-{msg_id}"
+                self.attachments[att_id] = {"data": _b64(attachment), "size": len(attachment)}
+                parts.append({"mimeType": "text/csv", "filename": "report.csv",
+                              "body": {"attachmentId": att_id, "size": len(attachment)}})
+            self.messages[msg_id] = {
+                "id": msg_id,
+                "threadId": thread_id or f"t-{msg_id}",
+                "labelIds": ["INBOX", "UNREAD"] + (["IMPORTANT"] if important else []),
+                "internalDate": str(int(now * 1000)),
+                "payload": {"mimeType": "multipart/mixed", "headers": headers, "parts": parts},
+            }
+            self.history.append((self.history_id, msg_id))
+            self.delivered_at[msg_id] = now
+            self._by_subject[subject.lower()] = msg_id
+            return msg_id
+
+    # ---------------- API side ----------------
+    def users(self):
+        return _Resource(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def profile(self):
+        with self.lock:
+            return {"emailAddress": self.address, "historyId": str(self.history_id)}
+
+    def history_page(self, start_history_id, page_token):
+        with self.lock:
+            records = [(h, m) for h, m in self.history if h > int(start_history_id)]
+            offset = int(page_token or 0)
+            page = records[offset:offset + self.HISTORY_PAGE_SIZE]
+            response = {
+                "history": [{"id": str(h), "messagesAdded": [{"message": {"id": m}}]} for h, m in page],
+                "historyId": str(self.history_id),
+            }
+            if offset + self.HISTORY_PAGE_SIZE < len(records):
+                response["nextPageToken"] = str(offset + self.HISTORY_PAGE_SIZE)
+            return response
+
+    def get_message(self, msg_id, format):
+        message = self.messages.get(msg_id)
+        if message is None:
+            raise http_error(404, "not found")
+        if format == "metadata":
+            return {**message, "payload": {"headers": message["payload"]["headers"]}}
+        return message
+
+    def _acted(self, msg_id):
+        if msg_id in self.messages and msg_id not in self.acted_at:
+            self.acted_at[msg_id] = time.time()
+
+    def record_send(self, body):
+        with self.lock:
+            thread_id = body.get("threadId")
+            if thread_id:
+                self._acted(thread_id[2:])
+            else:
+                subject = email.message_from_bytes(base64.urlsafe_b64decode(body["raw"]))["subject"] or ""
+                self._acted(self._by_subject.get(re.sub(r"^re:\s*", "", subject, flags=re.I).lower()))
+            return {"id": f"sent-{len(self.acted_at)}", "threadId": thread_id}
+
+    def record_modify(self, ids):
+        with self.lock:
+            for msg_id in ids:
+                self._acted(msg_id)
+        return {}
+
+    def create_label(self, name):
+        with self.lock:
+            label = self.labels[name] = {"id": f"Label_{len(self.labels)}", "name": name}
+            return label
+
+
+# ------------------------------------------------------------
+# Supabase
+# ------------------------------------------------------------
+PERSONALITY = {"assistant_name": "Ava", "communication_tone": "friendly", "default_greeting": "Hi there",
+               "formality_level": "medium", "language_style": "concise"}
+
+
+class FakeQuery:
+    def __init__(self, backend, table):
+        self.backend = backend
+        self.table = table
+        self.columns = "*"
+        self.filters = []
+
+    def select(self, columns="*", *_):
+        self.columns = columns
+        return self
+
+    def limit(self, *_):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: (row.get(column) or "") > value)
+        return self
+
+    def execute(self):
+        if self.backend.round_trip(self.table):
+            raise RuntimeError(f"fake Supabase error on '{self.table}'")
+        rows = [row for row in self.backend.rows[self.table] if all(f(row) for f in self.filters)]
+        if "projects(" not in self.columns:
+            rows = [{k: v for k, v in row.items() if k != "projects"} for row in rows]
+        return type("Result", (), {"data": rows})()
+
+
+class FakeSupabase(FakeBackend):
+    """Three projects and a personality row per client; `round_trips` counts queries."""
+
+    def __init__(self, clients, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(latency, error_rate, seed)
+        updated_at = datetime(2025, 1, 1, tzinfo=timezone.utc).isoformat()
+        self.rows = {"ai_personality_settings": [], "clients": [], "projects": []}
+        for i, address in enumerate(clients):
+            projects = [{"id": f"p{i}-{j}", "client_id": f"c{i}", "name": f"Project {j}", "description": "CRM rollout",
+                         "client_goal": "launch", "success_metric": "adoption"} for j in range(3)]
+            self.rows["ai_personality_settings"].append({"contact_email": address, **PERSONALITY})
+            self.rows["clients"].append({"id": f"c{i}", "name": f"Client {i}", "contact_email": address,
+                                         "industry": "real estate", "priority_level": "high",
+                                         "updated_at": updated_at, "projects": projects})
+            self.rows["projects"] += projects
+
+    @property
+    def round_trips(self) -> int:
+        return sum(self.calls.values())
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+# ------------------------------------------------------------
+# OpenAI-compatible endpoint
+# ------------------------------------------------------------
+def message_field(message: str, name: str) -> str:
+    for line in message.splitlines():
+        if line.startswith(f"{name}: "):
+            return line[len(name) + 2:].strip()
+    return ""
+
+
+class FakeLLMServer(FakeBackend):
+    """
+    Serves POST .../chat/completions. Behaves like the real agent: calls
+    fetch_personality_settings first, fetch_client_and_project_data when the
+    email mentions a project, then answers with the JSON object; emails that
+    say "urgent" or "refund" are escalated. `bad_output_rate` makes the first
+    answer unparseable so the re-ask path runs. Latency is `latency` plus
+    `per_1k_tokens` per 1000 prompt tokens (4 characters per token).
+    """
+
+    def __init__(self, latency: float = 0.0, per_1k_tokens: float = 0.0, error_rate: float = 0.0,
+                 bad_output_rate: float = 0.0, seed: int = 0):
+        super().__init__(latency, error_rate, seed)
+        self.per_1k_tokens = per_1k_tokens
+        self.bad_output_rate = bad_output_rate
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                status, payload = fake.complete(request)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def complete(self, request):
+        messages = request.get("messages", [])
+        prompt_tokens = len(json.dumps(messages) + json.dumps(request.get("tools", []))) // 4
+        if self.round_trip("chat.completions", sleep=False):
+            time.sleep(self.latency)
+            return 500, {"error": {"message": "injected failure", "type": "server_error"}}
+
+        tools = {t["function"]["name"] for t in request.get("tools", [])}
+        called = {c["function"]["name"] for m in messages if m.get("role") == "assistant"
+                  for c in m.get("tool_calls") or []}
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "") or ""
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "") or ""
+        if not isinstance(user, str):
+            user = json.dumps(user)
+
+        if "fetch_personality_settings" in tools and "fetch_personality_settings" not in called:
+            message = self._tool_call("fetch_personality_settings", user, len(called))
+        elif ("fetch_client_and_project_data" in tools and "project" in user.lower()
+              and "fetch_client_and_project_data" not in called):
+            message = self._tool_call("fetch_client_and_project_data", user, len(called))
+        elif "fix JSON" in system:
+            message = {"role": "assistant", "content": json.dumps(
+                {"escalate": False, "priority": "", "response": "Thanks for reaching out, we are on it.", "reply_to": True})}
+        else:
+            message = {"role": "assistant", "content": self._answer(user)}
+
+        completion_tokens = len(json.dumps(message)) // 4
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        time.sleep(self.latency + self.per_1k_tokens * prompt_tokens / 1000)
+        return 200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @staticmethod
+    def _tool_call(name, user, n):
+        arguments = json.dumps({"client_email": message_field(user, "From")})
+        return {"role": "assistant", "content": None,
+                "tool_calls": [{"id": f"call_{n}", "type": "function", "function": {"name": name, "arguments": arguments}}]}
+
+    def _answer(self, user):
+        with self.lock:
+            bad = self.rng.random() < self.bad_output_rate
+        if bad:
+            return "Sure! Here is the reply you asked for."
+        body = user.lower()
+        escalate = "urgent" in body or "refund" in body
+        return json.dumps({
+            "Message_ID": message_field(user, "Message_ID"),
+            "query": "",
+            "escalate": escalate,
+            "priority": "high" if escalate else "",
+            "escalation_reason": "Client asks for a refund / urgent fix" if escalate else "",
+            "response": "" if escalate else "Thanks for reaching out, you might try clearing the session cache.",
+            "subject": f"Re: {message_field(user, 'Subject')}",
+            "to_email": message_field(user, "From"),
+            "reply_to": not escalate,
+        })
@@ -0,0 +1,122 @@
+"""
+Local stand-in for Gmail / Pub/Sub push deliveries.
+
+Posts synthetic Pub/Sub push payloads carrying increasing historyIds
+(plus a share of duplicate, out-of-order deliveries) to a push receiver.
+
+Usage:
+    # against a running `INGESTION_MODE=push uv run main.py`
+    uv run python benchmarks/push_notifier.py --url http://127.0.0.1:8085/gmail/push --count 20
+
+    # self-contained: start a PushReceiver in-process and check what it triggers
+    uv run python benchmarks/push_notifier.py --self-test --count 200
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_payload(email_address, history_id, seq):
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id}).encode()
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode(),
+            "messageId": str(seq),
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "subscription": "projects/local/subscriptions/gmail-push",
+    }
+
+
+def post(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def send_notifications(url, count, email_address, start_history_id, duplicate_ratio, interval):
+    history_id = start_history_id
+    latencies = []
+    for seq in range(count):
+        if seq and random.random() < duplicate_ratio:
+            sent_id = history_id - random.randint(0, 3)  # redelivery / out-of-order
+        else:
+            history_id += random.randint(1, 5)
+            sent_id = history_id
+        start = time.perf_counter()
+        post(url, make_payload(email_address, sent_id, seq))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if interval:
+            time.sleep(interval)
+    return latencies
+
+
+def self_test(args):
+    from GmailAutomation.RetrivalPipeline.push_receiver import PushReceiver
+
+    receiver = PushReceiver(host="127.0.0.1", port=0, verification_token=None)
+    receiver.start()
+    url = f"http://127.0.0.1:{receiver.port}{receiver.path}"
+
+    woken = []
+    stop = threading.Event()
+
+    def consumer():
+        while not stop.is_set():
+            if receiver.wait_for_change(timeout=0.2):
+                woken.append(time.perf_counter())
+
+    thread = threading.Thread(target=consumer, daemon=True)
+    thread.start()
+    latencies = send_notifications(url, args.count, args.email, args.start_history_id, args.duplicates, args.interval)
+    time.sleep(0.3)
+    stop.set()
+    thread.join()
+    receiver.stop()
+
+    stats = receiver.stats()
+    print(json.dumps(stats, indent=2))
+    print(f"consumer wake-ups: {len(woken)} for {stats['triggers']} triggering notification(s)")
+    assert stats["received"] == args.count
+    assert stats["triggers"] + stats["stale"] == args.count
+    report_latency(latencies)
+
+
+def report_latency(latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    print(f"delivery latency: p50={p50:.2f}ms p95={p95:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8085/gmail/push")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--email", default="support@example.com")
+    parser.add_argument("--start-history-id", type=int, default=1000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of duplicate/out-of-order deliveries")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between notifications")
+    parser.add_argument("--self-test", action="store_true")
+    args = parser.parse_args()
+
+    if args.self_test:
+        self_test(args)
+    else:
+        report_latency(
+            send_notifications(args.url, args.count, args.email, args.start_history_id, args.duplicates, args.interval)
+        )
+
+
+if __name__ == "__main__":
+    main()
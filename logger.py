@@ -5,7 +5,9 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
         logging.StreamHandler(),
-        logging.FileHandler("gmailProcesses.log", mode='w')
+        # Opened on the first record, not on import: spawned worker processes import this
+        # module again (through main.py) and must not truncate the parent's log
+        logging.FileHandler("gmailProcesses.log", mode='w', delay=True)
     ]
 )
 logger = logging.getLogger(__name__)
\ No newline at end of file
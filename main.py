@@ -1,90 +1,455 @@
-import tempfile
+import os
+import signal
+import threading
 import time
-from GmailAutomation.InsertionPipeline.sendEmail import handle_escalation, mark_message_as_read, send_email, send_reply
-from GmailAutomation.LLM.EmailAgent import process_email
-from GmailAutomation.RetrivalPipeline.schedular import download_attachment, fetch_new_emails
-from GmailAutomation.auth import get_gmail_service
+
+from startup import STARTED_AT  # first: loads .env before the pipeline modules read their settings
+from googleapiclient.errors import HttpError
+
+from GmailAutomation.app_context import app
+from GmailAutomation.InsertionPipeline.label_updater import label_updater
+from GmailAutomation.InsertionPipeline.sendEmail import (
+    handle_escalation,
+    remember_sender_address,
+    reply_in_thread,
+    send_email,
+    send_reply,
+)
+from GmailAutomation.LLM.EmailAgent import CONTEXT_MODE, agent_run_stats, process_email
+from GmailAutomation.LLM.processing_pool import EmailProcessingPool
+from GmailAutomation.LLM.response_cache import response_cache
+from GmailAutomation.LLM.response_parser import parse_stats
+from GmailAutomation.RetrivalPipeline import schedular
+from GmailAutomation.RetrivalPipeline.attachment_extractor import attachment_extractor
+import GmailAutomation.RetrivalPipeline.attachment_store  # noqa: F401 (registers app.attachment_store)
+from GmailAutomation.RetrivalPipeline.client_allowlist import client_allowlist
+from GmailAutomation.RetrivalPipeline.poll_scheduler import poll_scheduler
+from GmailAutomation.RetrivalPipeline.push_receiver import PUSH_FALLBACK_POLL_INTERVAL, GmailWatch, PushReceiver
+from GmailAutomation.RetrivalPipeline.schedular import iter_new_email_batches
+from GmailAutomation.RetrivalPipeline.thread_coalescer import message_ids, thread_coalescer
+from GmailAutomation.RetrivalPipeline.work_queue import WORK_QUEUE
+from GmailAutomation.auth import gmail_services
+from GmailAutomation.db import cache_stats, prefetch_client_context
+from GmailAutomation.metrics import AGE_BUCKETS, METRICS_PORT, MetricsServer, metrics
 from logger import logger
 
+IMPORTS_DONE_AT = time.perf_counter()
+
 # ------------------------------------------------------------
 # Polling Logic
 # ------------------------------------------------------------
-global last_history_id
-no_email_counter = 0  # counts iterations with no new emails
-HEARTBEAT_INTERVAL = 20  # how many cycles before logging "still running"
-
-service = get_gmail_service()
-logger.info("🚀 Starting Gmail Trigger (poll every 3s)...")
-
-no_email_counter = 0
-
-try:
-    while True:
-        new_emails = fetch_new_emails(service)
-        last_history_id=None
-        if new_emails:
-            no_email_counter = 0
-            logger.info(f"📬 {len(new_emails)} new email(s):")
-            for email in new_emails:
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    attachment_data = []
-
-                    if email["attachments"]:
-                        for att in email["attachments"]:
-                            file_path = download_attachment(
-                                service,
-                                message_id=email["id"],
-                                attachment_id=att["attachmentId"],
-                                filename=att["filename"],
-                                save_dir=tmpdir,
-                            )
-                            attachment_data.append(
-                                {
-                                    "filename": att["filename"],
-                                    "mimeType": att["mimeType"],
-                                    "path": file_path,
-                                }
-                            )
-                            logger.info(f"📎 Saved attachment: {file_path}")
-
-                    data = {
-                        "Message_ID": email["id"],
-                        "From": email["from"],
-                        "Subject": email["subject"],
-                        "Body": email["body"],
-                        "is_important": email["is_important"],
-                        "Date": email["date"],
-                        "attachment_data": attachment_data,
-                    }
-                    
-                    response = process_email(data)
-
-                logger.info(f"Email data: {data}")
-                logger.info(f"🤖 LLM Response: {response}")
-                
-                if response.get("escalate", False):
-                    escalation_email = handle_escalation(
-                        response["subject"], response.get("escalation_reason", "No reason provided")
-                    )
-                    logger.info(f"⚠️ Escalation needed for email {response['Message_ID']} {escalation_email}")
-                elif response.get("reply_to", False):
-                    result = send_reply(message_id=response["Message_ID"], body=response["response"])
-                    logger.info(f"✅ Reply sent successfully in initial email reply! : {result}")
-                    mark_message_as_read(service, 'me', response["Message_ID"]) 
-                    logger.info(f"✅ Message {response['Message_ID']} marked as read")
-                else:
-                    result = send_email(to=response["to_email"], subject=response["subject"], body=response["response"])
-                    logger.info(f"✅ Email sent successfully direct to the inbox! : {result}")
-                    mark_message_as_read(service, 'me', response["Message_ID"])
-                    logger.info(f"✅ Message {response['Message_ID']} marked as read")
-                    
+INGESTION_MODE = os.getenv("INGESTION_MODE", "poll")  # "poll" or "push"
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "serial")  # "serial" or "pooled"
+HEARTBEAT_INTERVAL = 20  # how many idle cycles before logging "still running"
+QUEUE_IDLE_WAIT = 1  # seconds the work queue consumer sleeps when nothing is due
+CONSUMER_STOP_TIMEOUT = 60  # seconds to let the consumer finish its leased emails on shutdown
+
+processing_pool = EmailProcessingPool() if PROCESSING_MODE == "pooled" else None
+
+# Gmail receipt -> reply/send/escalation, per action
+EMAIL_AGE = {
+    action: metrics.histogram(
+        "email_age_at_action_seconds", "Time from Gmail receipt to the action taken", buckets=AGE_BUCKETS, action=action
+    )
+    for action in ("reply", "send", "escalate")
+}
+# Liveness, read by supervisor.py to spot a stuck mailbox
+LAST_POLL = metrics.gauge("last_poll_timestamp_seconds", "Unix time the last poll cycle finished")
+# Updated per fetched batch and per handled email, so a long burst inside one cycle is not taken for a stall
+LAST_PROGRESS = metrics.gauge("last_progress_timestamp_seconds", "Unix time an email batch was last fetched or handled")
+POLL_CYCLES = metrics.counter("poll_cycles_total", "Poll cycles run")
+POLL_ERRORS = metrics.counter("poll_cycle_errors_total", "Poll cycles that stopped on an error")
+
+
+def prepare_email(email, extract=True) -> dict:
+    """Fetch (and summarize) attachments and build the agent input for one email."""
+    attachment_data = []
+    if email["attachments"]:
+        attachment_data = app.attachment_store.materialize(gmail_services.get(), email)
+        if extract:
+            attachment_extractor.annotate(attachment_data)
+
+    return {
+        "Message_ID": email["id"],
+        "threadId": email.get("threadId"),
+        "From": email["from"],
+        "Subject": email["subject"],
+        "Body": email["body"],
+        "is_important": email["is_important"],
+        "Date": email["date"],
+        "attachment_data": attachment_data,
+    }
+
+
+INTERRUPTED_SEND = "unknown (interrupted send)"
+
+
+def send_once(email, action, send) -> str:
+    """
+    Call `send` unless this email was already answered. The send marker is
+    written before the Gmail call and completed after it, so an email that
+    is processed again (retry, crash, replayed history page) never gets a
+    second reply. Returns INTERRUPTED_SEND when an earlier attempt may or
+    may not have gone out.
+    """
+    message_id = email["id"]
+    marker = app.work_queue.send_marker(message_id)
+    if marker is not None:
+        if marker["state"] == "sent":
+            app.work_queue.skipped_sends += 1
+            logger.warning(f"↩️ Email {message_id} was already answered ({marker['action']}), not sending again")
+            return marker["result"]
+        # A previous attempt stopped between the marker and Gmail's answer (crash, timeout, reset connection):
+        # resend only if nothing went out. Only a reply can be checked (its thread); a direct email is not
+        # sent twice on a guess, it is handed to a human instead (act_on_response escalates it).
+        if action == "reply":
+            if reply_in_thread(gmail_services.get(), email.get("threadId"), email.get("received_at") or 0):
+                app.work_queue.skipped_sends += 1
+                app.work_queue.complete_send(message_id, "found in thread (interrupted send)")
+                logger.warning(f"↩️ Email {message_id} was already answered (the reply was interrupted), skipping")
+                return "found in thread (interrupted send)"
+        else:
+            app.work_queue.skipped_sends += 1
+            app.work_queue.complete_send(message_id, INTERRUPTED_SEND)
+            logger.warning(f"↩️ Email {message_id} may or may not have been answered ({action} was interrupted)")
+            return INTERRUPTED_SEND
+
+    app.work_queue.begin_send(message_id, action)
+    try:
+        result = send()
+    except HttpError:
+        app.work_queue.clear_send(message_id)  # Gmail refused it: nothing was sent
+        raise
+    app.work_queue.complete_send(message_id, result)
+    return result
+
+
+def act_on_response(email, data, response):
+    """Escalate, reply or send based on the agent response, then record the email as processed."""
+    logger.info(f"Email data: {data}")
+    logger.info(f"🤖 LLM Response: {response}")
+    # The fetch loop already knows our address and the original headers: no getProfile / messages.get to reply
+    remember_sender_address(email["emailAddress"])
+    original = email if response["Message_ID"] == email["id"] else None
+    # A merged follow-up run (thread_coalescer) stands for all of its messages: label each of them
+    labelled = [response["Message_ID"]] + [m for m in message_ids(email) if m != email["id"]]
+
+    if response.get("escalate", False):
+        action, escalation_reason = "escalate", response.get("escalation_reason", "No reason provided")
+    elif response.get("reply_to", False):
+        result = send_once(email, "reply", lambda: send_reply(
+            message_id=response["Message_ID"], body=response["response"], original=original
+        ))
+        logger.info(f"✅ Reply sent successfully in initial email reply! : {result}")
+        action = "reply"
+    else:
+        result = send_once(email, "send", lambda: send_email(
+            to=response["to_email"], subject=response["subject"], body=response["response"]
+        ))
+        if result == INTERRUPTED_SEND:
+            # Nothing tells whether the customer got the answer: a human checks, it is not labelled auto-replied
+            action, escalation_reason = "escalate", (
+                "An earlier attempt to send the answer was interrupted and may not have gone out "
+                f"(check the sent mail for '{response['subject']}')"
+            )
+        else:
+            logger.info(f"✅ Email sent successfully direct to the inbox! : {result}")
+            action = "send"
+
+    if action == "escalate":
+        escalation_email = handle_escalation(response["subject"], escalation_reason)
+        logger.info(f"⚠️ Escalation needed for email {response['Message_ID']} {escalation_email}")
+        for message_id in labelled:
+            label_updater.mark_escalated(message_id)
+    else:
+        for message_id in labelled:
+            label_updater.mark_replied(message_id)
+
+    if action != "escalate" and thread_coalescer is not None:
+        thread_coalescer.record_sent(email)
+    now = time.time()
+    for member in email.get("coalesced") or [email]:
+        if member.get("received_at"):
+            EMAIL_AGE[action].observe(now - member["received_at"])
+        app.checkpoint_store.mark_processed(member["id"], email["emailAddress"])
+    LAST_PROGRESS.set(time.time())
+
+
+def handle_email(email):
+    """Serial mode: download attachments, run the agent and act on its response for one email."""
+    data = prepare_email(email)
+    response = process_email(data)
+    act_on_response(email, data, response)
+
+
+def handle_batch(emails):
+    """
+    Pooled mode: run the agent for a batch of emails concurrently, then act
+    on each response in order. If any run failed, the first error is raised
+    once the others were acted on, like serial mode: the history page is
+    not committed and the failed emails (not in the ledger) are fetched again.
+    """
+    prepared = [prepare_email(email, extract=False) for email in emails]
+    # Extract every attachment of the batch at once so the process pool works in parallel
+    attachment_extractor.annotate([a for data in prepared for a in data["attachment_data"]])
+    results = processing_pool.process_batch(prepared)
+    errors = []
+    for email, data, (response, error) in zip(emails, prepared, results):
+        if error is None:
+            act_on_response(email, data, response)
+        else:
+            errors.append(error)
+    if errors:
+        raise errors[0]
+
+
+def run_cycle() -> int:
+    """Process every new email once. Returns the number of emails handled."""
+    email_count = 0
+    for batch in iter_new_email_batches(gmail_services.get()):
+        logger.info(f"📬 {len(batch)} new email(s): {[email['id'] for email in batch]}")
+        LAST_PROGRESS.set(time.time())
+        email_count += len(batch)
+        if thread_coalescer is not None:
+            batch = thread_coalescer.coalesce(batch)  # one agent run and one reply per burst of follow-ups
+        if CONTEXT_MODE == "preresolved":
+            try:
+                # One combined lookup for every sender in the batch instead of tool calls per email
+                prefetch_client_context({email["from"] for email in batch})
+            except Exception as e:
+                logger.warning(f"⚠️ Client context prefetch failed, falling back to per-email lookups: {e}")
+        if processing_pool is not None:
+            handle_batch(batch)
+        else:
+            for email in batch:
+                handle_email(email)
+    # Read/auto-replied/escalated labels for the whole cycle in a few batchModify calls
+    label_updater.flush()
+    return email_count
+
+
+# ------------------------------------------------------------
+# Work queue mode: fetching and processing in separate loops
+# ------------------------------------------------------------
+def enqueue_cycle() -> int:
+    """Producer: add every new email to the work queue. Returns the number of emails enqueued."""
+    if app.work_queue.backlogged():
+        return 0
+    email_count = 0
+    for batch in iter_new_email_batches(gmail_services.get()):
+        email_count += app.work_queue.enqueue(batch)
+        if app.work_queue.backlogged():
+            # The cursor stays before the unfinished page; it is re-read (duplicates ignored) once the backlog drains
+            break
+    return email_count
+
+
+def settle(email, error=None):
+    """Ack every queued message a processed email stands for, or fail them with `error`."""
+    for message_id in message_ids(email):
+        if error is None:
+            app.work_queue.ack(message_id)
         else:
-            no_email_counter += 1
-            if no_email_counter % HEARTBEAT_INTERVAL == 0:
-                logger.info(f"⏱ Still running... no new emails in the last {HEARTBEAT_INTERVAL * 3} seconds")
+            app.work_queue.fail(message_id, error)
+    LAST_PROGRESS.set(time.time())
+
+
+def process_queued(items):
+    """Consumer: process leased emails; ack the handled ones, retry or dead-letter the others."""
+    emails = [item["email"] for item in items]
+    if thread_coalescer is not None:
+        # Threads that may still get a quick follow-up go back to the queue until they are quiet
+        emails, held = thread_coalescer.split_due(emails)
+        for ids, until in held:
+            app.work_queue.defer(ids, until)
+    if not emails:
+        return
+    if CONTEXT_MODE == "preresolved":
+        try:
+            prefetch_client_context({email["from"] for email in emails})
+        except Exception as e:
+            logger.warning(f"⚠️ Client context prefetch failed, falling back to per-email lookups: {e}")
+
+    if processing_pool is None:
+        for email in emails:
+            try:
+                handle_email(email)
+            except Exception as e:
+                settle(email, e)
+            else:
+                settle(email)
+    else:
+        ready, prepared = [], []
+        for email in emails:
+            try:
+                prepared.append(prepare_email(email, extract=False))
+                ready.append(email)
+            except Exception as e:
+                settle(email, e)
+        attachment_extractor.annotate([a for data in prepared for a in data["attachment_data"]])
+        for email, data, (response, error) in zip(ready, prepared, processing_pool.process_batch(prepared)):
+            if error is None:
+                try:
+                    act_on_response(email, data, response)
+                except Exception as e:
+                    error = e
+            settle(email, error)
+    label_updater.flush()
+
+
+def consume_loop(stop: threading.Event):
+    """Consumer thread: lease, process, repeat; waits for the producer when the queue is empty."""
+    while not stop.is_set():
+        try:
+            items = app.work_queue.lease()
+            if items:
+                process_queued(items)
+            else:
+                app.work_queue.wait_for_work(QUEUE_IDLE_WAIT)
+        except Exception as e:
+            logger.error(f"⚠️ Work queue consumer error: {e}")
+            stop.wait(QUEUE_IDLE_WAIT)
+
+
+def poll_once(cycle) -> int:
+    """
+    Run one cycle. An error (a failed agent run, Gmail or Supabase down) is
+    logged and the cycle counts as empty: the history page it was on was not
+    committed, so the next poll fetches the unhandled emails again.
+    """
+    try:
+        return cycle()
+    except Exception as e:
+        POLL_ERRORS.inc()
+        logger.error(f"❌ Poll cycle failed, retrying on the next poll: {e!r}")
+        return 0
+
+
+def log_heartbeat(push_receiver=None):
+    logger.info(f"⏱ Still running... no new emails in the last {HEARTBEAT_INTERVAL} cycles")
+    logger.info(f"📊 Poll scheduler stats: {poll_scheduler.stats()}")
+    logger.info(f"📇 Client allowlist stats: {client_allowlist.stats()}")
+    logger.info(f"🗄 Supabase cache stats: {cache_stats()}")
+    logger.info(f"🤖 Agent run stats: {agent_run_stats.stats()}")
+    logger.info(f"🧾 Agent output parse stats: {parse_stats.stats()}")
+    if app.fast_path is not None:
+        logger.info(f"⚡ Fast path stats: {app.fast_path.stats()}")
+    if response_cache is not None:
+        logger.info(f"♻️ Response cache stats: {response_cache.stats()}")
+    logger.info(f"💾 Checkpoint stats: {app.checkpoint_store.stats()}")
+    logger.info(f"📥 Work queue stats: {app.work_queue.stats()}")
+    if thread_coalescer is not None:
+        logger.info(f"🧵 Thread coalescing stats: {thread_coalescer.stats()}")
+    logger.info(f"🏷 Label update stats: {label_updater.stats()}")
+    logger.info(f"🔌 Gmail connection stats: {gmail_services.stats()}")
+    logger.info(f"🔐 Token refresh stats: {gmail_services.credential_manager.stats()}")
+    logger.info(f"🧩 App context: {app.stats()}")
+    logger.info(f"📎 Attachment store stats: {app.attachment_store.stats()}")
+    logger.info(f"🔎 Attachment extraction stats: {attachment_extractor.stats()}")
+    if push_receiver is not None:
+        logger.info(f"🔔 Push receiver stats: {push_receiver.stats()}")
+    if processing_pool is not None:
+        logger.info(f"⚡ Processing pool stats: {processing_pool.stats()}")
+
+
+def register_queue_gauges():
+    """Queue depths, read when the metrics are collected."""
+    description = "Items waiting in each internal queue"
+    metrics.gauge("queue_depth", description, fn=lambda: label_updater.stats()["pending"], queue="label_updates")
+    metrics.gauge("queue_depth", description, fn=lambda: app.checkpoint_store.stats()["pending_writes"], queue="checkpoint_writes")
+    if processing_pool is not None:
+        metrics.gauge("queue_depth", description, fn=lambda: processing_pool.queue_depth, queue="agent_runs")
+        metrics.gauge("in_flight", "Agent runs in progress", fn=lambda: processing_pool.in_flight)
+    if WORK_QUEUE == "on":
+        metrics.gauge("queue_depth", description, fn=lambda: app.work_queue.counts()["ready"], queue="work_ready")
+        metrics.gauge("queue_depth", description, fn=lambda: app.work_queue.counts()["leased"], queue="work_leased")
+        metrics.gauge("queue_depth", description, fn=lambda: app.work_queue.counts()["dead"], queue="work_dead")
+        metrics.gauge("work_queue_oldest_ready_age_seconds", "Age of the oldest email waiting in the work queue",
+                      fn=lambda: app.work_queue.oldest_ready_age())
+
+
+def stop_on_sigterm(signum, frame):
+    """Turn SIGTERM (supervisor, systemd, docker stop) into the same clean shutdown as Ctrl+C."""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)  # don't interrupt the shutdown itself
+    raise KeyboardInterrupt
+
+
+def main():
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    register_queue_gauges()
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(metrics)
+        metrics_server.start()
+
+    push_receiver = None
+    watch = None
+    if INGESTION_MODE == "push":
+        push_receiver = PushReceiver(cursor=lambda: schedular.last_history_id)
+        push_receiver.start()
+        watch = GmailWatch()
+        logger.info(f"🚀 Starting Gmail Trigger (push mode, fallback poll every {PUSH_FALLBACK_POLL_INTERVAL}s)...")
+    else:
+        logger.info(f"🚀 Starting Gmail Trigger (adaptive polling, base interval {poll_scheduler.base_interval}s)...")
+
+    consumer, stop_consumer = None, threading.Event()
+    if WORK_QUEUE == "on":
+        consumer = threading.Thread(target=consume_loop, args=(stop_consumer,), name="queue-consumer", daemon=True)
+        consumer.start()
+        logger.info(f"📥 Work queue on: fetching and processing run separately ({app.work_queue.stats()})")
+    cycle = enqueue_cycle if consumer is not None else run_cycle
+
+    no_email_counter = 0  # counts iterations with no new emails
+    first_poll = True
+
+    try:
+        while True:
+            if watch is not None:
+                watch.ensure(gmail_services.get())
+
+            email_count = poll_once(cycle)
+            LAST_POLL.set(time.time())
+            POLL_CYCLES.inc()
+            if first_poll:
+                first_poll = False
+                logger.info(
+                    f"⏱ First poll done {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms after start "
+                    f"(imports {(IMPORTS_DONE_AT - STARTED_AT) * 1000:.0f} ms)"
+                )
+                # Import the LLM SDK and build the agents while idle, not when the first email arrives
+                app.warm_up()
+            if email_count:
+                no_email_counter = 0
+            else:
+                no_email_counter += 1
+                if no_email_counter % HEARTBEAT_INTERVAL == 0:
+                    log_heartbeat(push_receiver)
 
-        time.sleep(3)
-except KeyboardInterrupt:
-    logger.info("🛑 Gmail Trigger stopped by user")
+            poll_scheduler.record_cycle(email_count)
+            if push_receiver is not None and poll_scheduler.last_decision["reason"] in ("idle", "burst"):
+                # Nothing to back off from: sleep until Gmail reports a change (or the safety-net poll)
+                push_receiver.wait_for_change(PUSH_FALLBACK_POLL_INTERVAL)
+            else:
+                poll_scheduler.wait()
+    except KeyboardInterrupt:
+        logger.info("🛑 Gmail Trigger stopped by user")
+    finally:
+        if consumer is not None:
+            stop_consumer.set()
+            consumer.join(CONSUMER_STOP_TIMEOUT)  # unfinished leases are released on the next start
+        if push_receiver is not None:
+            push_receiver.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if processing_pool is not None:
+            processing_pool.close()
+        label_updater.flush()
+        attachment_extractor.close()
+        for name in ("checkpoint_store", "work_queue"):
+            if app.is_initialized(name):
+                getattr(app, name).close()
+        gmail_services.close()
 
 
+if __name__ == "__main__":
+    main()
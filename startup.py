@@ -0,0 +1,10 @@
+import time
+
+# ------------------------------------------------------------
+# Process start: main.py imports this before anything else
+# ------------------------------------------------------------
+STARTED_AT = time.perf_counter()  # for the cold-start log line, so taken before any other import
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv()  # before the pipeline modules read their os.getenv settings
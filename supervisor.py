@@ -0,0 +1,248 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+from logger import logger
+
+load_dotenv()
+
+# ------------------------------------------------------------
+# Multi-mailbox supervisor
+# ------------------------------------------------------------
+# Every mailbox runs main.py in its own worker process, with its own OAuth
+# token, checkpoint (history cursor + ledger), Gmail quota bucket and
+# metrics port. The pipeline's per-mailbox state lives in module-level
+# singletons, so the process is the unit of isolation: a crash or a stuck
+# token in one inbox never stalls the others.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(ROOT, "main.py")
+
+MAILBOXES_CONFIG = os.getenv("MAILBOXES_CONFIG", "mailboxes.json")
+SUPERVISOR_STATE_DIR = os.getenv("SUPERVISOR_STATE_DIR", "mailboxes")  # one working directory per mailbox
+SUPERVISOR_METRICS_BASE_PORT = int(os.getenv("SUPERVISOR_METRICS_BASE_PORT", 9100))  # + mailbox index
+SUPERVISOR_REPORT_INTERVAL = float(os.getenv("SUPERVISOR_REPORT_INTERVAL", 60))  # seconds between status reports
+SUPERVISOR_STALL_TIMEOUT = float(os.getenv("SUPERVISOR_STALL_TIMEOUT", 900))  # no poll or email progress for this long = stuck
+RESTART_BACKOFF = 2  # seconds before the first restart, doubled per crash
+RESTART_BACKOFF_MAX = 300
+STABLE_UPTIME = 600  # a worker up this long gets its backoff reset
+STOP_GRACE = 30  # seconds a worker gets to flush and exit before it is killed
+CHECK_INTERVAL = 1
+SCRAPE_INTERVAL = 10
+
+
+def load_mailbox_configs(path: str = MAILBOXES_CONFIG) -> list:
+    """
+    Read the mailbox list: a JSON array (or {"mailboxes": [...]}) of
+    {"name", "token_path", "credentials_path", "quota_units_per_second",
+    "metrics_port", "env"}; only name and token_path are required.
+    Relative paths are resolved against the config file.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    entries = data["mailboxes"] if isinstance(data, dict) else data
+    base = os.path.dirname(os.path.abspath(path))
+
+    configs, names = [], set()
+    for i, entry in enumerate(entries):
+        name = entry.get("name")
+        if not name or not entry.get("token_path"):
+            raise ValueError(f"mailbox #{i} in {path} needs a 'name' and a 'token_path'")
+        if name in names or os.sep in name:
+            raise ValueError(f"mailbox name '{name}' in {path} is duplicated or not a plain name")
+        names.add(name)
+        configs.append({
+            "name": name,
+            "token_path": os.path.join(base, entry["token_path"]),
+            "credentials_path": os.path.join(base, entry.get("credentials_path", "credentials.json")),
+            "quota_units_per_second": entry.get("quota_units_per_second"),
+            "metrics_port": int(entry.get("metrics_port") or SUPERVISOR_METRICS_BASE_PORT + i),
+            "env": {key: str(value) for key, value in entry.get("env", {}).items()},
+        })
+    return configs
+
+
+class MailboxWorker:
+    """One mailbox's main.py process: started, watched, scraped and restarted by the supervisor."""
+
+    def __init__(self, config: dict, state_dir: str = SUPERVISOR_STATE_DIR):
+        self.config = config
+        self.name = config["name"]
+        self.workdir = os.path.abspath(os.path.join(state_dir, self.name))
+        os.makedirs(self.workdir, exist_ok=True)
+
+        self.process = None
+        self.started_at = None
+        self.stopping_since = None
+        self.next_start = 0.0
+        self.backoff = RESTART_BACKOFF
+        self.restarts = 0
+        self.last_exit = None
+
+        self.snapshot = None  # last /metrics.json of this worker
+        self.last_progress = None  # last time the worker was seen polling
+        self._window = (0, time.time())  # (handled, time) at the last report
+
+    def env(self) -> dict:
+        env = dict(os.environ)
+        env.update({
+            "MCP_GMAIL_TOKEN_PATH": self.config["token_path"],
+            "MCP_GMAIL_CREDENTIALS_PATH": self.config["credentials_path"],
+            "METRICS_HOST": "127.0.0.1",
+            "METRICS_PORT": str(self.config["metrics_port"]),
+        })
+        if self.config["quota_units_per_second"] is not None:
+            env["GMAIL_QUOTA_UNITS_PER_SECOND"] = str(self.config["quota_units_per_second"])
+        env.update(self.config["env"])
+        return env
+
+    def start(self):
+        # Log, checkpoint and attachment cache land in the mailbox's own working directory
+        with open(os.path.join(self.workdir, "worker.out"), "ab") as out:
+            self.process = subprocess.Popen(
+                [sys.executable, MAIN_SCRIPT],
+                cwd=self.workdir,
+                env=self.env(),
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,  # Ctrl+C reaches the supervisor only; it stops the workers in order
+            )
+        self.started_at = self.last_progress = time.time()
+        self.stopping_since = None
+        self.snapshot = None
+        logger.info(f"🚀 Mailbox '{self.name}' started (pid {self.process.pid}, metrics :{self.config['metrics_port']})")
+
+    def check(self, now: float):
+        """Restart the worker if it died (with backoff), stop it if it stopped polling."""
+        if self.process is not None and self.process.poll() is not None:
+            uptime = now - self.started_at
+            if uptime >= STABLE_UPTIME:
+                self.backoff = RESTART_BACKOFF
+            self.last_exit = self.process.returncode
+            self.restarts += 1
+            self.next_start = now + self.backoff
+            logger.warning(
+                f"💥 Mailbox '{self.name}' worker exited with code {self.last_exit} after {uptime:.0f}s, "
+                f"restarting in {self.backoff}s (see {os.path.join(self.workdir, 'worker.out')})"
+            )
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+            self.process = None
+
+        if self.process is None:
+            if now >= self.next_start:
+                self.start()
+            return
+
+        if self.stopping_since is not None:
+            if now - self.stopping_since > STOP_GRACE:
+                self.process.kill()
+        elif now - self.last_progress > SUPERVISOR_STALL_TIMEOUT:
+            logger.warning(f"⚠️ Mailbox '{self.name}' has made no progress for {now - self.last_progress:.0f}s, restarting it")
+            self.stopping_since = now
+            self.process.terminate()
+
+    def scrape(self, now: float):
+        if self.process is None:
+            return
+        url = f"http://127.0.0.1:{self.config['metrics_port']}/metrics.json"
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                self.snapshot = json.load(response)
+        except (OSError, ValueError):
+            return  # still starting up, or busy; the stall timeout covers a worker that never answers
+        # A finished poll, or an email batch fetched / handled inside a long one
+        for gauge in ("last_poll_timestamp_seconds", "last_progress_timestamp_seconds"):
+            self.last_progress = max(self.last_progress, self.snapshot.get(gauge, {}).get("_") or 0)
+
+    def status(self, now: float) -> dict:
+        """State, restarts, throughput since the last report, poll lag and email age at action."""
+        ages = (self.snapshot or {}).get("email_age_at_action_seconds", {}).values()
+        handled = sum(age["count"] for age in ages)
+        window_handled, window_start = self._window
+        if handled < window_handled:  # restarted: counters start over
+            window_handled = 0
+        self._window = (handled, now)
+
+        if self.process is None:
+            state = "backoff"
+        elif self.stopping_since is not None:
+            state = "stopping"
+        else:
+            state = "running"
+        return {
+            "state": state,
+            "pid": self.process.pid if self.process is not None else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "handled": handled,
+            "per_minute": round((handled - window_handled) / max(now - window_start, 1e-9) * 60, 2),
+            "poll_lag_s": round(now - self.last_progress, 1) if self.process is not None else None,
+            "age_avg_s": round(sum(a["avg"] * a["count"] for a in ages) / handled, 1) if handled else None,
+            "age_p95_s": round(max(a["p95"] for a in ages), 1) if handled else None,
+        }
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()  # main turns SIGTERM into its normal shutdown (flush labels, checkpoint)
+
+    def wait(self, timeout: float = STOP_GRACE):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"⚠️ Mailbox '{self.name}' did not stop within {timeout}s, killing it")
+            self.process.kill()
+            self.process.wait()
+
+
+def log_report(workers, now: float):
+    for worker in workers:
+        logger.info(f"📮 Mailbox '{worker.name}': {worker.status(now)}")
+
+
+def stop_on_sigterm(signum, frame):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def main():
+    configs = load_mailbox_configs()
+    if not configs:
+        logger.error(f"❌ No mailboxes in {MAILBOXES_CONFIG}")
+        return
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    workers = [MailboxWorker(config) for config in configs]
+    logger.info(f"🧭 Supervising {len(workers)} mailbox(es): {[w.name for w in workers]}")
+
+    next_scrape = next_report = time.time() + SCRAPE_INTERVAL
+    try:
+        while True:
+            now = time.time()
+            for worker in workers:
+                worker.check(now)
+            if now >= next_scrape:
+                for worker in workers:
+                    worker.scrape(now)
+                next_scrape = now + SCRAPE_INTERVAL
+            if now >= next_report:
+                log_report(workers, now)
+                next_report = now + SUPERVISOR_REPORT_INTERVAL
+            time.sleep(CHECK_INTERVAL)
+    except KeyboardInterrupt:
+        logger.info("🛑 Supervisor stopping, waiting for the mailboxes to shut down...")
+    finally:
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.wait()
+        log_report(workers, time.time())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# benchmarks/fakes.py has the Gmail stand-in the tests drive the pipeline with
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from GmailAutomation.app_context import app  # noqa: E402
+from GmailAutomation.RetrivalPipeline.checkpoint import CheckpointStore  # noqa: E402
+
+
+@pytest.fixture
+def checkpoint_store(tmp_path):
+    """A fresh CheckpointStore in a temporary file, used as `app.checkpoint_store`."""
+    store = CheckpointStore(str(tmp_path / "checkpoint.db"))
+    app.override("checkpoint_store", store)
+    yield store
+    store.close()
+    app.reset("checkpoint_store")
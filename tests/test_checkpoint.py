@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+import pytest
+
+from fakes import FakeGmail
+from GmailAutomation.RetrivalPipeline import checkpoint, schedular
+from GmailAutomation.RetrivalPipeline.checkpoint import CheckpointStore
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    monkeypatch.setattr(schedular, "last_history_id", None)
+    # Only the message ids matter here, not the allowlist lookup parse_message does
+    monkeypatch.setattr(schedular, "parse_message", lambda full_msg, mailbox: {"id": full_msg["id"]})
+    return FakeGmail()
+
+
+def test_ledger_and_cursor_survive_a_restart(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    store = CheckpointStore(path)
+    store.mark_processed("m1", "support@example.com")
+    store.commit_cursor("support@example.com", "1234")
+    store.close()
+
+    reopened = CheckpointStore(path)
+    try:
+        assert reopened.is_processed("m1")
+        assert not reopened.is_processed("m2")
+        assert reopened.load_cursor("support@example.com") == "1234"
+    finally:
+        reopened.close()
+
+
+def test_replayed_history_skips_processed_messages(checkpoint_store, gmail, monkeypatch):
+    schedular.fetch_new_emails(gmail)
+    start = checkpoint_store.load_cursor(gmail.address)
+    first = gmail.deliver("client@example.com", "One", "First question")
+    second = gmail.deliver("client@example.com", "Two", "Second question")
+    assert [email["id"] for email in schedular.fetch_new_emails(gmail)] == [first, second]
+    checkpoint_store.mark_processed(first, gmail.address)
+
+    # A crash before the cursor commit: the same history is read again
+    monkeypatch.setattr(schedular, "last_history_id", None)
+    checkpoint_store.commit_cursor(gmail.address, start)
+    assert [email["id"] for email in schedular.fetch_new_emails(gmail)] == [second]
+
+
+def test_prune_drops_expired_entries(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    store = CheckpointStore(path)
+    store.mark_processed("old", wait=True)
+    store.mark_processed("new", wait=True)
+    expired = time.time() - (checkpoint.LEDGER_RETENTION_DAYS + 1) * 86400
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE processed SET processed_at=? WHERE message_id='old'", (expired,))
+    store._processed["old"] = expired
+
+    store.prune()
+    store.close()
+    assert not store.is_processed("old")
+    assert store.is_processed("new")
+    with sqlite3.connect(path) as conn:
+        assert [row[0] for row in conn.execute("SELECT message_id FROM processed")] == ["new"]
+
+
+def test_cursor_commit_writes_the_queued_ledger_rows(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    store = CheckpointStore(path)
+    try:
+        store.mark_processed("m1", "support@example.com")
+        store.commit_cursor("support@example.com", "1234")
+        with sqlite3.connect(path) as conn:
+            assert [row[0] for row in conn.execute("SELECT message_id FROM processed")] == ["m1"]
+    finally:
+        store.close()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from GmailAutomation.LLM.fast_path import MIN_SAMPLES, FastPath, load_rules
+
+SETTINGS = {"default_greeting": "Hi there", "assistant_name": "Ava", "formality_level": "medium"}
+
+
+def email(body, sender="client@example.com", **extra):
+    return {"Message_ID": "m1", "From": f"Anna Client <{sender}>", "Subject": "Login", "Body": body, **extra}
+
+
+def make_fast_path(mode="on", rules=None, **kwargs):
+    rules = rules or {"default": load_rules("")["default"], "clients": {}}
+    return FastPath(mode=mode, rules=rules, personality=lambda sender: SETTINGS, **kwargs)
+
+
+@pytest.mark.parametrize("body, category", [
+    ("Thanks, that fixed it!", "resolved"),
+    ("Thank you so much", "thanks"),
+    ("Got it, sounds good.", "acknowledged"),
+    ("Hi team, it's all good now. Thanks for your help!\nBest regards,\nAnna Client", "resolved"),
+])
+def test_trivial_emails_match_a_category(body, category):
+    response = make_fast_path().answer(email(body))
+    assert response["fast_path"] == category
+    assert response["escalate"] is False and response["reply_to"] is True
+    assert response["subject"] == "Re: Login"
+    assert response["response"].startswith("Hi there,") and response["response"].endswith("Ava")
+
+
+@pytest.mark.parametrize("body", [
+    "Thanks, but it is still broken",
+    "Thanks! Can I get a refund",
+    "Thanks, is it fixed now?",
+    "Thanks for the update, one more thing",
+    "Thanks " + "really " * 25,
+    "Hello there",
+    "",
+    "Thanks, I am locked out of my account",
+    "Thanks. The page keeps freezing",
+    "Great, the sync keeps crashing",
+    "Ok my account got hacked",
+    "Got it. Unfortunately the upload times out",
+])
+def test_anything_else_goes_to_the_llm(body):
+    assert make_fast_path().answer(email(body)) is None
+
+
+def test_attachments_and_important_mail_go_to_the_llm():
+    fast_path = make_fast_path()
+    assert fast_path.answer(email("Thanks!", attachment_data=[{"filename": "log.txt"}])) is None
+    assert fast_path.answer(email("Thanks!", is_important=True)) is None
+
+
+def test_per_client_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "default": {"categories": ["thanks"]},
+        "clients": {
+            "@strict.com": {"enabled": False},
+            "vip@example.com": {"templates": {"thanks": "Always a pleasure."}, "blockers": ["cheers"]},
+        },
+    }))
+    fast_path = make_fast_path(rules=load_rules(str(path)))
+    assert fast_path.answer(email("Thanks!", sender="someone@strict.com")) is None
+    assert fast_path.answer(email("Got it", sender="a@example.com")) is None  # category not enabled
+    assert "Always a pleasure." in fast_path.answer(email("Thanks!", sender="vip@example.com"))["response"]
+    assert fast_path.answer(email("Cheers, thanks", sender="vip@example.com")) is None
+
+
+def test_model_is_asked_only_when_the_rules_find_nothing():
+    fast_path = make_fast_path(model=lambda text: ("thanks", 0.95))
+    assert fast_path.answer(email("Much obliged"))["fast_path"] == "thanks"
+    assert make_fast_path(model=lambda text: ("thanks", 0.5)).answer(email("Much obliged")) is None
+
+
+def test_shadow_mode_never_answers():
+    fast_path = make_fast_path(mode="shadow", sample_rate=0.0)
+    response = fast_path.answer(email("Thanks!"))
+    assert fast_path.audit(response)
+    assert make_fast_path(sample_rate=0.0).audit(response) is False
+
+
+def test_llm_must_also_reply_in_the_thread_to_agree():
+    fast_path = make_fast_path(sample_rate=0.0)
+    response = fast_path.answer(email("Thanks!"))
+    fast_path.score(response, {"escalate": False, "reply_to": True})
+    fast_path.score(response, {"escalate": False, "reply_to": False, "to_email": "client@example.com"})
+    fast_path.score(response, {"escalate": True, "reply_to": True})
+    assert fast_path.accuracy() == round(1 / 3, 3)
+
+
+def test_low_accuracy_stops_answering_until_it_recovers():
+    fast_path = make_fast_path(sample_rate=0.0, min_accuracy=0.9)
+    response = fast_path.answer(email("Thanks!"))
+    for _ in range(MIN_SAMPLES):
+        fast_path.score(response, {"escalate": True, "reply_to": False})
+    assert fast_path.standing_down and fast_path.audit(response)
+
+    for _ in range(MIN_SAMPLES * 9):
+        fast_path.score(response, {"escalate": False, "reply_to": True})
+    assert not fast_path.standing_down and fast_path.audit(response) is False
@@ -0,0 +1,113 @@
+import pytest
+
+import main
+from fakes import FakeGmail
+from GmailAutomation.app_context import app
+from GmailAutomation.RetrivalPipeline import schedular
+from GmailAutomation.RetrivalPipeline.work_queue import WorkQueue
+
+
+class Services:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self):
+        return self.service
+
+
+@pytest.fixture
+def gmail(checkpoint_store, monkeypatch):
+    gmail = FakeGmail()
+    monkeypatch.setattr(schedular, "last_history_id", None)
+    monkeypatch.setattr(schedular, "parse_message", lambda full_msg, mailbox: {"id": full_msg["id"], "from": "c@example.com"})
+    monkeypatch.setattr(main, "gmail_services", Services(gmail))
+    monkeypatch.setattr(main, "thread_coalescer", None)
+    monkeypatch.setattr(main, "processing_pool", None)
+    monkeypatch.setattr(main, "CONTEXT_MODE", "tools")
+    monkeypatch.setattr(main.label_updater, "flush", lambda service=None: 0)
+    main.poll_once(main.run_cycle)  # initializes the cursor
+    return gmail
+
+
+def test_failed_cycle_is_logged_and_retried(gmail, checkpoint_store, monkeypatch):
+    first = gmail.deliver("c@example.com", "One", "First question")
+    second = gmail.deliver("c@example.com", "Two", "Second question")
+    handled, attempts = [], []
+
+    def handle_email(email):
+        attempts.append(email["id"])
+        if email["id"] == second and attempts.count(second) == 1:
+            raise RuntimeError("rate limited")
+        handled.append(email["id"])
+        checkpoint_store.mark_processed(email["id"])
+
+    monkeypatch.setattr(main, "handle_email", handle_email)
+    errors = main.POLL_ERRORS.value
+    assert main.poll_once(main.run_cycle) == 0
+    assert main.POLL_ERRORS.value == errors + 1
+    assert handled == [first]
+
+    # The page was not committed: the next poll fetches it again and skips what was handled
+    assert main.poll_once(main.run_cycle) == 1
+    assert handled == [first, second]
+    assert checkpoint_store.load_cursor(gmail.address) == str(gmail.history_id)
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    app.override("work_queue", queue)
+    yield queue
+    queue.close()
+    app.reset("work_queue")
+
+
+@pytest.fixture
+def labels(monkeypatch):
+    labels = {}
+    monkeypatch.setattr(main.label_updater, "mark_replied", lambda message_id: labels.update({message_id: "replied"}))
+    monkeypatch.setattr(main.label_updater, "mark_escalated", lambda message_id: labels.update({message_id: "escalated"}))
+    monkeypatch.setattr(main, "thread_coalescer", None)
+    return labels
+
+
+def answer(message_id, reply_to):
+    return {"Message_ID": message_id, "escalate": False, "reply_to": reply_to, "response": "Done.",
+            "subject": "Re: Invoice", "to_email": "c@example.com"}
+
+
+def queued_email(message_id):
+    return {"id": message_id, "emailAddress": "support@example.com", "threadId": f"t-{message_id}", "received_at": 1.0}
+
+
+def test_interrupted_direct_send_is_escalated(checkpoint_store, work_queue, labels, monkeypatch):
+    work_queue.begin_send("m1", "send")  # the previous attempt timed out before Gmail answered
+    sent = []
+    monkeypatch.setattr(main, "send_email", lambda **kwargs: sent.append(kwargs))
+
+    main.act_on_response(queued_email("m1"), {}, answer("m1", reply_to=False))
+    assert sent == []
+    assert labels == {"m1": "escalated"}
+    assert checkpoint_store.is_processed("m1")
+
+
+def test_interrupted_reply_found_in_the_thread_is_not_resent(checkpoint_store, work_queue, labels, monkeypatch):
+    work_queue.begin_send("m1", "reply")
+    monkeypatch.setattr(main, "reply_in_thread", lambda service, thread_id, since: True)
+    monkeypatch.setattr(main, "gmail_services", Services(None))
+    monkeypatch.setattr(main, "send_reply", lambda **kwargs: pytest.fail("sent twice"))
+
+    main.act_on_response(queued_email("m1"), {}, answer("m1", reply_to=True))
+    assert labels == {"m1": "replied"}
+    assert work_queue.send_marker("m1")["state"] == "sent"
+
+
+def test_interrupted_reply_missing_from_the_thread_is_resent(checkpoint_store, work_queue, labels, monkeypatch):
+    work_queue.begin_send("m1", "reply")
+    monkeypatch.setattr(main, "reply_in_thread", lambda service, thread_id, since: False)
+    monkeypatch.setattr(main, "gmail_services", Services(None))
+    monkeypatch.setattr(main, "send_reply", lambda **kwargs: "sent-1")
+
+    main.act_on_response(queued_email("m1"), {}, answer("m1", reply_to=True))
+    assert labels == {"m1": "replied"}
+    assert work_queue.send_marker("m1") == {"action": "reply", "state": "sent", "result": "sent-1"}
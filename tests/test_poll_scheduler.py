@@ -0,0 +1,28 @@
+from GmailAutomation.RetrivalPipeline.poll_scheduler import AdaptivePollScheduler
+
+
+def make_scheduler():
+    return AdaptivePollScheduler(base_interval=3.0, burst_interval=0.5, max_interval=60.0, quota=None)
+
+
+def test_idle_backoff_stays_under_the_ceiling():
+    scheduler = make_scheduler()
+    delays = [scheduler.record_cycle(0) for _ in range(2000)]  # well past 2 ** 1024
+    assert all(1.5 <= delay <= 60 for delay in delays)
+    assert delays[-1] >= 30
+    assert scheduler.decisions["idle"] == 2000
+
+
+def test_mail_resets_to_burst_polling():
+    scheduler = make_scheduler()
+    for _ in range(10):
+        scheduler.record_cycle(0)
+    assert scheduler.record_cycle(3) == 0.5
+    assert scheduler.record_cycle(0) <= 3
+
+
+def test_retry_after_wins():
+    scheduler = make_scheduler()
+    scheduler.note_rate_limited(42)
+    assert scheduler.record_cycle(5) == 42
+    assert scheduler.last_decision["reason"] == "rate_limited"
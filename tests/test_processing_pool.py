@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+import main
+from GmailAutomation.LLM.processing_pool import EmailProcessingPool
+
+
+async def answer(data):
+    await asyncio.sleep(0.01)
+    if data["Message_ID"] == "bad":
+        raise RuntimeError("agent run failed")
+    return {"Message_ID": data["Message_ID"]}
+
+
+@pytest.fixture
+def pool():
+    pool = EmailProcessingPool(max_concurrency=4, process=answer)
+    yield pool
+    pool.close()
+
+
+def test_failures_are_returned_in_order(pool):
+    results = pool.process_batch([{"Message_ID": m} for m in ("a", "bad", "c")])
+    assert [response and response["Message_ID"] for response, _ in results] == ["a", None, "c"]
+    assert isinstance(results[1][1], RuntimeError)
+    assert pool.stats()["failed"] == 1
+
+
+def test_handle_batch_acts_on_the_rest_then_raises(pool, monkeypatch):
+    acted = []
+    monkeypatch.setattr(main, "processing_pool", pool)
+    monkeypatch.setattr(main, "prepare_email", lambda email, extract=True: {"Message_ID": email["id"], "attachment_data": []})
+    monkeypatch.setattr(main, "act_on_response", lambda email, data, response: acted.append(response["Message_ID"]))
+
+    # The error reaches run_cycle, so the history page is not committed and "bad" is fetched again
+    with pytest.raises(RuntimeError):
+        main.handle_batch([{"id": m} for m in ("a", "bad", "c")])
+    assert acted == ["a", "c"]
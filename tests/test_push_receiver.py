@@ -0,0 +1,91 @@
+import base64
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from GmailAutomation.RetrivalPipeline.push_receiver import PushReceiver
+
+
+def push_body(notification) -> bytes:
+    data = base64.b64encode(json.dumps(notification).encode()).decode()
+    return json.dumps({"message": {"data": data}, "subscription": "projects/p/subscriptions/s"}).encode()
+
+
+def make_receiver(cursor=None, token="secret"):
+    return PushReceiver(host="127.0.0.1", port=0, path="/gmail/push", verification_token=token, cursor=cursor)
+
+
+def test_token_is_required():
+    receiver = make_receiver()
+    body = push_body({"emailAddress": "me@example.com", "historyId": 100})
+
+    assert receiver.handle_request("/gmail/push", body) == 403
+    assert receiver.handle_request("/gmail/push?token=wrong", body) == 403
+    assert receiver.handle_request("/elsewhere?token=secret", body) == 404
+    assert receiver.stats()["rejected"] == 2
+    assert not receiver.wait_for_change(0)
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b"[1, 2]",
+    b'"a string"',
+    b'{"message": "not a dict"}',
+    b'{"message": {"data": 42}}',
+    b'{"message": {"data": "!!!not base64"}}',
+    push_body([{"historyId": 100}]),
+    push_body({"emailAddress": "me@example.com"}),
+    push_body({"historyId": "abc"}),
+    push_body({"historyId": -5}),
+])
+def test_malformed_payload_is_a_bad_request(body):
+    receiver = make_receiver()
+
+    assert receiver.handle_request("/gmail/push?token=secret", body) == 400
+    assert receiver.stats()["rejected"] == 1
+    assert receiver.stats()["received"] == 0
+    assert not receiver.wait_for_change(0)
+
+
+def test_only_newer_history_triggers_a_fetch():
+    receiver = make_receiver(cursor=lambda: "100")
+    path = "/gmail/push?token=secret"
+
+    assert receiver.handle_request(path, push_body({"historyId": 90})) == 204
+    assert not receiver.wait_for_change(0)
+
+    assert receiver.handle_request(path, push_body({"historyId": "120"})) == 204
+    assert receiver.wait_for_change(0)
+
+    assert receiver.handle_request(path, push_body({"historyId": 120})) == 204  # redelivery
+    assert not receiver.wait_for_change(0)
+    assert receiver.stats() | {"fallback_polls": None} == {
+        "received": 3, "triggers": 1, "stale": 2, "rejected": 0, "fallback_polls": None, "latest_history_id": 120,
+    }
+
+
+def test_http_status_codes():
+    receiver = make_receiver()
+    receiver.start()
+    url = f"http://127.0.0.1:{receiver.port}/gmail/push?token=secret"
+
+    def post(body):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    try:
+        assert post(b"[]") == 400
+        assert post(push_body({"historyId": 7})) == 204
+        assert receiver.wait_for_change(1)
+    finally:
+        receiver.stop()
+
+
+def test_refuses_to_listen_publicly_without_a_token():
+    with pytest.raises(ValueError):
+        PushReceiver(host="0.0.0.0", port=0, verification_token=None).start()
@@ -0,0 +1,54 @@
+from GmailAutomation.LLM.response_cache import ResponseCache
+
+QUESTION = "Hi, could you tell me when the next invoice for our monthly support plan will be sent out?"
+
+
+def email(message_id, body=QUESTION, sender="client@example.com", **extra):
+    return {"Message_ID": message_id, "From": sender, "Subject": "Invoice", "Body": body, **extra}
+
+
+def reply(message_id):
+    return {"Message_ID": message_id, "response": "It goes out on the 1st.", "escalate": False, "reply_to": True}
+
+
+def make_cache(**kwargs):
+    return ResponseCache(personality=lambda sender: {"assistant_name": "Ava"}, **kwargs)
+
+
+def test_exact_duplicate_is_retargeted():
+    cache = make_cache()
+    cache.store(email("m1"), reply("m1"))
+    hit = cache.lookup(email("m2", body=QUESTION.upper() + "  "))
+    assert hit["Message_ID"] == "m2"
+    assert hit["subject"] == "Re: Invoice"
+    assert hit["response"] == "It goes out on the 1st."
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_near_duplicate_hits_and_different_text_misses():
+    cache = make_cache()
+    cache.store(email("m1"), reply("m1"))
+    assert cache.lookup(email("m2", body=QUESTION.replace("Hi,", "Hello,"))) is not None
+    assert cache.lookup(email("m3", body="Our login page shows an error since this morning, can you take a look?")) is None
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_scoped_by_sender_and_bypassed_with_attachments():
+    cache = make_cache()
+    cache.store(email("m1"), reply("m1"))
+    assert cache.lookup(email("m2", sender="other@example.com")) is None
+    assert cache.lookup(email("m3", attachment_data=[{"filename": "invoice.pdf"}])) is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_short_bodies_only_match_exactly():
+    cache = make_cache()
+    cache.store(email("m1", body="thanks"), reply("m1"))
+    assert cache.lookup(email("m2", body="no thanks")) is None
+
+
+def test_expired_entries_are_not_used():
+    cache = make_cache(ttl=0)
+    cache.store(email("m1"), reply("m1"))
+    assert cache.lookup(email("m2")) is None
+    assert cache.stats()["expirations"] == 1
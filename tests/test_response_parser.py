@@ -0,0 +1,60 @@
+import pytest
+
+from GmailAutomation.LLM.response_parser import ResponseParseError, decode, parse_agent_response
+
+EMAIL = {"Message_ID": "m1", "From": "client@example.com", "Subject": "Login", "Body": "I cannot log in."}
+CLEAN = (
+    '{"Message_ID": "m1", "query": "I cannot log in.", "escalate": false, "priority": "", '
+    '"escalation_reason": "", "response": "Please reset your password.", "subject": "Re: Login", '
+    '"to_email": "client@example.com", "reply_to": true}'
+)
+
+
+@pytest.mark.parametrize("text", [CLEAN, "```json\n" + CLEAN + "\n```"])
+def test_clean_json_is_not_repaired(text):
+    data, repaired = decode(text)
+    assert data["reply_to"] is True
+    assert not repaired
+
+
+@pytest.mark.parametrize("text", [
+    "Here is my answer: " + CLEAN,
+    CLEAN[:-1] + ",}",
+    CLEAN.replace("false", "False").replace("true", "True"),
+    CLEAN.replace('"escalate"', "escalate"),
+    CLEAN.replace(', "escalate"', ',escalate"'),
+    CLEAN.replace("reset your password.", "reset your\npassword."),
+    "{'Message_ID': 'm1', 'escalate': False, 'response': 'Please reset your password.', 'reply_to': True}",
+])
+def test_common_mistakes_are_repaired(text):
+    data, repaired = decode(text)
+    assert repaired
+    assert data["escalate"] is False
+    assert data["response"].split() == ["Please", "reset", "your", "password."]
+
+
+def test_literals_inside_strings_survive_repair():
+    data, _ = decode('{"response": "Set debug to True, or None of it works", "escalate": False,}')
+    assert data == {"response": "Set debug to True, or None of it works", "escalate": False}
+
+
+def test_missing_fields_come_from_the_email():
+    response = parse_agent_response(
+        '{"escalate": "no", "response": "Please reset your password.", "reply_to": "yes"}', EMAIL
+    )
+    assert response["Message_ID"] == "m1"
+    assert response["to_email"] == "client@example.com"
+    assert response["escalate"] is False and response["reply_to"] is True
+
+
+def test_invalid_output_lists_every_problem():
+    with pytest.raises(ResponseParseError) as error:
+        parse_agent_response('{"escalate": "maybe", "response": "", "reply_to": "maybe"}', EMAIL)
+    assert len(error.value.errors) == 2
+
+    with pytest.raises(ResponseParseError) as error:
+        parse_agent_response('{"escalate": true, "priority": "soon", "response": "", "reply_to": false}', EMAIL)
+    assert error.value.errors == ["'priority' must be one of high/medium/low, got 'soon'"]
+
+    with pytest.raises(ResponseParseError):
+        parse_agent_response("I could not decide.", EMAIL)
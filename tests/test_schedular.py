@@ -0,0 +1,89 @@
+import pytest
+
+from fakes import FakeGmail, http_error
+from GmailAutomation.RetrivalPipeline import schedular
+
+
+class FlakyGmail(FakeGmail):
+    """A mailbox whose messages.get fails with `status` for the given message ids."""
+
+    def __init__(self, status: int):
+        super().__init__()
+        self.status = status
+        self.broken = set()
+
+    def get_message(self, msg_id, format):
+        if msg_id in self.broken:
+            raise http_error(self.status)
+        return super().get_message(msg_id, format)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cursor(monkeypatch):
+    monkeypatch.setattr(schedular, "last_history_id", None)
+    monkeypatch.setattr(schedular, "_fetch_failures", {})
+
+
+def test_failed_fetch_keeps_the_cursor(checkpoint_store):
+    gmail = FlakyGmail(500)
+    assert schedular.fetch_new_emails(gmail) == []  # first poll only initializes the cursor
+    cursor = checkpoint_store.load_cursor(gmail.address)
+
+    gmail.broken.add(gmail.deliver("client@example.com", "Question", "Where is my invoice?"))
+    assert schedular.fetch_new_emails(gmail) == []
+    assert checkpoint_store.load_cursor(gmail.address) == cursor
+
+
+def test_failed_retry_is_raised():
+    gmail = FlakyGmail(500)
+    gmail.broken.add(gmail.deliver("client@example.com", "Question", "Where is my invoice?"))
+    with pytest.raises(schedular.HttpError):
+        schedular.fetch_messages_batched(gmail, list(gmail.messages))
+
+
+def test_deleted_message_is_skipped(checkpoint_store):
+    gmail = FlakyGmail(404)
+    schedular.fetch_new_emails(gmail)
+
+    gmail.broken.add(gmail.deliver("client@example.com", "Question", "Where is my invoice?"))
+    assert schedular.fetch_new_emails(gmail) == []
+    assert checkpoint_store.load_cursor(gmail.address) == str(gmail.history_id)
+
+
+def test_unfetchable_message_is_skipped_after_repeated_polls(checkpoint_store, monkeypatch):
+    monkeypatch.setattr(schedular, "parse_message", lambda full_msg, mailbox: {"id": full_msg["id"]})
+    monkeypatch.setattr(schedular, "FETCH_GIVE_UP_AFTER", 0)
+    gmail = FlakyGmail(400)
+    schedular.fetch_new_emails(gmail)
+    cursor = checkpoint_store.load_cursor(gmail.address)
+
+    gmail.broken.add(gmail.deliver("client@example.com", "Broken", "Unreadable"))
+    healthy = gmail.deliver("client@example.com", "Question", "Where is my invoice?")
+    for _ in range(schedular.MAX_FETCH_FAILURES - 1):
+        assert schedular.fetch_new_emails(gmail) == []
+        assert checkpoint_store.load_cursor(gmail.address) == cursor
+
+    assert [email["id"] for email in schedular.fetch_new_emails(gmail)] == [healthy]
+    assert checkpoint_store.load_cursor(gmail.address) == str(gmail.history_id)
+    assert schedular._fetch_failures == {}
+
+
+def test_failures_within_the_give_up_window_keep_blocking(checkpoint_store):
+    gmail = FlakyGmail(500)
+    schedular.fetch_new_emails(gmail)
+    cursor = checkpoint_store.load_cursor(gmail.address)
+
+    gmail.broken.add(gmail.deliver("client@example.com", "Question", "Where is my invoice?"))
+    for _ in range(schedular.MAX_FETCH_FAILURES * 2):
+        schedular.fetch_new_emails(gmail)
+    assert checkpoint_store.load_cursor(gmail.address) == cursor
+
+
+def test_rate_limits_do_not_count_towards_skipping(monkeypatch):
+    monkeypatch.setattr(schedular, "FETCH_GIVE_UP_AFTER", 0)
+    gmail = FlakyGmail(429)
+    gmail.broken.add(gmail.deliver("client@example.com", "Question", "Where is my invoice?"))
+    for _ in range(schedular.MAX_FETCH_FAILURES + 1):
+        with pytest.raises(schedular.HttpError):
+            schedular.fetch_messages_batched(gmail, list(gmail.messages))
+    assert schedular._fetch_failures == {}
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from GmailAutomation.RetrivalPipeline import work_queue
+from GmailAutomation.RetrivalPipeline.work_queue import WorkQueue
+
+
+def emails(*ids):
+    return [{"id": message_id, "emailAddress": "support@example.com", "threadId": f"t-{message_id}"} for message_id in ids]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "WORK_QUEUE_RETRY_DELAY", 0)
+    queue = WorkQueue(str(tmp_path / "queue.db"), visibility_timeout=0.2, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def leased_ids(queue):
+    return [item["email"]["id"] for item in queue.lease()]
+
+
+def test_duplicates_are_ignored(queue):
+    assert queue.enqueue(emails("m1", "m2")) == 2
+    assert queue.enqueue(emails("m2", "m3")) == 1
+    assert queue.counts() == {"ready": 3, "leased": 0, "dead": 0}
+
+
+def test_expired_lease_is_handed_out_again(queue):
+    queue.enqueue(emails("m1"))
+    assert leased_ids(queue) == ["m1"]
+    assert leased_ids(queue) == []  # hidden while leased
+    time.sleep(0.25)
+    assert [item["attempt"] for item in queue.lease()] == [2]
+
+
+def test_acked_item_is_gone(queue):
+    queue.enqueue(emails("m1"))
+    queue.lease()
+    queue.ack("m1")
+    time.sleep(0.25)
+    assert leased_ids(queue) == []
+    assert queue.backlog() == 0
+
+
+def test_failed_item_is_retried_then_dead_lettered(queue):
+    queue.enqueue(emails("m1"))
+    queue.lease()
+    queue.fail("m1", RuntimeError("agent down"))
+    assert queue.counts()["ready"] == 1
+
+    assert leased_ids(queue) == ["m1"]
+    queue.fail("m1", RuntimeError("agent down"))
+    assert leased_ids(queue) == []
+    assert queue.dead_letters() == [{"message_id": "m1", "attempts": 2, "last_error": "RuntimeError: agent down"}]
+
+    assert queue.requeue_dead() == 1
+    assert [item["attempt"] for item in queue.lease()] == [1]
+
+
+def test_siblings_waiting_out_a_retry_are_not_leased(queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "WORK_QUEUE_RETRY_DELAY", 60)
+    thread = [dict(email, threadId="t-1") for email in emails("m1", "m2")]
+    queue.enqueue(thread[:1])
+    queue.lease()
+    queue.fail("m1", RuntimeError("agent down"))
+
+    queue.enqueue(thread[1:])
+    assert leased_ids(queue) == ["m2"]
+
+
+def test_reopening_releases_leases(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(path)
+    queue.enqueue(emails("m1"))
+    queue.lease()
+    queue.close()
+
+    reopened = WorkQueue(path)
+    try:
+        assert leased_ids(reopened) == ["m1"]
+    finally:
+        reopened.close()
+
+
+def test_send_markers(queue):
+    assert queue.send_marker("m1") is None
+    queue.begin_send("m1", "reply")
+    assert queue.send_marker("m1") == {"action": "reply", "state": "pending", "result": None}
+    queue.complete_send("m1", "sent-1")
+    assert queue.send_marker("m1")["state"] == "sent"